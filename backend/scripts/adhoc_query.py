@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Ad-hoc Query Warehouse
+An embedded DuckDB file holding the normalized invoice lines (`sales`) and
+daily store footfall (`footfall`) replayed from the packed report archive
+(see rebuild.py), so analysts can answer new questions in SQL on a columnar,
+vectorized engine without adding Mongo pipelines or touching the live store.
+
+Building packs newly archived reports and replays them with the same
+last-file-wins rules as a rebuild. The warehouse records which reports it
+holds and which report owns each invoice or store-day, so a build only reads
+reports it has not seen yet (a no-op when there are none) and replaces just
+the keys they win. Changes go into a copy, `<path>.building`, renamed over
+the warehouse when complete, so queries keep reading the previous file; a
+lock file serializes concurrent builds. Consumer names and mobile numbers are
+not copied.
+
+Queries run on a read-only connection with file system access disabled and
+locked, must be a single SELECT, take named parameters ($start_date, ...),
+return at most QUERY_MAX_ROWS rows (flagged as truncated beyond that) and are
+interrupted after QUERY_TIMEOUT_S seconds. SAVED_QUERIES reproduces the
+analytics views.
+
+Requires: duckdb, pyarrow (zstandard, pymongo via rebuild.py for --build)
+
+Configuration (environment):
+    QUERY_WAREHOUSE_PATH      DuckDB file (default <REBUILD_PACK_DIR>/warehouse.duckdb)
+    QUERY_MAX_ROWS            10000 (hard cap; requests may ask for fewer)
+    QUERY_TIMEOUT_S           30 (hard cap; requests may ask for less)
+    QUERY_THREADS             DuckDB threads per query (default: DuckDB's)
+    QUERY_MEMORY_LIMIT        DuckDB memory limit, e.g. 2GB
+
+Usage:
+    python adhoc_query.py --build
+    python adhoc_query.py --saved store_performance --param start_date=2026-01-01 --param end_date=2026-01-31
+    python adhoc_query.py --sql "SELECT brand_name, SUM(nett_invoice_value) FROM sales GROUP BY 1"
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_ARCHIVE_DIR = os.environ.get("DATA_ARCHIVE_DIR", os.path.join(BASE_DIR, "data_archive"))
+PACK_DIR = os.environ.get("REBUILD_PACK_DIR", os.path.join(DATA_ARCHIVE_DIR, "packed"))
+WAREHOUSE_PATH = os.environ.get("QUERY_WAREHOUSE_PATH", os.path.join(PACK_DIR, "warehouse.duckdb"))
+MAX_ROWS = int(os.environ.get("QUERY_MAX_ROWS", "10000"))
+TIMEOUT_S = float(os.environ.get("QUERY_TIMEOUT_S", "30"))
+THREADS = int(os.environ.get("QUERY_THREADS", "0"))
+MEMORY_LIMIT = os.environ.get("QUERY_MEMORY_LIMIT", "")
+
+SALES_COLUMNS = (
+    ("invoice_no", "VARCHAR"), ("invoice_date", "DATE"), ("invoice_month", "VARCHAR"),
+    ("invoice_time", "VARCHAR"), ("invoice_hour", "INTEGER"), ("transaction_type", "VARCHAR"),
+    ("order_channel_code", "VARCHAR"), ("order_channel_name", "VARCHAR"),
+    ("invoice_channel_code", "VARCHAR"), ("invoice_channel_name", "VARCHAR"),
+    ("sub_channel_code", "VARCHAR"), ("sub_channel_name", "VARCHAR"),
+    ("location_code", "VARCHAR"), ("location_name", "VARCHAR"), ("store_type", "VARCHAR"),
+    ("city", "VARCHAR"), ("state", "VARCHAR"), ("total_sales_qty", "INTEGER"), ("unit_mrp", "DOUBLE"),
+    ("invoice_mrp_value", "DOUBLE"), ("invoice_discount_value", "DOUBLE"), ("invoice_discount_pct", "DOUBLE"),
+    ("invoice_basic_value", "DOUBLE"), ("total_tax_pct", "DOUBLE"), ("total_tax_amt", "DOUBLE"),
+    ("nett_invoice_value", "DOUBLE"), ("sales_person_code", "VARCHAR"), ("sales_person_name", "VARCHAR"),
+    ("consumer_code", "VARCHAR"), ("product_code", "VARCHAR"), ("product_name", "VARCHAR"),
+    ("category_name", "VARCHAR"), ("brand_name", "VARCHAR"), ("mh1_description", "VARCHAR"),
+)
+FOOTFALL_COLUMNS = (("date", "DATE"), ("location_name", "VARCHAR"), ("footfall_count", "INTEGER"))
+TABLES = {"invoice": ("sales", SALES_COLUMNS), "footfall": ("footfall", FOOTFALL_COLUMNS)}
+
+# Same bill definition as the dashboard TRX counts (daily_rollup.is_sales_bill)
+SALES_BILL = "transaction_type IN ('IV', 'IR') AND mh1_description = 'Sales'"
+IN_RANGE = "invoice_date BETWEEN $start_date AND $end_date"
+RANGE_PARAMS = {"start_date": None, "end_date": None}
+
+SAVED_QUERIES = {
+    "daily_trend": {
+        "description": "Net sales per day (/api/analytics/trends)",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            SELECT invoice_date AS date, SUM(nett_invoice_value) AS sales
+            FROM sales WHERE {IN_RANGE}
+            GROUP BY 1 ORDER BY 1""",
+    },
+    "hourly": {
+        "description": "Bills and net sales per hour of day (/api/analytics/hourly)",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            SELECT lpad(CAST(invoice_hour AS VARCHAR), 2, '0') AS hour,
+                   COUNT(DISTINCT invoice_no) AS trx_count, SUM(nett_invoice_value) AS total_sales
+            FROM sales WHERE {IN_RANGE} AND {SALES_BILL} AND invoice_hour IS NOT NULL
+            GROUP BY 1 ORDER BY 1""",
+    },
+    "summary": {
+        "description": "Net sales, bills, ATV and UPT (/api/analytics/summary)",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            WITH totals AS (
+                SELECT SUM(nett_invoice_value) AS total_sales,
+                       COUNT(DISTINCT invoice_no) FILTER (WHERE {SALES_BILL}) AS total_trx,
+                       SUM(total_sales_qty) FILTER (WHERE {SALES_BILL}) AS total_units
+                FROM sales WHERE {IN_RANGE}
+            )
+            SELECT COALESCE(total_sales, 0) AS total_sales, total_trx,
+                   CASE WHEN total_trx > 0 THEN round(total_sales / total_trx) ELSE 0 END AS atv,
+                   CASE WHEN total_trx > 0 THEN round(total_units / total_trx, 2) ELSE 0 END AS upt
+            FROM totals""",
+    },
+    "channel_split": {
+        "description": "Net sales per order channel (/api/analytics/channel-split)",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            SELECT COALESCE(NULLIF(order_channel_name, ''), 'Unknown') AS name, SUM(nett_invoice_value) AS value
+            FROM sales WHERE {IN_RANGE}
+            GROUP BY 1 ORDER BY value DESC""",
+    },
+    "store_performance": {
+        "description": "Net sales and bills per store (/api/analytics/store-performance)",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            SELECT location_name AS name, SUM(nett_invoice_value) AS sales,
+                   COUNT(DISTINCT invoice_no) FILTER (WHERE {SALES_BILL}) AS trx
+            FROM sales WHERE {IN_RANGE}
+            GROUP BY 1 ORDER BY sales DESC""",
+    },
+    "top_products": {
+        "description": "Best selling SKUs by net sales (/api/analytics/top-products)",
+        "params": {**RANGE_PARAMS, "n": 10},
+        "sql": f"""
+            SELECT product_code, any_value(product_name) AS product_name, any_value(category_name) AS category_name,
+                   CAST(SUM(total_sales_qty) AS BIGINT) AS qty, SUM(nett_invoice_value) AS value
+            FROM sales WHERE {IN_RANGE} AND {SALES_BILL} AND product_code <> ''
+            GROUP BY 1 ORDER BY value DESC, product_code LIMIT $n""",
+    },
+    "discount_by_category": {
+        "description": "Discount % of MRP per category",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            SELECT category_name, SUM(invoice_mrp_value) AS mrp_value, SUM(invoice_discount_value) AS discount_value,
+                   round(100 * SUM(invoice_discount_value) / NULLIF(SUM(invoice_mrp_value), 0), 2) AS discount_pct
+            FROM sales WHERE {IN_RANGE} AND {SALES_BILL}
+            GROUP BY 1 ORDER BY discount_pct DESC NULLS LAST""",
+    },
+    "whatsapp_share": {
+        "description": "Share of net sales from WhatsApp bills per store (WhatsApp sales breakdown)",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            WITH bills AS (
+                SELECT location_name, invoice_no, SUM(nett_invoice_value) AS value,
+                       bool_or(sales_person_name ILIKE '%whatsapp%') AS is_whatsapp
+                FROM sales WHERE {IN_RANGE}
+                GROUP BY 1, 2
+            )
+            SELECT location_name, SUM(value) FILTER (WHERE is_whatsapp) AS whatsapp_sales, SUM(value) AS sales,
+                   round(100 * SUM(value) FILTER (WHERE is_whatsapp) / NULLIF(SUM(value), 0), 2) AS whatsapp_pct
+            FROM bills GROUP BY 1 ORDER BY whatsapp_pct DESC NULLS LAST""",
+    },
+    "salesperson_share": {
+        "description": "Each sales person's share of their store's net sales",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            SELECT location_name, sales_person_name, SUM(nett_invoice_value) AS sales,
+                   round(100 * SUM(nett_invoice_value)
+                         / NULLIF(SUM(SUM(nett_invoice_value)) OVER (PARTITION BY location_name), 0), 2) AS share_pct
+            FROM sales WHERE {IN_RANGE}
+            GROUP BY 1, 2 ORDER BY location_name, sales DESC""",
+    },
+    "footfall_conversion": {
+        "description": "Footfall, bills and conversion % per store",
+        "params": RANGE_PARAMS,
+        "sql": f"""
+            WITH bills AS (
+                SELECT location_name, COUNT(DISTINCT invoice_no) AS trx
+                FROM sales WHERE {IN_RANGE} AND {SALES_BILL} GROUP BY 1
+            ), visits AS (
+                SELECT location_name, CAST(SUM(footfall_count) AS BIGINT) AS footfall
+                FROM footfall WHERE date BETWEEN $start_date AND $end_date GROUP BY 1
+            )
+            SELECT location_name, COALESCE(footfall, 0) AS footfall, COALESCE(trx, 0) AS trx,
+                   round(100 * trx / NULLIF(footfall, 0), 2) AS conversion_pct
+            FROM visits FULL OUTER JOIN bills USING (location_name)
+            ORDER BY location_name""",
+    },
+}
+
+
+class QueryError(ValueError):
+    """Rejected or failed query (bad SQL, parameters or limits)"""
+
+
+class QueryTimeout(QueryError):
+    pass
+
+
+# --- Build -------------------------------------------------------------------
+
+def arrow_batch(docs: list, columns: tuple):
+    import pyarrow as pa
+
+    types = {"VARCHAR": pa.string(), "DATE": pa.string(), "INTEGER": pa.int32(), "DOUBLE": pa.float64()}
+    return pa.table({name: pa.array([d.get(name) for d in docs], types[sql_type]) for name, sql_type in columns})
+
+
+# Bookkeeping for incremental builds: the reports replayed so far and the report owning each key
+OWNER_COLUMNS = (("kind", "VARCHAR"), ("key", "VARCHAR"), ("report_time", "VARCHAR"), ("name", "VARCHAR"))
+REPORT_COLUMNS = (("sha256", "VARCHAR"), ("name", "VARCHAR"), ("report_time", "VARCHAR"), ("kind", "VARCHAR"))
+
+
+@contextmanager
+def build_lock(path: str):
+    """Serializes builds of one warehouse across processes (scheduled, upload-triggered, manual)"""
+    import fcntl
+
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def replayed_reports(path: str):
+    """sha256 of every report in the warehouse at `path`, or None when it has to be built from scratch"""
+    import duckdb
+
+    if not os.path.exists(path):
+        return None
+    con = duckdb.connect(path, read_only=True)
+    try:
+        return {sha for (sha,) in con.execute("SELECT sha256 FROM _reports").fetchall()}
+    except duckdb.CatalogException:
+        return None  # built before reports were tracked
+    finally:
+        con.close()
+
+
+def create_tables(con):
+    for table, columns in (*TABLES.values(), ("_owners", OWNER_COLUMNS), ("_reports", REPORT_COLUMNS)):
+        con.execute(f"CREATE TABLE {table} ({', '.join(f'{n} {t}' for n, t in columns)})")
+
+
+def claim_keys(con, entries: list, owned: list) -> list:
+    """
+    Narrows each new report's keys to those it wins against the reports
+    already in the warehouse (a later report_time, then name, wins), removes
+    the rows it replaces and records it as the owner
+    """
+    import pyarrow as pa
+
+    claims = [(entry["kind"], key, entry["report_time"], entry["name"])
+              for entry, keys in zip(entries, owned) for key in keys
+              if key or entry["kind"] != "invoice"]  # number-less invoice lines are never replaced
+    con.register("claims", pa.table({name: pa.array([c[i] for c in claims], pa.string())
+                                     for i, (name, _) in enumerate(OWNER_COLUMNS)}))
+    con.execute("""
+        CREATE TEMP TABLE winners AS
+        SELECT c.* FROM claims c LEFT JOIN _owners o USING (kind, key)
+        WHERE o.key IS NULL OR (o.report_time, o.name) < (c.report_time, c.name)""")
+    con.unregister("claims")
+
+    con.execute("DELETE FROM sales WHERE invoice_no IN (SELECT key FROM winners WHERE kind = 'invoice')")
+    con.execute("""
+        DELETE FROM footfall WHERE strftime(date, '%Y-%m-%d') || '|' || location_name
+            IN (SELECT key FROM winners WHERE kind = 'footfall')""")
+    con.execute("DELETE FROM _owners WHERE (kind, key) IN (SELECT (kind, key) FROM winners)")
+    con.execute("INSERT INTO _owners SELECT * FROM winners")
+
+    won = {}
+    for kind, key, _, name in con.execute("SELECT kind, key, report_time, name FROM winners").fetchall():
+        won.setdefault((kind, name), set()).add(key)
+    con.execute("DROP TABLE winners")
+    return [won.get((entry["kind"], entry["name"]), set()) for entry in entries]
+
+
+def build_warehouse(pack_dir: str = PACK_DIR, path: str = WAREHOUSE_PATH, workers: int = None) -> dict:
+    """
+    Brings the warehouse up to date with the packed archive: only reports it
+    has not replayed yet are read, into a copy that is then swapped in; it is
+    rebuilt from scratch when reports were removed from the archive
+    """
+    import duckdb
+    import rebuild
+
+    started = time.monotonic()
+    ordered = rebuild.replay_order(rebuild.load_manifest(pack_dir))
+    if not ordered:
+        raise ValueError(f"No packed invoice or footfall reports in {pack_dir}, run rebuild --pack first")
+    workers = workers or rebuild.WORKERS
+
+    with build_lock(path):
+        replayed = replayed_reports(path)
+        if replayed is not None and not replayed <= {entry["sha256"] for entry in ordered}:
+            replayed = None
+        new = [entry for entry in ordered if replayed is None or entry["sha256"] not in replayed]
+
+        building = path + ".building"
+        for stale in (building, building + ".wal"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        if new and replayed is not None:
+            shutil.copyfile(path, building)
+
+        if new:
+            keys = rebuild.run_parallel(rebuild.scan_keys, [(entry, pack_dir) for entry in new], workers)
+            con = duckdb.connect(building)
+            try:
+                if replayed is None:
+                    create_tables(con)
+                owned = claim_keys(con, new, rebuild.assign_owners(new, keys))
+                for entry, entry_keys in zip(new, owned):
+                    table, columns = TABLES[entry["kind"]]
+                    docs = rebuild.owned_rows(entry, entry_keys, pack_dir)
+                    if docs:
+                        con.register("batch", arrow_batch(docs, columns))
+                        con.execute(f"INSERT INTO {table} SELECT * FROM batch")
+                        con.unregister("batch")
+                    con.execute("INSERT INTO _reports VALUES (?, ?, ?, ?)",
+                                [entry["sha256"], entry["name"], entry["report_time"], entry["kind"]])
+                con.execute("CHECKPOINT")
+            finally:
+                con.close()
+            os.replace(building, path)
+
+        con = duckdb.connect(path, read_only=True)
+        try:
+            sales_rows, footfall_rows = con.execute(
+                "SELECT (SELECT count(*) FROM sales), (SELECT count(*) FROM footfall)").fetchone()
+        finally:
+            con.close()
+
+    summary = {"path": path, "files": len(ordered), "new_files": len(new), "full": replayed is None,
+               "sales_rows": sales_rows, "footfall_rows": footfall_rows,
+               "seconds": round(time.monotonic() - started, 1)}
+    if new:
+        logger.info(f"Warehouse {'built' if replayed is None else 'updated'} from {len(new)} reports: "
+                    f"{sales_rows} sales lines")
+    else:
+        logger.info("Warehouse already holds every packed report")
+    return summary
+
+
+def refresh_warehouse(workers: int = None) -> dict:
+    """Packs newly archived reports (as `rebuild --pack`), then brings the warehouse up to date"""
+    import rebuild
+
+    workers = workers or rebuild.WORKERS
+    rebuild.pack(rebuild.DATA_ARCHIVE_DIR, PACK_DIR, workers)
+    return build_warehouse(PACK_DIR, workers=workers)
+
+
+# --- Query -------------------------------------------------------------------
+
+def resolve(sql: str = None, saved: str = None, params: dict = None):
+    """(sql, params) for an ad-hoc statement or a saved query with its defaults filled in"""
+    if bool(sql) == bool(saved):
+        raise QueryError("Give exactly one of sql or saved")
+    if sql:
+        return sql, dict(params or {})
+
+    if saved not in SAVED_QUERIES:
+        raise QueryError(f"Unknown saved query: {saved}")
+    query = SAVED_QUERIES[saved]
+    unknown = set(params or {}) - set(query["params"])
+    if unknown:
+        raise QueryError(f"Unknown parameters for {saved}: {', '.join(sorted(unknown))}")
+    values = {**query["params"], **(params or {})}
+    missing = [name for name, value in values.items() if value is None]
+    if missing:
+        raise QueryError(f"Missing parameters for {saved}: {', '.join(missing)}")
+    return query["sql"], values
+
+
+def connect(path: str = WAREHOUSE_PATH):
+    import duckdb
+
+    if not os.path.exists(path):
+        raise QueryError(f"No warehouse at {path}, run the build first")
+    config = {"enable_external_access": False, "lock_configuration": True}
+    if THREADS:
+        config["threads"] = THREADS
+    if MEMORY_LIMIT:
+        config["memory_limit"] = MEMORY_LIMIT
+    return duckdb.connect(path, read_only=True, config=config)
+
+
+def run_query(sql: str = None, saved: str = None, params: dict = None, max_rows: int = MAX_ROWS,
+              timeout: float = TIMEOUT_S, path: str = WAREHOUSE_PATH) -> dict:
+    """
+    Runs one SELECT and returns {"table": pyarrow.Table, "truncated", "seconds"}.
+    `max_rows` and `timeout` are capped at QUERY_MAX_ROWS / QUERY_TIMEOUT_S.
+    """
+    import duckdb
+
+    sql, params = resolve(sql, saved, params)
+    max_rows = max(1, min(int(max_rows or MAX_ROWS), MAX_ROWS))
+    timeout = max(0.1, min(float(timeout or TIMEOUT_S), TIMEOUT_S))
+
+    con = connect(path)
+    timer = threading.Timer(timeout, con.interrupt)
+    started = time.monotonic()
+    try:
+        try:
+            statements = con.extract_statements(sql)
+        except duckdb.Error as e:
+            raise QueryError(str(e)) from e
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise QueryError("Only a single SELECT statement is allowed")
+        statement = statements[0].query.strip().rstrip(";")
+
+        # One row past the limit tells a truncated result from one that fits exactly
+        timer.start()
+        result = con.execute(f"SELECT * FROM (\n{statement}\n) AS adhoc LIMIT {max_rows + 1}", params)
+        table = result.to_arrow_table() if hasattr(result, "to_arrow_table") else result.fetch_arrow_table()
+    except duckdb.InterruptException as e:
+        raise QueryTimeout(f"Query exceeded {timeout:g}s") from e
+    except duckdb.Error as e:
+        raise QueryError(str(e)) from e
+    finally:
+        timer.cancel()
+        con.close()
+
+    truncated = table.num_rows > max_rows
+    return {"table": table.slice(0, max_rows), "truncated": truncated,
+            "seconds": round(time.monotonic() - started, 3)}
+
+
+def to_json(result: dict) -> dict:
+    table = result["table"]
+    columns = [{"name": field.name, "type": str(field.type)} for field in table.schema]
+    data = table.to_pydict()
+    rows = [list(row) for row in zip(*(data[c["name"]] for c in columns))]
+    return {"columns": columns, "rows": rows, "row_count": len(rows), "truncated": result["truncated"],
+            "seconds": result["seconds"]}
+
+
+def write_arrow(result: dict, out: str) -> dict:
+    """Arrow IPC stream of the result to `out`"""
+    import pyarrow as pa
+
+    table = result["table"]
+    with pa.OSFile(out, "wb") as sink, pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return {"path": out, "row_count": table.num_rows, "truncated": result["truncated"],
+            "seconds": result["seconds"]}
+
+
+def saved_catalog() -> dict:
+    return {name: {"description": q["description"], "params": q["params"]} for name, q in SAVED_QUERIES.items()}
+
+
+def parse_params(pairs) -> dict:
+    """["start_date=2026-01-01", "n=5"] -> {"start_date": "2026-01-01", "n": 5}"""
+    params = {}
+    for pair in pairs or []:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise QueryError(f"Parameter must be name=value: {pair}")
+        params[name] = int(value) if value.lstrip("-").isdigit() else value
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only DuckDB queries over the report archive")
+    parser.add_argument("--build", action="store_true", help="Rebuild the warehouse from the packed archive")
+    parser.add_argument("--list", action="store_true", help="List saved queries")
+    parser.add_argument("--sql", type=str, help="A single SELECT statement")
+    parser.add_argument("--saved", type=str, help="Saved query name")
+    parser.add_argument("--param", action="append", help="Named parameter name=value")
+    parser.add_argument("--max-rows", type=int, default=MAX_ROWS)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_S)
+    args = parser.parse_args()
+
+    try:
+        if args.build:
+            summary = refresh_warehouse()
+            print(f"SUCCESS: Warehouse holds {summary['sales_rows']} sales lines "
+                  f"({summary['new_files']} new reports)")
+        elif args.list:
+            print(json.dumps(saved_catalog(), indent=2))
+        else:
+            result = run_query(args.sql, args.saved, parse_params(args.param), args.max_rows, args.timeout)
+            print(json.dumps(to_json(result), default=str))
+    except QueryError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
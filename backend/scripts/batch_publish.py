@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Atomic Invoice Batch Publication
+Python side of the protocol in src/services/publication.service.ts.
+
+Each sales_transactions row carries the sequence of the batch that wrote it
+(`batch_seq`) and, once replaced, of the batch that retired it
+(`retired_seq`). `publications._id == "sales_transactions"` holds the
+published sequence; a row is visible at sequence P when batch_seq <= P and
+retired_seq > P, with missing fields counting as visible. A batch is staged
+under P+1 and becomes visible, together with the removal of the rows it
+replaces, when the pointer moves - one single-document update - so readers
+see either the old totals or the new ones, never a mix.
+
+The writer renews its lease before every staged chunk and only flips the
+pointer while it still holds it; a writer that lost the lease aborts and
+removes its own rows (`batch_id`), never another writer's.
+
+Rollup coverage is versioned by sequence. Every `rollup_days` marker records
+the sequence each structure was built from (`built_seq.<kind>`), and a batch
+stamps the days it changes with `pending_seq` before the flip and
+`changed_seq` after it. A marker vouches for a day at sequence P only while no
+change published at or before P is newer than the marker's build sequence
+(marker_current). A refresh that read the previous sequence and writes its
+markers after the flip is therefore never served for the republished days,
+whatever order the writes land in.
+
+Requires: pymongo
+
+Configuration (environment):
+    PUBLISH_LEASE_MS          600000 (writer lease; must match the API)
+    PUBLISH_PURGE_GRACE_MS    600000 (how long retired rows stay readable)
+"""
+
+import os
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+import mongo_store
+
+logger = logging.getLogger(__name__)
+
+PUBLICATION_ID = "sales_transactions"
+LEASE_MS = int(os.environ.get("PUBLISH_LEASE_MS", "600000"))
+PURGE_GRACE_MS = int(os.environ.get("PUBLISH_PURGE_GRACE_MS", "600000"))
+
+
+def published_seq(db) -> int:
+    doc = db.publications.find_one({"_id": PUBLICATION_ID}, {"seq": 1})
+    return (doc or {}).get("seq") or 0
+
+
+def published_filter(seq: int) -> dict:
+    return {"batch_seq": {"$not": {"$gt": seq}}, "retired_seq": {"$not": {"$lte": seq}}}
+
+
+def visible(db, filter: dict = None, seq: int = None) -> dict:
+    """`filter` restricted to rows visible at `seq` (default: the published sequence)"""
+    return {**(filter or {}), **published_filter(published_seq(db) if seq is None else seq)}
+
+
+def acquire_lease(db, batch_id: str) -> int:
+    """Waits until no other writer holds the publication; returns the published sequence"""
+    db.publications.update_one({"_id": PUBLICATION_ID}, {"$setOnInsert": {"seq": 0, "writer": None}}, upsert=True)
+    deadline = time.monotonic() + LEASE_MS / 1000
+    while True:
+        now = datetime.now(timezone.utc)
+        doc = db.publications.find_one_and_update(
+            {"_id": PUBLICATION_ID, "$or": [{"writer": None}, {"writer_expires": {"$lt": now}}]},
+            {"$set": {"writer": batch_id, "writer_expires": now + timedelta(milliseconds=LEASE_MS)}},
+            return_document=True,
+        )
+        if doc:
+            return doc.get("seq") or 0
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for another ingestion to publish")
+        time.sleep(0.5)
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+def renew_lease(db, batch_id: str):
+    """Extends the writer's lease; raises LeaseLost once another writer has taken it over"""
+    result = db.publications.update_one(
+        {"_id": PUBLICATION_ID, "writer": batch_id},
+        {"$set": {"writer_expires": datetime.now(timezone.utc) + timedelta(milliseconds=LEASE_MS)}},
+    )
+    if result.matched_count != 1:
+        raise LeaseLost(f"Publication lease lost for batch {batch_id}")
+
+
+def release_lease(db, batch_id: str):
+    db.publications.update_one({"_id": PUBLICATION_ID, "writer": batch_id},
+                               {"$set": {"writer": None, "writer_expires": None}})
+
+
+def flip(db, writer: str, seq: int):
+    """Publishes `seq` and releases the lease in one update; raises LeaseLost if `writer` no longer holds it"""
+    result = db.publications.update_one(
+        {"_id": PUBLICATION_ID, "writer": writer},
+        {"$set": {"seq": seq, "batch_id": writer, "published_at": datetime.now(timezone.utc),
+                  "writer": None, "writer_expires": None}},
+    )
+    if result.modified_count != 1:
+        raise LeaseLost(f"Publication lease lost for batch {writer}")
+
+
+def discard_unpublished(db, seq: int):
+    """
+    Drops everything staged above `seq` by writers that lost the lease without
+    publishing. Only the current lease holder may call this.
+    """
+    db.sales_transactions.delete_many({"batch_seq": {"$gt": seq}})
+    db.sales_transactions.update_many({"retired_seq": {"$gt": seq}}, {"$unset": {"retired_seq": "", "retired_by": ""}})
+
+
+def discard_batch(db, batch_id: str, seq: int):
+    """Drops one writer's staged rows and retirements"""
+    db.sales_transactions.delete_many({"batch_seq": seq, "batch_id": batch_id})
+    db.sales_transactions.update_many({"retired_seq": seq, "retired_by": batch_id},
+                                      {"$unset": {"retired_seq": "", "retired_by": ""}})
+
+
+def stamp_rollup_days(db, dates, field: str, seq: int):
+    """Records on the `rollup_days` marker of each of `dates` that `seq` changes it"""
+    mongo_store.bulk_write(db.rollup_days, (
+        UpdateOne({"_id": day}, {"$set": {"date": day}, "$max": {field: seq}}, upsert=True)
+        for day in sorted(dates)
+    ))
+
+
+def marker_current(marker: dict, kind: str, seq: int) -> bool:
+    """
+    Whether a `rollup_days` marker vouches for `kind` at sequence `seq`: built,
+    and no change published at or before `seq` is newer than the build. A
+    pending stamp above `seq` is a flip that has not happened (or was aborted).
+    """
+    built = (marker.get("built_seq") or {}).get(kind)
+    if built is None:
+        return False
+    changed = marker.get("changed_seq") or 0
+    pending = marker.get("pending_seq") or 0
+    if pending <= seq:
+        changed = max(changed, pending)
+    return changed <= min(built, seq)
+
+
+def purge_retired(db, grace_ms: int = PURGE_GRACE_MS) -> int:
+    """Deletes rows retired by a batch published more than `grace_ms` ago"""
+    cutoff = datetime.now(timezone.utc) - timedelta(milliseconds=grace_ms)
+    latest = db.ingest_batches.find_one({"status": "published", "published_at": {"$lt": cutoff}},
+                                        {"seq": 1}, sort=[("seq", -1)])
+    if not latest:
+        return 0
+    return db.sales_transactions.delete_many({"retired_seq": {"$lte": latest["seq"]}}).deleted_count
+
+
+def publish_invoice_batch(db, docs: list, invoice_nos: list, source: str, dates=()) -> dict:
+    """
+    Replaces every invoice in `invoice_nos` with `docs` as one atomically
+    published batch; `dates` are the invoice dates whose rollups it changes
+    """
+    batch_id = str(uuid.uuid4())
+    published = acquire_lease(db, batch_id)
+    seq = published + 1
+    flipped = False
+    try:
+        discard_unpublished(db, published)
+        purge_retired(db)
+        db.ingest_batches.insert_one({"_id": batch_id, "seq": seq, "status": "staging", "source": source,
+                                      "created_at": datetime.now(timezone.utc)})
+
+        for chunk in mongo_store.batched(docs, mongo_store.BATCH_SIZE):
+            renew_lease(db, batch_id)
+            for doc in chunk:
+                doc["batch_id"], doc["batch_seq"] = batch_id, seq
+            mongo_store.bulk_insert(db.sales_transactions, chunk)
+        retired = 0
+        for chunk in mongo_store.batched(invoice_nos, 5000):
+            renew_lease(db, batch_id)
+            result = mongo_store.with_retry(lambda: db.sales_transactions.update_many(
+                {"invoice_no": {"$in": chunk}, **published_filter(published)},
+                {"$set": {"retired_seq": seq, "retired_by": batch_id}}))
+            retired += result.modified_count
+
+        renew_lease(db, batch_id)
+        stamp_rollup_days(db, dates, "pending_seq", seq)
+        flip(db, batch_id, seq)
+        flipped = True
+        stamp_rollup_days(db, dates, "changed_seq", seq)
+
+        db.ingest_batches.update_one({"_id": batch_id}, {"$set": {
+            "status": "published", "published_at": datetime.now(timezone.utc), "rows": len(docs), "retired": retired}})
+        logger.info(f"Published batch {seq}: {len(docs)} rows, {retired} rows retired")
+        return {"batch_id": batch_id, "seq": seq, "inserted": len(docs), "retired": retired}
+    except Exception:
+        if not flipped:
+            discard_batch(db, batch_id, seq)
+            release_lease(db, batch_id)
+            db.ingest_batches.update_one({"_id": batch_id}, {"$set": {"status": "aborted"}})
+        raise
+
+
+def ensure_indexes(db):
+    db.sales_transactions.create_index([("batch_seq", 1)], sparse=True)
+    db.sales_transactions.create_index([("retired_seq", 1)], sparse=True)
+    db.ingest_batches.create_index([("status", 1), ("published_at", 1)])
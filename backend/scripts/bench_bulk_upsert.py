@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-row update_one(upsert) vs mongo_store.bulk_upsert for footfall rows.
+
+Runs against MONGO_URL (a local mongod) in a scratch database, or an in-memory
+mongomock server with --mongomock. Each strategy writes the same rows twice:
+a cold pass (all inserts) and a warm pass (all updates).
+
+Usage:
+    python bench_bulk_upsert.py                    # 100k rows against MONGO_URL
+    python bench_bulk_upsert.py --mongomock --rows 20000
+"""
+
+import json
+import time
+import argparse
+from datetime import date, timedelta
+
+
+def synthetic_footfall(rows: int, locations: int = 100) -> list:
+    """`rows` unique (date, location) footfall documents"""
+    start = date(2020, 4, 1)
+    docs = []
+    for i in range(rows):
+        day, store = divmod(i, locations)
+        docs.append({
+            "date": (start + timedelta(days=day)).isoformat(),
+            "location_name": f"Store {store:03d}",
+            "footfall_count": (i * 37) % 900 + 50,
+        })
+    return docs
+
+
+def per_row(collection, docs):
+    for doc in docs:
+        collection.update_one(
+            {"date": doc["date"], "location_name": doc["location_name"]},
+            {"$set": doc},
+            upsert=True,
+        )
+
+
+def bulk(collection, docs, batch_size):
+    import mongo_store
+
+    mongo_store.bulk_upsert(collection, docs, ("date", "location_name"), batch_size=batch_size)
+
+
+def timed(fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row vs bulk upsert benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--mongomock", action="store_true", help="Use in-memory mongomock instead of MONGO_URL")
+    parser.add_argument("--db", type=str, default="jacadi_dsr_bench", help="Scratch database name")
+    args = parser.parse_args()
+
+    import mongo_store
+
+    if args.mongomock:
+        mongo_store.close_client()
+        mongo_store.MONGO_URL = "mongomock://localhost"
+
+    db = mongo_store.get_db(args.db)
+    docs = synthetic_footfall(args.rows)
+    results = {"rows": args.rows, "batch_size": args.batch_size, "backend": "mongomock" if args.mongomock else "mongod"}
+
+    for name, run in (("per_row", lambda c, d: per_row(c, d)),
+                      ("bulk", lambda c, d: bulk(c, d, args.batch_size))):
+        collection = db[f"bench_footfall_{name}"]
+        collection.drop()
+        collection.create_index([("date", 1), ("location_name", 1)], unique=True)
+
+        # Copies so pymongo cannot mutate the shared rows (it adds _id on insert)
+        cold = timed(lambda: run(collection, [dict(d) for d in docs]))
+        warm = timed(lambda: run(collection, [dict(d) for d in docs]))
+        assert collection.count_documents({}) == args.rows
+
+        results[name] = {
+            "cold_seconds": round(cold, 3),
+            "warm_seconds": round(warm, 3),
+            "rows_per_second": round(2 * args.rows / (cold + warm)),
+        }
+        print(f"{name:>8}: cold {cold:8.2f}s  warm {warm:8.2f}s  ({results[name]['rows_per_second']} rows/s)")
+        collection.drop()
+
+    results["speedup"] = round(results["bulk"]["rows_per_second"] / max(results["per_row"]["rows_per_second"], 1), 1)
+    print(f" speedup: {results['speedup']}x")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-store DSR metrics, one process vs a process pool.
+
+Generates the same number of line items per synthetic store for 2, 4, ... 64
+stores, computes the store rows with store_metrics.compute on one process and
+on the pool, checks both give identical rows, and reports the speedup and
+parallel efficiency (speedup / workers) for each store count. With a fixed
+amount of work per store, latency on the pool should stay roughly flat as
+stores are added, up to the number of cores.
+
+The synthetic runs time the fan-out only: columns are built in memory first,
+so the Mongo read, columnize and sort that store_metrics() does on a single
+process before fanning out are NOT included. `--from-db START END` measures
+the whole store_metrics() call on the configured database instead, with load
+and compute time reported separately; that is the figure a DSR run sees.
+
+Usage:
+    python bench_store_fanout.py                           # 2..64 stores, 50k lines each
+    python bench_store_fanout.py --stores 2 8 32 --lines-per-store 20000 --workers 8
+    python bench_store_fanout.py --from-db 2026-01-01 2026-01-31 --workers 8
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+
+import store_metrics
+
+
+def synthetic_columns(stores: int, lines_per_store: int, days: int = 31, seed: int = 7):
+    """Sorted columns for `stores` stores, ~3 lines per bill, one in ten lines a return"""
+    rng = random.Random(seed)
+    columns = {name: [] for name in store_metrics.COLUMNS}
+    for store in range(stores):
+        for i in range(lines_per_store):
+            returned = rng.random() < 0.1
+            columns["store"].append(store)
+            columns["day"].append(i * days // lines_per_store)
+            columns["nett"].append(round(rng.uniform(-900, 0) if returned else rng.uniform(300, 6000), 2))
+            columns["qty"].append(0 if returned else rng.randint(1, 4))
+            columns["bill"].append(store_metrics.NO_BILL if returned else (store << 20) | (i // 3))
+    return [f"Store {s:03d}" for s in range(stores)], columns
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def end_to_end(start: str, end: str, workers: int, window_days: int) -> dict:
+    """store_metrics() on the live database, one process vs the pool, load time included"""
+    from mongo_store import get_db
+
+    db = get_db()
+    runs = {}
+    for label, count in (("serial", 1), ("pool", workers)):
+        seconds, result = timed(lambda: store_metrics.store_metrics(db, start, end, count, window_days))
+        runs[label] = {"seconds": round(seconds, 3), "load_seconds": result["load_seconds"],
+                       "compute_seconds": result["compute_seconds"], "rows": result}
+        print(f"{label:>6}: {seconds:7.2f}s (load {result['load_seconds']:.2f}s, "
+              f"compute {result['compute_seconds']:.2f}s) on {count} workers")
+    serial, pool = runs["serial"].pop("rows"), runs["pool"].pop("rows")
+    assert serial["stores"] == pool["stores"] and serial["total"] == pool["total"], "pool and single process disagree"
+    return {"start": start, "end": end, "workers": workers, "stores": len(serial["stores"]),
+            "lines": serial["total"]["line_count"], **runs,
+            "speedup": round(runs["serial"]["seconds"] / runs["pool"]["seconds"], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-store fan-out scaling benchmark")
+    parser.add_argument("--stores", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64])
+    parser.add_argument("--lines-per-store", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--window-days", type=int, default=0)
+    parser.add_argument("--from-db", nargs=2, metavar=("START", "END"),
+                        help="Time store_metrics() end to end on the configured database")
+    args = parser.parse_args()
+
+    if args.from_db:
+        print(json.dumps(end_to_end(*args.from_db, args.workers, args.window_days)))
+        return
+
+    results = {"workers": args.workers, "lines_per_store": args.lines_per_store, "runs": []}
+    for stores in args.stores:
+        names, columns = synthetic_columns(stores, args.lines_per_store)
+        serial_s, serial = timed(lambda: store_metrics.compute(names, columns, workers=1))
+        pooled_s, pooled = timed(lambda: store_metrics.compute(names, columns, args.workers, args.window_days))
+        assert pooled == serial, "pool and single process disagree"
+
+        workers = min(args.workers, stores)
+        speedup = serial_s / pooled_s
+        results["runs"].append({
+            "stores": stores,
+            "serial_seconds": round(serial_s, 3),
+            "pool_seconds": round(pooled_s, 3),
+            "speedup": round(speedup, 2),
+            "efficiency": round(speedup / workers, 2),
+        })
+        print(f"{stores:>3} stores: serial {serial_s:7.2f}s  pool {pooled_s:7.2f}s  "
+              f"speedup {speedup:5.2f}x on {workers} workers")
+
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
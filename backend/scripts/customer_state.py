@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Customer State Builder
+Maintains repeat-purchase state incrementally from ingested invoice lines:
+
+    customer_visits   one document per (date, customer, location): sales bills and net value
+    customer_state    one document per customer: first/last purchase, visit count,
+                      lifetime value, home store (location with the most bills)
+    customer_lapses   one document per span of days a customer was lapsed (no purchase
+                      in LAPSED_DAYS), with their home store during the span
+    customer_lapsed   lapsed customers per (day, home store), for every day up to the
+                      latest visit (`pipeline_state` "customer_lapsed".through)
+
+Only days without a current `rollup_days` marker (kind "customer_state") are re-read;
+their visit documents are rewritten and just the customers seen on those days
+have their state recomputed from their own visits. The cost of a refresh is
+proportional to the day's bills, not to the size of the customer history, and
+re-ingesting an invoice never double counts. Lapse spans are rewritten only
+for refolded customers whose spans changed, and the daily lapsed counts are
+rolled forward from the earliest changed span, so a past period's lapsed count
+is one indexed lookup and does not move when the customer comes back later.
+
+Walk-in bills booked to a placeholder account (no mobile, or a repeated-digit
+mobile such as 2222222222) are not treated as customers.
+
+Requires: pymongo (via mongo_store)
+
+Usage:
+    python customer_state.py                        # process all unmarked days
+    python customer_state.py --start 2026-01-01 --end 2026-01-31
+    python customer_state.py --counts 2026-01-01 2026-01-31 [--location "Jacadi MOA"]
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReplaceOne
+
+import batch_publish
+from mongo_store import BATCH_SIZE, batched, bulk_write, get_db
+from daily_rollup import daterange, find_unmarked_ranges, is_sales_bill, mark_built
+
+logger = logging.getLogger(__name__)
+
+STATE_KIND = "customer_state"
+LAPSED_DAYS = int(os.environ.get("CUSTOMER_LAPSED_DAYS", "180"))
+PLACEHOLDER_CODES = {c.strip() for c in os.environ.get("PLACEHOLDER_CUSTOMER_CODES", "").split(",") if c.strip()}
+
+
+def customer_key(line: dict):
+    """Consumer code (or mobile when the code is blank); None for walk-in placeholder accounts"""
+    code = (line.get("consumer_code") or "").strip()
+    mobile = re.sub(r"\D", "", line.get("consumer_mobile") or "")[-10:]
+    if code in PLACEHOLDER_CODES:
+        return None
+    if len(mobile) < 10 or len(set(mobile)) == 1:
+        return None
+    return code or mobile
+
+
+def accumulate_visits(lines) -> dict:
+    """Folds line items into {(date, customer, location): visit} with distinct sales bills"""
+    visits = {}
+    for line in lines:
+        customer = customer_key(line)
+        if customer is None:
+            continue
+        key = (line["invoice_date"], customer, line.get("location_name", ""))
+        visit = visits.get(key)
+        if visit is None:
+            visit = visits[key] = {"value": 0.0, "bill_set": set(), "name": "", "mobile": ""}
+        visit["value"] += line.get("nett_invoice_value") or 0
+        if is_sales_bill(line) and line.get("invoice_no"):
+            visit["bill_set"].add(line["invoice_no"])
+        visit["name"] = (line.get("consumer_name") or "").strip() or visit["name"]
+        visit["mobile"] = (line.get("consumer_mobile") or "").strip() or visit["mobile"]
+
+    for visit in visits.values():
+        visit["bills"] = len(visit.pop("bill_set"))
+    return visits
+
+
+def shift_day(day: str, days: int) -> str:
+    return (datetime.strptime(day, "%Y-%m-%d").date() + timedelta(days=days)).isoformat()
+
+
+def home_store(bills_by_store: dict, last_by_store: dict):
+    """Location with the most bills, the most recently visited one on a tie"""
+    return max(bills_by_store, key=lambda s: (bills_by_store[s], last_by_store[s]), default=None)
+
+
+def fold_state(customer: str, visits) -> dict:
+    """
+    Customer state from all of one customer's visit documents. `lapses` lists
+    the spans [from, until) of days on which the customer was lapsed - more than
+    LAPSED_DAYS after their last purchase - with the home store as of that
+    purchase; the last span stays open (until None).
+    """
+    bills_by_store = {}
+    last_by_store = {}
+    lapses = []
+    state = {"_id": customer, "first_purchase": None, "last_purchase": None,
+             "visit_count": 0, "ltv": 0.0, "name": "", "mobile": ""}
+
+    for visit in sorted(visits, key=lambda v: v["date"]):
+        state["ltv"] += visit["value"]
+        if not visit["bills"]:
+            continue  # returns / non-sales lines only
+        previous = state["last_purchase"]
+        if previous and visit["date"] != previous:
+            lapsed_from = shift_day(previous, LAPSED_DAYS + 1)
+            if lapsed_from < visit["date"]:
+                lapses.append({"from": lapsed_from, "until": visit["date"],
+                               "location_name": home_store(bills_by_store, last_by_store)})
+        store = visit["location_name"]
+        state["visit_count"] += visit["bills"]
+        state["first_purchase"] = state["first_purchase"] or visit["date"]
+        state["last_purchase"] = visit["date"]
+        state["name"] = visit.get("name") or state["name"]
+        state["mobile"] = visit.get("mobile") or state["mobile"]
+        bills_by_store[store] = bills_by_store.get(store, 0) + visit["bills"]
+        last_by_store[store] = visit["date"]
+
+    state["home_store"] = home_store(bills_by_store, last_by_store)
+    if state["last_purchase"]:
+        lapses.append({"from": shift_day(state["last_purchase"], LAPSED_DAYS + 1), "until": None,
+                       "location_name": state["home_store"]})
+    state["ltv"] = round(state["ltv"], 2)
+    state["lapses"] = lapses
+    return state
+
+
+def span_key(span: dict) -> tuple:
+    return span["from"], span["until"], span["location_name"]
+
+
+def replace_lapses(db, customer: str, old: list, new: list):
+    """Rewrites one customer's lapse spans; returns the first day whose lapsed count may change"""
+    old_keys, new_keys = {span_key(s) for s in old}, {span_key(s) for s in new}
+    changed = old_keys ^ new_keys
+    if not changed:
+        return None
+    db.customer_lapses.delete_many({"customer": customer})
+    if new:
+        db.customer_lapses.insert_many([{"_id": f"{customer}|{span['from']}", "customer": customer, **span}
+                                        for span in new])
+    return min(key[0] for key in changed)
+
+
+def refresh_lapsed_counts(db, changed_from: str = None) -> int:
+    """
+    Rolls the per-(day, home store) lapsed counts forward from the earlier of
+    `changed_from` and the first day not yet counted, up to the latest visit.
+    Each day's count is the previous day's plus the spans opening that day,
+    minus the spans closing.
+    """
+    state = db.pipeline_state.find_one({"_id": "customer_lapsed"}) or {}
+    through = state.get("through")
+    latest = db.customer_visits.find_one({"bills": {"$gt": 0}}, {"date": 1}, sort=[("date", -1)])
+    if latest is None:
+        db.customer_lapsed.delete_many({})
+        db.pipeline_state.delete_one({"_id": "customer_lapsed"})
+        return 0
+    last_day = latest["date"]
+
+    if through is None:
+        first = db.customer_lapses.find_one({}, {"from": 1}, sort=[("from", 1)])
+        start = first["from"] if first else last_day
+    else:
+        start = shift_day(through, 1)
+    if changed_from and changed_from < start:
+        start = changed_from
+
+    db.customer_lapsed.delete_many({"date": {"$gte": start}})
+    written = 0
+    if start <= last_day:
+        counts = {doc["location_name"]: doc["lapsed"]
+                  for doc in db.customer_lapsed.find({"date": shift_day(start, -1)})}
+        moves = {}
+        for span in db.customer_lapses.find({"from": {"$gte": start, "$lte": last_day}}):
+            moves.setdefault(span["from"], []).append((span["location_name"], 1))
+        for span in db.customer_lapses.find({"until": {"$gte": start, "$lte": last_day}}):
+            moves.setdefault(span["until"], []).append((span["location_name"], -1))
+
+        def snapshots():
+            for day in daterange(start, last_day):
+                for location, delta in moves.get(day, ()):
+                    counts[location] = counts.get(location, 0) + delta
+                for location, lapsed in counts.items():
+                    if lapsed:
+                        yield ReplaceOne({"_id": f"{day}|{location}"},
+                                         {"date": day, "location_name": location, "lapsed": lapsed}, upsert=True)
+
+        written = bulk_write(db.customer_lapsed, snapshots())["upserted"]
+    db.pipeline_state.update_one({"_id": "customer_lapsed"}, {"$set": {"through": last_day}}, upsert=True)
+    return written
+
+
+def build_customer_state(db, start_date: str, end_date: str) -> int:
+    """Rewrites visits for [start_date, end_date] and refreshes the customers they touch"""
+    seq = batch_publish.published_seq(db)
+    cursor = db.sales_transactions.find(
+        batch_publish.visible(db, {"invoice_date": {"$gte": start_date, "$lte": end_date}}, seq),
+        {"_id": 0, "invoice_no": 1, "invoice_date": 1, "location_name": 1, "transaction_type": 1,
+         "mh1_description": 1, "nett_invoice_value": 1, "consumer_code": 1, "consumer_mobile": 1,
+         "consumer_name": 1},
+        batch_size=5000,
+    )
+    visits = accumulate_visits(cursor)
+
+    # Customers whose previous visits in the range may disappear must be refreshed too
+    touched = set(db.customer_visits.distinct("customer", {"date": {"$gte": start_date, "$lte": end_date}}))
+    touched.update(customer for _, customer, _ in visits)
+
+    db.customer_visits.delete_many({"date": {"$gte": start_date, "$lte": end_date}})
+    bulk_write(db.customer_visits, (
+        ReplaceOne(
+            {"_id": f"{date}|{customer}|{location}"},
+            {"date": date, "customer": customer, "location_name": location, **visit},
+            upsert=True,
+        )
+        for (date, customer, location), visit in visits.items()
+    ))
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    stale = []
+    changed_from = None
+    for chunk in batched(sorted(touched), BATCH_SIZE):
+        history = {customer: [] for customer in chunk}
+        for visit in db.customer_visits.find({"customer": {"$in": chunk}}):
+            history[visit["customer"]].append(visit)
+        old_lapses = {customer: [] for customer in chunk}
+        for span in db.customer_lapses.find({"customer": {"$in": chunk}}):
+            old_lapses[span["customer"]].append(span)
+        for customer, customer_visits in history.items():
+            state = fold_state(customer, customer_visits)
+            lapses = state.pop("lapses")
+            if state["first_purchase"] is None and state["ltv"] == 0:
+                stale.append(customer)
+                lapses = []
+            else:
+                state["updated_at"] = now
+                ops.append(ReplaceOne({"_id": customer}, state, upsert=True))
+            first_changed = replace_lapses(db, customer, old_lapses[customer], lapses)
+            if first_changed and (changed_from is None or first_changed < changed_from):
+                changed_from = first_changed
+    bulk_write(db.customer_state, ops)
+    if stale:
+        db.customer_state.delete_many({"_id": {"$in": stale}})
+    refresh_lapsed_counts(db, changed_from)
+
+    days = list(daterange(start_date, end_date))
+    mark_built(db, STATE_KIND, days, seq, now)
+
+    logger.info(f"Refreshed {len(ops)} customers from {len(visits)} visits over {len(days)} days")
+    return len(ops)
+
+
+def refresh(db) -> int:
+    return sum(build_customer_state(db, start, end) for start, end in find_unmarked_ranges(db, STATE_KIND))
+
+
+def ensure_indexes(db):
+    db.customer_visits.create_index([("date", 1), ("location_name", 1)])
+    db.customer_visits.create_index("customer")
+    db.customer_state.create_index([("home_store", 1), ("last_purchase", 1)])
+    db.customer_state.create_index("first_purchase")
+    db.customer_lapses.create_index("customer")
+    db.customer_lapses.create_index("from")
+    db.customer_lapses.create_index("until", sparse=True)
+    db.customer_lapsed.create_index([("date", 1), ("location_name", 1)])
+
+
+def lapsed_cutoff(end_date: str) -> str:
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    return (end - timedelta(days=LAPSED_DAYS)).isoformat()
+
+
+def lapsed_counts(db, end_date: str, locations=None) -> dict:
+    """
+    Lapsed customers per home store as of end_date. Past days read that day's
+    counts from customer_lapsed; from the latest counted day on, every visit is
+    at or before end_date, so customer_state answers it directly.
+    """
+    state = db.pipeline_state.find_one({"_id": "customer_lapsed"}) or {}
+    if state.get("through") and end_date < state["through"]:
+        query = {"date": end_date}
+        if locations:
+            query["location_name"] = {"$in": list(locations)}
+        return {doc["location_name"]: doc["lapsed"] for doc in db.customer_lapsed.find(query)}
+
+    match = {"last_purchase": {"$lt": lapsed_cutoff(end_date)}}
+    if locations:
+        match["home_store"] = {"$in": list(locations)}
+    return {group["_id"]: group["count"] for group in db.customer_state.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$home_store", "count": {"$sum": 1}}},
+    ])}
+
+
+def period_counts(db, start_date: str, end_date: str, locations=None) -> list:
+    """
+    New / repeat customers per location among those with a bill in the period,
+    plus lapsed customers (home store, no purchase in the LAPSED_DAYS up to end_date)
+    """
+    match = {"date": {"$gte": start_date, "$lte": end_date}, "bills": {"$gt": 0}}
+    if locations:
+        match["location_name"] = {"$in": list(locations)}
+
+    rows = {}
+    pairs = db.customer_visits.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"location": "$location_name", "customer": "$customer"}}},
+        {"$lookup": {"from": "customer_state", "localField": "_id.customer",
+                     "foreignField": "_id", "as": "state"}},
+        {"$project": {"location": "$_id.location", "first": {"$arrayElemAt": ["$state.first_purchase", 0]}}},
+    ], allowDiskUse=True)
+    for pair in pairs:
+        row = rows.setdefault(pair["location"], {"Location": pair["location"], "active": 0, "new": 0,
+                                                 "repeat": 0, "lapsed": 0})
+        row["active"] += 1
+        if pair.get("first") and pair["first"] >= start_date:
+            row["new"] += 1
+        else:
+            row["repeat"] += 1
+
+    for location, lapsed in lapsed_counts(db, end_date, locations).items():
+        row = rows.setdefault(location, {"Location": location, "active": 0, "new": 0, "repeat": 0, "lapsed": 0})
+        row["lapsed"] = lapsed
+
+    return sorted(rows.values(), key=lambda r: r["Location"] or "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain per-customer purchase state")
+    parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="End date YYYY-MM-DD")
+    parser.add_argument("--counts", nargs=2, metavar=("START", "END"), help="Print new/repeat/lapsed counts")
+    parser.add_argument("--location", action="append", help="Restrict --counts to location(s)")
+    args = parser.parse_args()
+
+    db = get_db()
+    ensure_indexes(db)
+
+    if args.counts:
+        print(json.dumps(period_counts(db, args.counts[0], args.counts[1], args.location), indent=2))
+        return
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            logger.error("--start and --end must be given together")
+            sys.exit(1)
+        total = build_customer_state(db, args.start, args.end)
+    else:
+        total = refresh(db)
+    print(f"SUCCESS: Refreshed {total} customers")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Daily Rollup Builder
+Maintains one `daily_rollup` document per (date, location) with net sales,
+sold quantity and the set of sales bills as a roaring bitmap of encoded
+invoice ids (plus a HyperLogLog), so multi-month TRX/ATV is a bitmap union
+instead of an $addToSet over every line item.
+
+A `rollup_days` marker is written for every day that has been rolled up
+(including days without sales), recording the publication sequence it was
+built from; the API only trusts the rollup for ranges whose markers are all
+current at its pinned sequence (batch_publish.marker_current). Publishing a
+batch stamps the days it rewrites, which makes older markers stale.
+
+Requires: pymongo (via mongo_store), pyroaring
+
+Usage:
+    python daily_rollup.py                          # roll up all unmarked days (and derived tables)
+    python daily_rollup.py --start 2026-01-01 --end 2026-01-31
+    python daily_rollup.py --count 2025-04-01 2026-03-31 [--location "Jacadi MOA"]
+"""
+
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from bson.binary import Binary
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pyroaring import BitMap
+
+import batch_publish
+from mongo_store import bulk_write, get_db
+from invoice_sketch import MAX_PREFIX_ID, HyperLogLog, encode_invoice_no, invoice_prefix
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KIND = "daily_rollup"
+SALES_TRX_TYPES = ("IV", "IR")
+
+
+def daterange(start: str, end: str):
+    d = datetime.strptime(start, "%Y-%m-%d").date()
+    last = datetime.strptime(end, "%Y-%m-%d").date()
+    while d <= last:
+        yield d.isoformat()
+        d += timedelta(days=1)
+
+
+def is_sales_bill(line: dict) -> bool:
+    """Same bill definition as the dashboard TRX counts"""
+    return line.get("transaction_type") in SALES_TRX_TYPES and line.get("mh1_description") == "Sales"
+
+
+def load_prefix_ids(db) -> dict:
+    return {doc["_id"]: doc["key"] for doc in db.invoice_prefixes.find({})}
+
+
+def register_prefix(db, prefix: str, prefix_ids: dict) -> int:
+    """Assigns the next registry id to a new invoice prefix"""
+    existing = db.invoice_prefixes.find_one({"_id": prefix})
+    if existing is None:
+        counter = db.counters.find_one_and_update(
+            {"_id": "invoice_prefix"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if counter["seq"] > MAX_PREFIX_ID:
+            raise ValueError(f"Invoice prefix registry is full ({MAX_PREFIX_ID} ids), cannot add {prefix!r}")
+        db.invoice_prefixes.update_one(
+            {"_id": prefix}, {"$setOnInsert": {"key": counter["seq"]}}, upsert=True
+        )
+        existing = db.invoice_prefixes.find_one({"_id": prefix})
+    prefix_ids[prefix] = existing["key"]
+    return existing["key"]
+
+
+def build_rollup(db, start_date: str, end_date: str) -> int:
+    """Recomputes rollup documents for every day in [start_date, end_date]"""
+    seq = batch_publish.published_seq(db)
+    prefix_ids = load_prefix_ids(db)
+    buckets = {}
+
+    cursor = db.sales_transactions.find(
+        batch_publish.visible(db, {"invoice_date": {"$gte": start_date, "$lte": end_date}}, seq),
+        {"_id": 0, "invoice_no": 1, "invoice_date": 1, "location_name": 1, "transaction_type": 1,
+         "mh1_description": 1, "nett_invoice_value": 1, "total_sales_qty": 1},
+        batch_size=5000,
+    )
+
+    for line in cursor:
+        key = (line["invoice_date"], line.get("location_name", ""))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {
+                "nett_sales": 0.0, "sales_qty": 0, "line_count": 0,
+                "bills": BitMap(), "hll": HyperLogLog(),
+            }
+
+        bucket["nett_sales"] += line.get("nett_invoice_value") or 0
+        bucket["line_count"] += 1
+
+        if is_sales_bill(line):
+            bucket["sales_qty"] += line.get("total_sales_qty") or 0
+            invoice_no = line.get("invoice_no")
+            if invoice_no:
+                prefix = invoice_prefix(invoice_no)
+                if prefix not in prefix_ids:
+                    register_prefix(db, prefix, prefix_ids)
+                bucket["bills"].add(encode_invoice_no(invoice_no, prefix_ids))
+                bucket["hll"].add(invoice_no)
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    ids = []
+    for (date, location), bucket in buckets.items():
+        bills = bucket["bills"]
+        bills.run_optimize()
+        ids.append(f"{date}|{location}")
+        ops.append(ReplaceOne(
+            {"_id": ids[-1]},
+            {
+                "date": date,
+                "location_name": location,
+                "nett_sales": bucket["nett_sales"],
+                "sales_qty": bucket["sales_qty"],
+                "line_count": bucket["line_count"],
+                "bill_count": len(bills),
+                "bills": Binary(bills.serialize()),
+                "bills_hll": Binary(bucket["hll"].to_bytes()),
+                "built_at": now,
+            },
+            upsert=True,
+        ))
+
+    # Drop stale rows (e.g. a location that no longer has lines on that day)
+    db.daily_rollup.delete_many({
+        "date": {"$gte": start_date, "$lte": end_date},
+        "_id": {"$nin": ids},
+    })
+    bulk_write(db.daily_rollup, ops)
+
+    days = list(daterange(start_date, end_date))
+    mark_built(db, ROLLUP_KIND, days, seq, now)
+
+    logger.info(f"Rolled up {len(ops)} (date, location) rows over {len(days)} days")
+    return len(ops)
+
+
+def mark_built(db, kind: str, days, seq: int, now):
+    """Marks `days` as covered by `kind`, built from publication sequence `seq`"""
+    bulk_write(db.rollup_days, (
+        UpdateOne(
+            {"_id": day},
+            {"$set": {"date": day, "built_at": now, f"built_seq.{kind}": seq}, "$addToSet": {"kinds": kind}},
+            upsert=True,
+        )
+        for day in days
+    ))
+
+
+def find_unmarked_ranges(db, kind: str = ROLLUP_KIND):
+    """
+    Contiguous ranges of days between the first and last invoice date whose
+    `kind` marker is missing or older than a change published since
+    """
+    seq = batch_publish.published_seq(db)
+    live = batch_publish.visible(db, seq=seq)
+    first = db.sales_transactions.find_one(live, {"invoice_date": 1}, sort=[("invoice_date", 1)])
+    last = db.sales_transactions.find_one(live, {"invoice_date": 1}, sort=[("invoice_date", -1)])
+    if not first or not last:
+        return []
+
+    marked = {
+        marker["_id"] for marker in db.rollup_days.find(
+            {"kinds": kind}, {"built_seq": 1, "changed_seq": 1, "pending_seq": 1})
+        if batch_publish.marker_current(marker, kind, seq)
+    }
+    ranges = []
+    current = None
+    for day in daterange(first["invoice_date"], last["invoice_date"]):
+        if day in marked:
+            current = None
+            continue
+        if current is None:
+            current = [day, day]
+            ranges.append(current)
+        else:
+            current[1] = day
+    return [tuple(r) for r in ranges]
+
+
+def refresh_derived(db, start_date: str = None, end_date: str = None) -> dict:
+    """
+    Rebuilds the other structures that share the `rollup_days` markers (hourly
+    cube, star-schema facts, customer state, product leaderboards) for a range,
+    or for every day they have not covered.
+    """
+    import sales_cube
+    import star_schema
+    import customer_state
+    import leaderboard
+
+    db.sales_cube.create_index([("date", 1), ("location_name", 1)])
+    star_schema.ensure_indexes(db)
+    customer_state.ensure_indexes(db)
+    leaderboard.ensure_indexes(db)
+    if start_date:
+        return {
+            "sales_cube": sales_cube.build_cube(db, start_date, end_date),
+            "sales_facts": star_schema.build_facts(db, start_date, end_date),
+            "customer_state": customer_state.build_customer_state(db, start_date, end_date),
+            "leaderboard": leaderboard.build_leaderboard(db, start_date, end_date),
+        }
+    return {
+        "sales_cube": sales_cube.refresh(db),
+        "sales_facts": star_schema.refresh(db),
+        "customer_state": customer_state.refresh(db),
+        "leaderboard": leaderboard.refresh(db),
+    }
+
+
+def count_bills(db, start_date: str, end_date: str, locations=None, approximate: bool = False) -> int:
+    """Distinct sales bills over a range: exact bitmap union, or merged HyperLogLog estimate"""
+    query = {"date": {"$gte": start_date, "$lte": end_date}}
+    if locations:
+        query["location_name"] = {"$in": list(locations)}
+
+    if approximate:
+        hll = HyperLogLog()
+        for doc in db.daily_rollup.find(query, {"bills_hll": 1}):
+            hll.merge(HyperLogLog.from_bytes(doc["bills_hll"]))
+        return hll.count()
+
+    bills = BitMap()
+    for doc in db.daily_rollup.find(query, {"bills": 1}):
+        bills |= BitMap.deserialize(doc["bills"])
+    return len(bills)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the daily sales rollup")
+    parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="End date YYYY-MM-DD")
+    parser.add_argument("--count", nargs=2, metavar=("START", "END"), help="Print distinct bills for a range")
+    parser.add_argument("--location", action="append", help="Restrict --count to location(s)")
+    parser.add_argument("--approximate", action="store_true", help="Use HyperLogLog for --count")
+    args = parser.parse_args()
+
+    db = get_db()
+    db.daily_rollup.create_index([("date", 1), ("location_name", 1)])
+
+    if args.count:
+        print(count_bills(db, args.count[0], args.count[1], args.location, args.approximate))
+        return
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            logger.error("--start and --end must be given together")
+            sys.exit(1)
+        ranges = [(args.start, args.end)]
+    else:
+        ranges = find_unmarked_ranges(db)
+
+    total = 0
+    for start, end in ranges:
+        total += build_rollup(db, start, end)
+
+    derived = refresh_derived(db, args.start, args.end)
+    print(f"SUCCESS: Rolled up {total} rows in {len(ranges)} range(s), "
+          f"{derived['sales_cube']} hourly cube rows, {derived['sales_facts']} facts, "
+          f"{derived['customer_state']} customers, {derived['leaderboard']} product day totals")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
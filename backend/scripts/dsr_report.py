@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+DSR Excel Report Generator
+Writes the daily DSR as Excel workbooks for distribution: one per store plus
+a consolidated workbook with every store and a TOTAL row, each with the seven
+dashboard datasets (KPI summary, Retail Sales, Conversions, Whatsapp Sale,
+Omni TM-LM, Omni Channel, Retail+Omni) laid out like the dashboard's CSV
+exports, and a Store KPIs sheet (net sales, units, bills, ATV, UPT).
+
+Data comes from the pre-rendered snapshots (src/services/snapshot.service.ts):
+the version named by `current.json` already holds every tab for the latest
+date, for all stores and for each store, so one pass over that version needs
+no API calls or Mongo queries. The Store KPIs rows for the snapshot's month
+to date are computed once per run by store_metrics.py, fanned out per store
+over a process pool. Workbooks are written with xlsxwriter in
+constant_memory mode, which flushes every row to disk as it is written, and
+only one store's datasets are held at a time, so memory stays flat however
+many stores there are. Reports are built in a temporary directory and renamed
+to REPORT_DIR/<date> when complete.
+
+The snapshot must be current: its `ingest_stamp` has to match the latest
+successful ingestion in `ingestion_logs` (the check the API makes before
+serving a snapshot), otherwise generation fails with StaleSnapshot rather
+than distributing the previous day's figures. `--allow-stale` skips the check.
+
+Requires: xlsxwriter, pymongo (via mongo_store), pyroaring (via store_metrics)
+
+Configuration (environment):
+    SNAPSHOT_DIR              backend/data/snapshots (same as the API)
+    REPORT_DIR                backend/data/reports
+
+Usage:
+    python dsr_report.py                         # all stores + consolidated, latest snapshot
+    python dsr_report.py --store "Jacadi MOA" --out /tmp/dsr
+    python dsr_report.py --allow-stale                   # from whatever snapshot is current
+"""
+
+import os
+import gc
+import re
+import sys
+import gzip
+import json
+import time
+import shutil
+import logging
+import argparse
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join(BASE_DIR, "data", "snapshots"))
+REPORT_DIR = os.environ.get("REPORT_DIR", os.path.join(BASE_DIR, "data", "reports"))
+
+ALL_SCOPE = "__all__"
+STORE_KPI_TAB = "store-kpis"
+
+# Indian digit grouping (12,34,567), as the dashboard's en-IN number formatting
+INR = '[>=10000000]"₹"##\\,##\\,##\\,##0;[>=100000]"₹"##\\,##\\,##0;"₹"##,##0'
+FORMATS = {
+    "money": {"num_format": INR},
+    "count": {"num_format": '[>=100000]##\\,##\\,##0;##,##0'},
+    "pct": {"num_format": '0.0"%"'},
+    "ratio": {"num_format": "0.00"},
+    "text": {},
+}
+
+
+def growth(current, previous) -> float:
+    """Same as the dashboard: 0 when there is no previous value"""
+    return (current - previous) / previous * 100 if previous else 0
+
+
+def ratio(numerator, denominator, scale: float = 1) -> float:
+    return numerator / denominator * scale if denominator else 0
+
+
+def col(header: str, kind: str, value, total=None) -> tuple:
+    """
+    A sheet column: `value(row)` for store rows and `total(sums)` for the TOTAL
+    row, where `sums` adds up every numeric field over the store rows.
+    Defaults to `value` (sums, or figures derived from sums); False leaves it blank.
+    """
+    if isinstance(value, str):
+        field = value
+        value = lambda r: r.get(field) or 0  # noqa: E731
+    return header, kind, value, value if total is None else total
+
+
+def mtd_sale(r):
+    return (r.get("MTD_RETAIL_SALE") or 0) + (r.get("MTD_WHATSAPP_SALE") or 0)
+
+
+def pm_sale(r):
+    return (r.get("PM_RETAIL_SALE") or 0) + (r.get("PM_WHATSAPP_SALE") or 0)
+
+
+def mtd_trx(r):
+    return (r.get("MTD_RETAIL_TRX") or 0) + (r.get("MTD_WHATSAPP_TRX") or 0)
+
+
+def pm_trx(r):
+    return (r.get("PM_RETAIL_TRX") or 0) + (r.get("PM_WHATSAPP_TRX") or 0)
+
+
+def is_active(r) -> bool:
+    """Rows the Retail Sales tab shows: any sales activity in the MTD, PM or YTD windows"""
+    return sum(abs(r.get(k) or 0) for k in (
+        "MTD_RETAIL_SALE", "MTD_WHATSAPP_SALE", "PM_RETAIL_SALE", "PM_WHATSAPP_SALE", "YTD_SALE")) > 1
+
+
+def sale_growth(r):
+    return growth(r.get("MTD_SALE") or 0, r.get("PM_SALE") or 0)
+
+
+def trx_growth(r):
+    return growth(r.get("MTD_TRX") or 0, r.get("PM_TRX") or 0)
+
+
+# (sheet name, snapshot tab, title, columns, row filter); the KPI summary sheet is written separately
+SHEETS = (
+    ("Retail Sales", "retail-performance", "Retail + Whatsapp Sales", (
+        col("Location", "text", "Location", False),
+        col("MTD Sale", "money", mtd_sale),
+        col("MTD Qty", "count", "MTD_QTY"),
+        col("MTD TRX", "count", mtd_trx),
+        col("PM Sale", "money", pm_sale),
+        col("PM Qty", "count", "PM_QTY"),
+        col("PM TRX", "count", pm_trx),
+        col("Sale Growth %", "pct", lambda r: growth(mtd_sale(r), pm_sale(r))),
+        col("TRX Growth %", "pct", lambda r: growth(mtd_trx(r), pm_trx(r))),
+        col("YTD Sale", "money", "YTD_SALE"),
+        col("YTD TRX", "count", "YTD_TRX"),
+    ), is_active),
+    ("Conversions", "retail-efficiency", "Retail + Whatsapp Sales (Conversions)", (
+        col("Location", "text", "Location", False),
+        col("MTD Footfall", "count", "MTD_FOOTFALL"),
+        col("PM Footfall", "count", "PM_FOOTFALL"),
+        # Store rows carry the API's figures; the TOTAL row re-derives them from the raw sums
+        col("MTD Conversion %", "pct", "MTD_CONVERSION_PCT", lambda s: ratio(s["MTD_RAW_TRX"], s["MTD_FOOTFALL"], 100)),
+        col("PM Conversion %", "pct", "PM_CONVERSION_PCT", lambda s: ratio(s["PM_RAW_TRX"], s["PM_FOOTFALL"], 100)),
+        col("MTD ATV", "money", "MTD_ATV", lambda s: ratio(s["MTD_RAW_SALE"], s["MTD_RAW_TRX"])),
+        col("PM ATV", "money", "PM_ATV", lambda s: ratio(s["PM_RAW_SALE"], s["PM_RAW_TRX"])),
+        col("MTD Basket Size", "ratio", "MTD_BASKET_SIZE", lambda s: ratio(s["MTD_RAW_QTY"], s["MTD_RAW_TRX"])),
+        col("PM Basket Size", "ratio", "PM_BASKET_SIZE", lambda s: ratio(s["PM_RAW_QTY"], s["PM_RAW_TRX"])),
+        col("MTD Multies %", "pct", "MTD_MULTIES_PCT", lambda s: ratio(s["MTD_RAW_MULTI_TRX"], s["MTD_RAW_TRX"], 100)),
+        col("PM Multies %", "pct", "PM_MULTIES_PCT", lambda s: ratio(s["PM_RAW_MULTI_TRX"], s["PM_RAW_TRX"], 100)),
+    ), None),
+    ("Whatsapp Sale", "whatsapp-sales-breakdown", "Whatsapp Sales", (
+        col("Location", "text", "Location", False),
+        col("MTD Retail Sales", "money", "MTD_RETAIL_SALES"),
+        col("MTD Whatsapp Sales", "money", "MTD_WHATSAPP_SALES"),
+        col("MTD Whatsapp Share %", "pct", lambda r: ratio(
+            r.get("MTD_WHATSAPP_SALES") or 0,
+            (r.get("MTD_RETAIL_SALES") or 0) + (r.get("MTD_WHATSAPP_SALES") or 0), 100)),
+        col("PM Retail Sales", "money", "PM_RETAIL_SALES"),
+        col("PM Whatsapp Sales", "money", "PM_WHATSAPP_SALES"),
+    ), None),
+    ("Omni TM-LM", "omni-channel-tm-lm", "Omni Channel TM vs LM", (
+        col("Location", "text", "Location", False),
+        col("MTD Sale", "money", "MTD_SALE"),
+        col("PM Sale", "money", "PM_SALE"),
+        col("Sale Growth %", "pct", sale_growth),
+        col("MTD TRX", "count", "MTD_TRX"),
+        col("PM TRX", "count", "PM_TRX"),
+        col("TRX Growth %", "pct", trx_growth),
+    ), None),
+    ("Omni Channel", "omni-channel-details", "Omni Channel", (
+        col("Location", "text", "Location", False),
+        col("MTD Sale", "money", "MTD_SALE"),
+        col("MTD TRX", "count", "MTD_TRX"),
+        col("PM Sale", "money", "PM_SALE"),
+        col("PM TRX", "count", "PM_TRX"),
+        col("Sale Growth %", "pct", sale_growth),
+        col("TRX Growth %", "pct", trx_growth),
+        col("MTD ATV", "money", lambda r: ratio(r.get("MTD_SALE") or 0, r.get("MTD_TRX") or 0)),
+        col("MTD Basket", "ratio", lambda r: ratio(r.get("MTD_UNITS") or 0, r.get("MTD_TRX") or 0)),
+    ), None),
+    ("Retail+Omni", "retail-omni-total", "Retail + Omni", (
+        col("Location", "text", "Location", False),
+        col("MTD Sale", "money", "MTD_SALE"),
+        col("MTD TRX", "count", "MTD_TRX"),
+        col("PM Sale", "money", "PM_SALE"),
+        col("PM TRX", "count", "PM_TRX"),
+        col("Sale Growth %", "pct", sale_growth),
+        col("TRX Growth %", "pct", trx_growth),
+        col("YTD Sale", "money", "YTD_SALE"),
+        col("YTD TRX", "count", "YTD_TRX"),
+    ), None),
+    # Not a snapshot tab: rows come from store_metrics.py with its own total row (TRX is the union of bills)
+    ("Store KPIs", STORE_KPI_TAB, "Store KPIs", (
+        col("Location", "text", "location_name", False),
+        col("Net Sales", "money", "nett_sales"),
+        col("Units", "count", "sales_qty"),
+        col("Bills", "count", "trx"),
+        col("ATV", "money", "atv"),
+        col("UPT", "ratio", "upt"),
+    ), None),
+)
+
+SUMMARY_ROWS = (
+    ("Total Revenue", "money", lambda s: s.get("total_revenue") or 0),
+    ("Transactions", "count", lambda s: s.get("total_transactions") or 0),
+    ("Avg Transaction", "money", lambda s: s.get("avg_transaction_value") or 0),
+    ("PM Revenue", "money", lambda s: s.get("pm_revenue") or 0),
+    ("PM Transactions", "count", lambda s: s.get("pm_transactions") or 0),
+    ("PM Avg Transaction", "money", lambda s: s.get("pm_atv") or 0),
+    ("Revenue Growth %", "pct", lambda s: growth(s.get("total_revenue") or 0, s.get("pm_revenue") or 0)),
+    ("Active Stores", "count", lambda s: s.get("total_locations") or 0),
+)
+
+
+# --- Snapshots ---------------------------------------------------------------
+
+class StaleSnapshot(RuntimeError):
+    """The current snapshot was rendered before the latest successful ingestion"""
+
+
+def iso_stamp(value) -> str:
+    """created_at as the API stamps it (Date.toISOString: UTC, milliseconds)"""
+    if not isinstance(value, datetime):
+        return str(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def latest_ingest_stamp(db):
+    latest = db.ingestion_logs.find_one({"status": "success"}, {"created_at": 1}, sort=[("created_at", -1)])
+    return iso_stamp(latest["created_at"]) if latest else None
+
+
+def check_fresh(manifest: dict, db):
+    stamp = latest_ingest_stamp(db)
+    if manifest.get("ingest_stamp") != stamp:
+        raise StaleSnapshot(f"Snapshot {manifest['version']} was rendered for ingestion "
+                            f"{manifest.get('ingest_stamp')}, the latest is {stamp}; re-render the snapshots first")
+
+
+def load_manifest(snapshot_dir: str = SNAPSHOT_DIR) -> dict:
+    path = os.path.join(snapshot_dir, "current.json")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No snapshot manifest at {path}; snapshots are rendered after ingestion")
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_tab(snapshot_dir: str, manifest: dict, tab: str, scope: str):
+    entry = manifest["files"].get(f"{tab}|{scope}")
+    if entry is None:
+        return None
+    with gzip.open(os.path.join(snapshot_dir, manifest["version"], entry["file"]), "rt") as f:
+        return json.load(f)
+
+
+def snapshot_scopes(manifest: dict) -> list:
+    """Store names with a rendered snapshot, in dashboard order"""
+    return sorted({key.split("|", 1)[1] for key in manifest["files"]} - {ALL_SCOPE})
+
+
+def load_scope(snapshot_dir: str, manifest: dict, scope: str) -> dict:
+    """The summary and every sheet's dataset for one scope"""
+    datasets = {"summary": load_tab(snapshot_dir, manifest, "summary", scope) or {}}
+    for _, tab, _, _, _ in SHEETS:
+        if tab != STORE_KPI_TAB:
+            datasets[tab] = load_tab(snapshot_dir, manifest, tab, scope) or []
+    return datasets
+
+
+# --- Workbooks ---------------------------------------------------------------
+
+def sums(rows: list) -> dict:
+    totals = {}
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def write_workbook(path: str, label: str, manifest: dict, datasets: dict, with_total: bool):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        title = workbook.add_format({"bold": True, "font_size": 14})
+        subtitle = workbook.add_format({"italic": True, "font_color": "#64748B"})
+        header = workbook.add_format({"bold": True, "bg_color": "#F1F5F9", "bottom": 1, "text_wrap": True})
+        cells = {kind: workbook.add_format(spec) for kind, spec in FORMATS.items()}
+        totals = {kind: workbook.add_format({**spec, "bold": True, "top": 1, "bg_color": "#E2E8F0"})
+                  for kind, spec in FORMATS.items()}
+        period = f"{manifest['start_date']} to {manifest['date']}"
+
+        # constant_memory flushes each row when the next one starts, so every sheet is written top to bottom
+        sheet = workbook.add_worksheet("Summary")
+        sheet.set_column(0, 0, 24)
+        sheet.set_column(1, 1, 18)
+        sheet.write(0, 0, f"DSR - {label}", title)
+        sheet.write(1, 0, period, subtitle)
+        for i, (name, kind, value) in enumerate(SUMMARY_ROWS):
+            sheet.write(3 + i, 0, name, header)
+            sheet.write_number(3 + i, 1, value(datasets["summary"]), cells[kind])
+
+        for name, tab, heading, columns, keep in SHEETS:
+            rows = [r for r in datasets[tab] if keep is None or keep(r)]
+            sheet = workbook.add_worksheet(name)
+            sheet.set_column(0, 0, 28)
+            sheet.set_column(1, len(columns) - 1, 14)
+            sheet.freeze_panes(4, 1)
+            sheet.write(0, 0, f"{heading} - {label}", title)
+            sheet.write(1, 0, period, subtitle)
+            for c, (text, _, _, _) in enumerate(columns):
+                sheet.write(3, c, text, header)
+
+            for r, row in enumerate(rows, start=4):
+                for c, (_, kind, value, _) in enumerate(columns):
+                    if kind == "text":
+                        sheet.write_string(r, c, str(value(row) or ""), cells[kind])
+                    else:
+                        sheet.write_number(r, c, value(row), cells[kind])
+
+            if with_total and rows:
+                summed, r = datasets.get("totals", {}).get(tab) or sums(rows), 4 + len(rows)
+                for c, (_, kind, _, total) in enumerate(columns):
+                    if c == 0:
+                        sheet.write_string(r, c, "TOTAL", totals["text"])
+                    elif total is False:
+                        sheet.write_blank(r, c, None, totals[kind])
+                    else:
+                        sheet.write_number(r, c, total(summed), totals[kind])
+    finally:
+        workbook.close()
+
+
+def file_label(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name, flags=re.IGNORECASE).strip("_")
+
+
+def generate_reports(snapshot_dir: str = SNAPSHOT_DIR, out_dir: str = REPORT_DIR, stores=None,
+                     db=None, allow_stale: bool = False, workers: int = None) -> dict:
+    """Consolidated and per-store workbooks for the current snapshot into out_dir/<date>"""
+    import store_metrics
+
+    started = time.monotonic()
+    manifest = load_manifest(snapshot_dir)
+    if db is None:
+        import mongo_store
+
+        db = mongo_store.get_db()
+    if allow_stale:
+        logger.warning(f"Not checking snapshot {manifest['version']} against the latest ingestion")
+    else:
+        check_fresh(manifest, db)
+    date = manifest["date"]
+    scopes = snapshot_scopes(manifest)
+    if stores:
+        unknown = set(stores) - set(scopes)
+        if unknown:
+            raise ValueError(f"No snapshot for store(s): {', '.join(sorted(unknown))}")
+        scopes = [s for s in scopes if s in stores]
+
+    kpis = store_metrics.store_metrics(db, manifest["start_date"], date, workers or store_metrics.WORKERS,
+                                       locations=stores)
+    kpi_rows = {row["location_name"]: row for row in kpis["stores"]}
+
+    target = os.path.join(out_dir, date)
+    building = f"{target}.building-{os.getpid()}"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    files = []
+    try:
+        if not stores:
+            name = f"DSR_{date}_All_Stores.xlsx"
+            datasets = load_scope(snapshot_dir, manifest, ALL_SCOPE)
+            datasets.update({STORE_KPI_TAB: kpis["stores"], "totals": {STORE_KPI_TAB: kpis["total"]}})
+            write_workbook(os.path.join(building, name), "All Stores", manifest, datasets, with_total=True)
+            files.append(name)
+        for store in scopes:
+            name = f"DSR_{date}_{file_label(store)}.xlsx"
+            datasets = load_scope(snapshot_dir, manifest, store)
+            datasets[STORE_KPI_TAB] = [kpi_rows[store]] if store in kpi_rows else []
+            write_workbook(os.path.join(building, name), store, manifest, datasets, with_total=False)
+            files.append(name)
+            # A closed workbook is a web of reference cycles; free it before the next instead of at the GC's pace
+            gc.collect()
+    except Exception:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+    if stores and os.path.isdir(target):
+        # A partial run only replaces its own stores' workbooks
+        for name in files:
+            os.replace(os.path.join(building, name), os.path.join(target, name))
+        shutil.rmtree(building)
+    else:
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(building, target)
+
+    seconds = round(time.monotonic() - started, 2)
+    logger.info(f"Wrote {len(files)} DSR workbooks for {date} to {target} in {seconds}s")
+    return {"date": date, "dir": target, "files": files, "seconds": seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the DSR Excel workbooks from the current snapshots")
+    parser.add_argument("--snapshot-dir", type=str, default=SNAPSHOT_DIR)
+    parser.add_argument("--out", type=str, default=REPORT_DIR, help="Report root directory")
+    parser.add_argument("--store", action="append", help="Only these store(s), without the consolidated file")
+    parser.add_argument("--allow-stale", action="store_true", help="Skip the snapshot freshness check")
+    args = parser.parse_args()
+
+    try:
+        result = generate_reports(args.snapshot_dir, args.out, args.store, allow_stale=args.allow_stale)
+    except (FileNotFoundError, ValueError, StaleSnapshot) as e:
+        logger.error(str(e))
+        sys.exit(1)
+    print(f"SUCCESS: {len(result['files'])} workbooks in {result['dir']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 """
 Surecount Footfall Report Automation Script
-Downloads hourly footfall data from deki.surecount.in portal
+Downloads hourly footfall data from deki.surecount.in portal.
+
+Usage:
+    python fetch_footfall_report.py
+    python -m jacadi_dsr fetch footfall [--json]
 """
 
 import os
 import logging
 from datetime import datetime, timedelta
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Configuration from environment variables
@@ -52,6 +53,8 @@ def download_footfall_report():
     Automates the download of hourly footfall report from Surecount portal.
     Returns the path to the downloaded file.
     """
+    from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+
     # Ensure download directory exists
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
     
@@ -179,6 +182,7 @@ def download_footfall_report():
             browser.close()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     try:
         filepath = download_footfall_report()
         print(f"SUCCESS: Downloaded {filepath}")
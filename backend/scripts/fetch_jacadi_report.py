@@ -1,11 +1,20 @@
+#!/usr/bin/env python3
+"""
+Olabi Invoice Report Automation Script
+Downloads the Invoice Detail report for one day from the Olabi portal into DATA_INPUT_DIR.
+Playwright is imported when a download starts, so importing this module is cheap.
+
+Usage:
+    python fetch_jacadi_report.py [--date YYYY-MM-DD]     # default: yesterday
+    python -m jacadi_dsr fetch olabi [--date YYYY-MM-DD] [--json]
+"""
+
 import os
-import time
 import shutil
 import logging
 import sys
 import argparse
 from datetime import datetime, timedelta
-from playwright.sync_api import sync_playwright
 
 # --- CONFIG ---
 USERNAME = os.environ.get("OLABI_USERNAME", "")
@@ -15,8 +24,6 @@ INPUT_REPORTS_DIR = os.path.join(BASE_DIR, "input_reports")
 DATA_INPUT_DIR = os.environ.get("DATA_INPUT_DIR", os.path.join(BASE_DIR, "data_input"))
 DOCUMENT_TYPE = "Sales Including Returns"
 
-# Setup Logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 def clean_input_dir():
@@ -26,22 +33,14 @@ def clean_input_dir():
             os.makedirs(dir_path)
             logger.info(f"Created {dir_path}")
 
-def run_download():
-    clean_input_dir()
-    
-    parser = argparse.ArgumentParser(description='Download Jacadi Report')
-    parser.add_argument('--date', type=str, help='Date in YYYY-MM-DD format', default=None)
-    args = parser.parse_args()
+def download_report(target_date: datetime = None) -> str:
+    """Downloads the Invoice Detail report for `target_date` (default yesterday); returns the file path"""
+    from playwright.sync_api import sync_playwright
 
-    if args.date:
-        try:
-            target_date = datetime.strptime(args.date, "%Y-%m-%d")
-        except ValueError:
-            logger.error("Invalid date format. Use YYYY-MM-DD")
-            sys.exit(1)
-    else:
+    clean_input_dir()
+    if target_date is None:
         target_date = datetime.now() - timedelta(days=1)
-        
+
     date_str = target_date.strftime("%Y-%m-%d")
     dmy_str = target_date.strftime("%d/%m/%Y")
     
@@ -225,14 +224,34 @@ def run_download():
             shutil.move(temp_path, final_path)
             
             logger.info(f"SUCCESS: {final_path}")
-            print(f"SUCCESS: {final_path}")
+            return final_path
             
         except Exception as e:
             logger.error(f"Automation Failed: {e}")
             page.screenshot(path=os.path.join(BASE_DIR, "error_screenshot.png"))
-            sys.exit(1)
+            raise
         finally:
             browser.close()
 
+def run_download():
+    parser = argparse.ArgumentParser(description='Download Jacadi Report')
+    parser.add_argument('--date', type=str, help='Date in YYYY-MM-DD format', default=None)
+    args = parser.parse_args()
+
+    target_date = None
+    if args.date:
+        try:
+            target_date = datetime.strptime(args.date, "%Y-%m-%d")
+        except ValueError:
+            logger.error("Invalid date format. Use YYYY-MM-DD")
+            sys.exit(1)
+
+    try:
+        final_path = download_report(target_date)
+    except Exception:
+        sys.exit(1)
+    print(f"SUCCESS: {final_path}")
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     run_download()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Fiscal Calendar / Date Dimension
+Precomputes one row per calendar day with the financial year (April start),
+FY week, prior-month and prior-year equivalent dates and trading-day flags,
+so period windows (MTD / PM / PY / YTD) resolve with a single lookup.
+The API writes it at startup through `python -m jacadi_dsr calendar` and
+loads it in calendar.service.ts.
+
+Usage:
+    python fiscal_calendar.py                      # FY2020-21 .. FY2029-30
+    python fiscal_calendar.py --first-fy 2022 --years 10 --out /tmp/date_dim.json
+"""
+
+import os
+import json
+import argparse
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATE_DIM_PATH = os.environ.get("DATE_DIM_PATH", os.path.join(BASE_DIR, "data", "date_dim.json"))
+
+FY_START_MONTH = 4  # April
+DEFAULT_FIRST_FY = 2020
+DEFAULT_YEARS = 10
+
+# Comma separated YYYY-MM-DD dates on which stores did not trade (e.g. "2026-03-14,2026-10-20")
+NON_TRADING_DATES = {d.strip() for d in os.environ.get("NON_TRADING_DATES", "").split(",") if d.strip()}
+
+
+def parse_date(value) -> date:
+    """Accepts a date or a YYYY-MM-DD string"""
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def fy_start_year(d: date) -> int:
+    """Calendar year in which the financial year containing `d` starts"""
+    return d.year if d.month >= FY_START_MONTH else d.year - 1
+
+
+def shift_months(d: date, months: int) -> date:
+    """Moves `d` by whole months, clamping to the last day of the target month (Mar 31 -> Feb 28)"""
+    month_index = d.year * 12 + (d.month - 1) + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(d.day, monthrange(year, month)[1]))
+
+
+def shift_years(d: date, years: int) -> date:
+    """Moves `d` by whole years, clamping Feb 29 to Feb 28"""
+    return shift_months(d, years * 12)
+
+
+def build_row(d: date) -> dict:
+    """Builds the date-dimension row for a single day"""
+    fy = fy_start_year(d)
+    fy_start = date(fy, FY_START_MONTH, 1)
+    fy_day = (d - fy_start).days + 1
+    iso = d.isoformat()
+
+    return {
+        "date": iso,
+        "fy": fy,
+        "fy_label": f"FY{fy}-{str(fy + 1)[-2:]}",
+        "fy_start": fy_start.isoformat(),
+        "fy_day": fy_day,
+        "fy_week": (fy_day - 1) // 7 + 1,
+        "month": iso[:7],
+        "month_start": iso[:8] + "01",
+        "day_of_week": d.isoweekday(),
+        "pm_date": shift_months(d, -1).isoformat(),
+        "py_date": shift_years(d, -1).isoformat(),
+        "is_month_end": d.day == monthrange(d.year, d.month)[1],
+        "is_weekend": d.isoweekday() >= 6,
+        "is_trading_day": iso not in NON_TRADING_DATES,
+    }
+
+
+def build_date_dim(first_fy: int = DEFAULT_FIRST_FY, years: int = DEFAULT_YEARS) -> list:
+    """Generates the dense date dimension covering `years` financial years from `first_fy`"""
+    start = date(first_fy, FY_START_MONTH, 1)
+    end = date(first_fy + years, FY_START_MONTH, 1)
+    rows = []
+    d = start
+    while d < end:
+        rows.append(build_row(d))
+        d += timedelta(days=1)
+    return rows
+
+
+class FiscalCalendar:
+    """In-memory date dimension indexed by ISO date string"""
+
+    def __init__(self, rows: list):
+        self.rows = {row["date"]: row for row in rows}
+
+    def lookup(self, value) -> dict:
+        """Returns the row for a date, computing it on the fly outside the precomputed range"""
+        key = parse_date(value).isoformat()
+        row = self.rows.get(key)
+        if row is None:
+            row = build_row(parse_date(key))
+        return row
+
+    def period_windows(self, end_date, start_date=None) -> dict:
+        """
+        Resolves the reporting windows for a selected end date (and optional start date).
+        Keys mirror getReportingDates in etl.service.ts.
+        """
+        end = self.lookup(end_date)
+        start = self.lookup(start_date) if start_date else self.lookup(end["month_start"])
+
+        return {
+            "selectedDate": end["date"],
+            "startOfMonth": start["date"],
+            "startOfPM": start["pm_date"],
+            "endOfPM": end["pm_date"],
+            "startOfPY": start["py_date"],
+            "endOfPY": end["py_date"],
+            "startOfFY": end["fy_start"],
+        }
+
+
+_calendar = None
+
+
+def get_calendar() -> FiscalCalendar:
+    """Loads the date dimension once per process (from DATE_DIM_PATH if present)"""
+    global _calendar
+    if _calendar is None:
+        rows = None
+        if os.path.exists(DATE_DIM_PATH):
+            with open(DATE_DIM_PATH, "r", encoding="utf-8") as f:
+                rows = json.load(f).get("rows")
+        _calendar = FiscalCalendar(rows or build_date_dim())
+    return _calendar
+
+
+def write_date_dim(path: str, first_fy: int = DEFAULT_FIRST_FY, years: int = DEFAULT_YEARS) -> int:
+    """Writes the date dimension as JSON for the Node API to load at startup"""
+    rows = build_date_dim(first_fy, years)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "generated_at": datetime.now().isoformat(),
+            "first_fy": first_fy,
+            "years": years,
+            "rows": rows,
+        }, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the fiscal date dimension")
+    parser.add_argument("--first-fy", type=int, default=DEFAULT_FIRST_FY, help="Start year of the first FY (April)")
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS, help="Number of financial years to generate")
+    parser.add_argument("--out", type=str, default=DATE_DIM_PATH, help="Output JSON path")
+    args = parser.parse_args()
+
+    count = write_date_dim(args.out, args.first_fy, args.years)
+    print(f"SUCCESS: Wrote {count} days to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
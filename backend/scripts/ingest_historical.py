@@ -1,156 +1,134 @@
 #!/usr/bin/env python3
 """
-Script to ingest historical data CSV files into SQLite database.
+Script to ingest historical data CSV files into MongoDB.
+Rows are written with unordered bulk upserts through mongo_store; the upsert
+keys are indexed first so every upsert is an index lookup, not a collection scan.
 """
-import sqlite3
 import csv
 import os
-from datetime import datetime
+
+from loaders import invalidate_rollup_days, parse_invoice_hour
+from mongo_store import bulk_upsert, get_db
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DB_PATH = os.path.join(BASE_DIR, 'data.db')
 DATA_INPUT_DIR = os.path.join(BASE_DIR, 'data_input')
 
-def ingest_sales_transactions(csv_path):
-    """Ingest sales transactions from CSV"""
-    print(f"Ingesting sales transactions from: {csv_path}")
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Count existing records
-    cursor.execute("SELECT COUNT(*) FROM sales_transactions")
-    before_count = cursor.fetchone()[0]
-    print(f"Records before: {before_count}")
-    
-    inserted = 0
-    skipped = 0
-    
+INT_FIELDS = ('total_sales_qty',)
+FLOAT_FIELDS = (
+    'unit_mrp', 'invoice_mrp_value', 'invoice_discount_value', 'invoice_discount_pct',
+    'invoice_basic_value', 'total_tax_pct', 'total_tax_amt', 'nett_invoice_value'
+)
+SALES_FIELDS = (
+    'id', 'invoice_no', 'invoice_date', 'invoice_month', 'invoice_time', 'transaction_type',
+    'order_channel_code', 'order_channel_name', 'invoice_channel_code', 'invoice_channel_name',
+    'sub_channel_code', 'sub_channel_name', 'location_code', 'location_name', 'store_type',
+    'city', 'state', 'sales_person_code', 'sales_person_name', 'consumer_code',
+    'consumer_name', 'consumer_mobile', 'product_code', 'product_name', 'category_name',
+    'brand_name', 'created_at'
+)
+
+
+def to_sales_doc(row):
+    doc = {field: row[field] for field in SALES_FIELDS}
+    for field in INT_FIELDS:
+        doc[field] = int(float(row[field])) if row[field] else 0
+    for field in FLOAT_FIELDS:
+        doc[field] = float(row[field]) if row[field] else 0
+    doc['mh1_description'] = row.get('mh1_description', '')
+    doc['invoice_hour'] = parse_invoice_hour(row['invoice_time'])
+    return doc
+
+
+def read_docs(csv_path, convert):
     with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        for row in reader:
+        for row in csv.DictReader(f):
             try:
-                # Check if record already exists
-                cursor.execute("SELECT id FROM sales_transactions WHERE id = ?", (row['id'],))
-                if cursor.fetchone():
-                    skipped += 1
-                    continue
-                
-                cursor.execute("""
-                    INSERT INTO sales_transactions (
-                        id, invoice_no, invoice_date, invoice_month, invoice_time, transaction_type,
-                        order_channel_code, order_channel_name, invoice_channel_code, invoice_channel_name,
-                        sub_channel_code, sub_channel_name, location_code, location_name, store_type,
-                        city, state, total_sales_qty, unit_mrp, invoice_mrp_value, invoice_discount_value,
-                        invoice_discount_pct, invoice_basic_value, total_tax_pct, total_tax_amt,
-                        nett_invoice_value, sales_person_code, sales_person_name, consumer_code,
-                        consumer_name, consumer_mobile, product_code, product_name, category_name,
-                        brand_name, created_at, mh1_description
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    row['id'], row['invoice_no'], row['invoice_date'], row['invoice_month'], row['invoice_time'],
-                    row['transaction_type'], row['order_channel_code'], row['order_channel_name'],
-                    row['invoice_channel_code'], row['invoice_channel_name'], row['sub_channel_code'],
-                    row['sub_channel_name'], row['location_code'], row['location_name'], row['store_type'],
-                    row['city'], row['state'],
-                    int(float(row['total_sales_qty'])) if row['total_sales_qty'] else 0,
-                    float(row['unit_mrp']) if row['unit_mrp'] else 0,
-                    float(row['invoice_mrp_value']) if row['invoice_mrp_value'] else 0,
-                    float(row['invoice_discount_value']) if row['invoice_discount_value'] else 0,
-                    float(row['invoice_discount_pct']) if row['invoice_discount_pct'] else 0,
-                    float(row['invoice_basic_value']) if row['invoice_basic_value'] else 0,
-                    float(row['total_tax_pct']) if row['total_tax_pct'] else 0,
-                    float(row['total_tax_amt']) if row['total_tax_amt'] else 0,
-                    float(row['nett_invoice_value']) if row['nett_invoice_value'] else 0,
-                    row['sales_person_code'], row['sales_person_name'], row['consumer_code'],
-                    row['consumer_name'], row['consumer_mobile'], row['product_code'], row['product_name'],
-                    row['category_name'], row['brand_name'], row['created_at'], row.get('mh1_description', '')
-                ))
-                inserted += 1
-                
-                if inserted % 1000 == 0:
-                    print(f"  Inserted {inserted} records...")
-                    conn.commit()
-                    
+                yield convert(row)
             except Exception as e:
                 print(f"  Error on row: {e}")
-                continue
-    
-    conn.commit()
-    
-    # Count after
-    cursor.execute("SELECT COUNT(*) FROM sales_transactions")
-    after_count = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    print(f"Records after: {after_count}")
+
+
+def ensure_indexes(db):
+    """Indexes on the upsert keys, before any row is loaded"""
+    db.sales_transactions.create_index('id', sparse=True)
+    db.location_efficiency.create_index([('location_name', 1), ('report_date', 1)], unique=True)
+
+
+def ingest_sales_transactions(csv_path):
+    """Ingest sales transactions from CSV (existing ids are left untouched)"""
+    print(f"Ingesting sales transactions from: {csv_path}")
+
+    ensure_indexes(get_db())
+    collection = get_db().sales_transactions
+    before_count = collection.estimated_document_count()
+    print(f"Records before: {before_count}")
+
+    dates = set()
+
+    def track_dates(docs):
+        for doc in docs:
+            dates.add(doc['invoice_date'])
+            yield doc
+
+    result = bulk_upsert(collection, track_dates(read_docs(csv_path, to_sales_doc)), ('id',), operator='$setOnInsert')
+    inserted = result['upserted']
+    skipped = result['matched']
+    invalidate_rollup_days(get_db(), dates)
+
+    print(f"Records after: {collection.estimated_document_count()}")
     print(f"Inserted: {inserted}, Skipped (duplicates): {skipped}")
     return inserted
 
+
+def to_efficiency_doc(row):
+    return {
+        'id': row['id'],
+        'location_name': row['location_name'],
+        'report_date': row['report_date'],
+        'footfall': int(row['footfall']) if row['footfall'] else 0,
+        'conversion_pct': float(row['conversion_pct']) if row['conversion_pct'] else 0,
+        'multies_pct': float(row['multies_pct']) if row['multies_pct'] else 0,
+        'pm_footfall': int(row['pm_footfall']) if row['pm_footfall'] else 0,
+        'pm_conversion_pct': float(row['pm_conversion_pct']) if row['pm_conversion_pct'] else 0,
+        'pm_multies_pct': float(row['pm_multies_pct']) if row['pm_multies_pct'] else 0,
+    }
+
+
 def ingest_location_efficiency(csv_path):
-    """Ingest location efficiency from CSV"""
+    """Ingest location efficiency from CSV (upsert on location + report date)"""
     print(f"\nIngesting location efficiency from: {csv_path}")
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    inserted = 0
-    updated = 0
-    
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        for row in reader:
-            try:
-                # Use INSERT OR REPLACE for upsert
-                cursor.execute("""
-                    INSERT OR REPLACE INTO location_efficiency (
-                        id, location_name, report_date, footfall, conversion_pct, multies_pct,
-                        pm_footfall, pm_conversion_pct, pm_multies_pct
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    row['id'], row['location_name'], row['report_date'],
-                    int(row['footfall']) if row['footfall'] else 0,
-                    float(row['conversion_pct']) if row['conversion_pct'] else 0,
-                    float(row['multies_pct']) if row['multies_pct'] else 0,
-                    int(row['pm_footfall']) if row['pm_footfall'] else 0,
-                    float(row['pm_conversion_pct']) if row['pm_conversion_pct'] else 0,
-                    float(row['pm_multies_pct']) if row['pm_multies_pct'] else 0
-                ))
-                inserted += 1
-                
-            except Exception as e:
-                print(f"  Error on row: {e}")
-                continue
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"Inserted/Updated: {inserted}")
-    return inserted
+    ensure_indexes(get_db())
+
+    result = bulk_upsert(
+        get_db().location_efficiency,
+        read_docs(csv_path, to_efficiency_doc),
+        ('location_name', 'report_date'),
+    )
+    count = result['upserted'] + result['matched']
+
+    print(f"Inserted/Updated: {count}")
+    return count
 
 if __name__ == "__main__":
     print("=" * 60)
     print("Historical Data Ingestion")
     print("=" * 60)
-    
+
     sales_csv = os.path.join(DATA_INPUT_DIR, 'historical_sales_transactions.csv')
     efficiency_csv = os.path.join(DATA_INPUT_DIR, 'historical_location_efficiency.csv')
-    
+
     if os.path.exists(sales_csv):
         sales_count = ingest_sales_transactions(sales_csv)
     else:
         print(f"Sales CSV not found: {sales_csv}")
         sales_count = 0
-    
+
     if os.path.exists(efficiency_csv):
         efficiency_count = ingest_location_efficiency(efficiency_csv)
     else:
         print(f"Efficiency CSV not found: {efficiency_csv}")
         efficiency_count = 0
-    
+
     print("\n" + "=" * 60)
     print(f"TOTAL: {sales_count} sales transactions, {efficiency_count} efficiency records")
     print("=" * 60)
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Ingestion Watch-Folder Daemon
+Watches DATA_INPUT_DIR (inotify when `inotify_simple` is installed, polling
+otherwise), waits until each file has stopped changing, classifies it as an
+invoice, footfall or efficiency report by sniffing its header and hands it to
+a worker pool. Files are deduplicated by SHA-256 content hash against
+`ingestion_logs`, then archived to DATA_ARCHIVE_DIR. Files that cannot be
+read, have an unknown layout or fail to load are moved to INGEST_FAILED_DIR,
+so they are reported once instead of on every scan; move a fixed file back
+into the input folder to retry it.
+
+Invoice files run on a single ordered lane (last file wins per invoice);
+footfall and efficiency files share a parallel pool. The watcher refreshes
+the rollups itself; the API's scheduler notices the new `ingestion_logs`
+entries and runs the remaining post-ingest stages (snapshots, DSR workbooks,
+query warehouse, see runPostIngest in ingestion.service.ts).
+
+Usage:
+    python ingest_watcher.py            # run until SIGTERM/SIGINT
+    python ingest_watcher.py --once     # ingest whatever is in the folder and exit
+    python ingest_watcher.py --poll     # force the polling backend
+"""
+
+import os
+import time
+import shutil
+import signal
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import loaders
+from loaders import file_sha256
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_INPUT_DIR = os.environ.get("DATA_INPUT_DIR", os.path.join(BASE_DIR, "data_input"))
+DATA_ARCHIVE_DIR = os.environ.get("DATA_ARCHIVE_DIR", os.path.join(BASE_DIR, "data_archive"))
+INGEST_FAILED_DIR = os.environ.get("INGEST_FAILED_DIR", os.path.join(DATA_INPUT_DIR, "failed"))
+
+SETTLE_SECONDS = float(os.environ.get("INGEST_SETTLE_SECONDS", "2"))
+POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL", "1"))
+WORKERS = int(os.environ.get("INGEST_WORKERS", "4"))
+
+# Partial downloads / editor temp files are never picked up
+IGNORED_SUFFIXES = (".tmp", ".part", ".crdownload", ".swp")
+
+
+def classify_header(headers) -> str:
+    """Returns 'invoice', 'footfall', 'efficiency' or None from a header row"""
+    names = {(h or "").strip().lower() for h in headers}
+    if "invoice no" in names and "nett invoice value" in names:
+        return "invoice"
+    if "store name" in names and "total in" in names:
+        return "footfall"
+    if "location" in names and any(n.startswith("mtd") for n in names):
+        return "efficiency"
+    return None
+
+
+def is_candidate(filename: str) -> bool:
+    return (
+        not filename.startswith(".")
+        and filename.lower().endswith(".csv")
+        and not filename.lower().endswith(IGNORED_SUFFIXES)
+    )
+
+
+class FileSettler:
+    """Debounces file events: a file is ready once its size and mtime hold still for `settle_seconds`"""
+
+    def __init__(self, settle_seconds: float = SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self.pending = {}
+
+    def touch(self, path: str, now: float = None):
+        now = time.monotonic() if now is None else now
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.pending.pop(path, None)
+            return
+        signature = (st.st_size, st.st_mtime_ns)
+        previous = self.pending.get(path)
+        if previous is None or previous[0] != signature:
+            self.pending[path] = (signature, now)
+
+    def ready(self, now: float = None) -> list:
+        now = time.monotonic() if now is None else now
+        done = []
+        for path in list(self.pending):
+            self.touch(path, now)
+            if path not in self.pending:
+                continue
+            (size, _), since = self.pending[path]
+            if size > 0 and now - since >= self.settle_seconds:
+                done.append(path)
+                del self.pending[path]
+        return done
+
+
+def inotify_source(directory: str):
+    """Returns a callable yielding changed paths via inotify, or None if unavailable"""
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        return None
+
+    inotify = INotify()
+    inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.MODIFY)
+
+    def read(timeout_seconds: float):
+        return [os.path.join(directory, e.name) for e in inotify.read(timeout=int(timeout_seconds * 1000)) if e.name]
+
+    return read
+
+
+def polling_source(directory: str):
+    def read(timeout_seconds: float):
+        time.sleep(timeout_seconds)
+        return [os.path.join(directory, name) for name in os.listdir(directory)]
+
+    return read
+
+
+class IngestWatcher:
+    def __init__(self, input_dir=DATA_INPUT_DIR, archive_dir=DATA_ARCHIVE_DIR, workers=WORKERS,
+                 settle_seconds=SETTLE_SECONDS, force_poll=False, db=None, failed_dir=INGEST_FAILED_DIR):
+        self.input_dir = input_dir
+        self.archive_dir = archive_dir
+        self.failed_dir = failed_dir
+        self.db = db
+        self.settler = FileSettler(settle_seconds)
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.futures = []
+        self.lanes = {
+            "invoice": ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-invoice"),
+            "default": ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest"),
+        }
+
+        os.makedirs(self.input_dir, exist_ok=True)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        source = None if force_poll else inotify_source(self.input_dir)
+        self.backend = "inotify" if source else "polling"
+        self.read_events = source or polling_source(self.input_dir)
+
+    def get_db(self):
+        return self.db if self.db is not None else loaders.get_db()
+
+    def scan(self):
+        for name in sorted(os.listdir(self.input_dir)):
+            if is_candidate(name):
+                self.settler.touch(os.path.join(self.input_dir, name))
+
+    def already_ingested(self, digest: str) -> bool:
+        return self.get_db().ingestion_logs.find_one({"content_hash": digest, "status": "success"}) is not None
+
+    def move_to(self, path: str, directory: str) -> str:
+        target = os.path.join(directory, os.path.basename(path))
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(target)
+            target = f"{stem}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}"
+        shutil.move(path, target)
+        return target
+
+    def archive(self, path: str) -> str:
+        return self.move_to(path, self.archive_dir)
+
+    def quarantine(self, path: str, reason: str):
+        """Takes a file the watcher cannot ingest out of the input folder, so it is not retried on every scan"""
+        try:
+            target = self.move_to(path, self.failed_dir)
+        except OSError as e:
+            logger.error(f"{reason}; could not move {path} aside: {e}")
+            return
+        logger.warning(f"{reason}; moved to {target}")
+
+    def dispatch(self, path: str):
+        try:
+            kind = classify_header(loaders.read_header(path))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.quarantine(path, f"Could not read {path}: {e}")
+            return
+        if kind is None:
+            self.quarantine(path, f"Unrecognised report layout: {path}")
+            return
+
+        digest = file_sha256(path)
+        with self.lock:
+            if digest in self.in_flight:
+                self.settler.touch(path)  # re-check once the identical file has been ingested
+                return
+            if self.already_ingested(digest):
+                logger.info(f"⏭️  Duplicate content ({digest[:12]}), archiving {os.path.basename(path)}")
+                self.archive(path)
+                return
+            self.in_flight.add(digest)
+
+        lane = self.lanes["invoice"] if kind == "invoice" else self.lanes["default"]
+        self.futures.append(lane.submit(self.process, path, kind, digest))
+
+    def process(self, path: str, kind: str, digest: str):
+        filename = os.path.basename(path)
+        db = self.get_db()
+        try:
+            logger.info(f"🔄 Processing {kind} file: {filename}")
+            result = loaders.LOADERS[kind](path, db)
+            db.ingestion_logs.insert_one({
+                "filename": filename,
+                "status": "success",
+                "rows_added": result["rows"],
+                "file_type": kind,
+                "content_hash": digest,
+                "source": "watcher",
+                "created_at": datetime.now(timezone.utc),
+            })
+            self.archive(path)
+            logger.info(f"✅ Ingested {result['rows']} {kind} rows from {filename}")
+            if kind == "invoice":
+                self.refresh_rollups(db)
+        except Exception as e:
+            logger.error(f"❌ Error processing {filename}: {e}")
+            db.ingestion_logs.insert_one({
+                "filename": filename,
+                "status": "failed",
+                "file_type": kind,
+                "content_hash": digest,
+                "source": "watcher",
+                "error_message": str(e),
+                "created_at": datetime.now(timezone.utc),
+            })
+            self.quarantine(path, f"Failed to ingest {filename}")
+        finally:
+            with self.lock:
+                self.in_flight.discard(digest)
+
+    def refresh_rollups(self, db):
+        try:
+            import daily_rollup
+        except ImportError as e:
+            logger.warning(f"Daily rollup unavailable ({e}), dashboards will use live aggregation")
+            return
+        for start, end in daily_rollup.find_unmarked_ranges(db):
+            daily_rollup.build_rollup(db, start, end)
+        daily_rollup.refresh_derived(db)
+
+    def run_once(self) -> int:
+        """Ingests every settled file currently in the folder, waits for the workers; returns files processed"""
+        self.scan()
+        for path in self.settler.ready(now=float("inf")):
+            self.dispatch(path)
+        processed = len(self.futures)
+        wait(self.futures)
+        self.futures = []
+        return processed
+
+    def run(self):
+        logger.info(f"👀 Watching {self.input_dir} ({self.backend}, settle {self.settler.settle_seconds}s)")
+        self.scan()
+        while not self.stopping.is_set():
+            for path in self.read_events(POLL_INTERVAL):
+                if is_candidate(os.path.basename(path)):
+                    self.settler.touch(path)
+            for path in self.settler.ready():
+                self.dispatch(path)
+            self.futures = [f for f in self.futures if not f.done()]
+        self.shutdown()
+
+    def stop(self, *_):
+        self.stopping.set()
+
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the input folder and ingest new reports")
+    parser.add_argument("--once", action="store_true", help="Process files currently present and exit")
+    parser.add_argument("--poll", action="store_true", help="Use polling instead of inotify")
+    args = parser.parse_args()
+
+    watcher = IngestWatcher(force_poll=args.poll)
+    if args.once:
+        watcher.run_once()
+        watcher.shutdown()
+        return
+
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
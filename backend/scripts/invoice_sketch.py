@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compact distinct-invoice structures for the daily rollup.
+
+- Invoice numbers (e.g. J02GIV001568) are packed into 32-bit integers so they
+  can be stored in roaring bitmaps: the registry prefix gets a small registry
+  id and the trailing sequence number fills the low 20 bits. The registry
+  prefix is the text before the digits plus the digit width ("J02GIV#w6"), so
+  INV01 and INV1, or ABC and ABC0, never share a key. Sequences past
+  2^20 - 1 roll over into pages: page N registers as its own prefix
+  "<prefix>#w<width>#pN", so every invoice number still gets an exact, unique
+  key.
+- HyperLogLog gives a mergeable approximate distinct count for ad-hoc ranges.
+"""
+
+import re
+import math
+import hashlib
+
+SEQ_BITS = 20
+MAX_SEQ = (1 << SEQ_BITS) - 1
+MAX_PREFIX_ID = (1 << (32 - SEQ_BITS)) - 1
+
+INVOICE_NO_PATTERN = re.compile(r"^(.*?)(\d+)$")
+# A text prefix never ends in a digit, so the width and page parse back unambiguously
+REGISTRY_PREFIX_PATTERN = re.compile(r"^(.*)#w(\d+)(?:#p(\d+))?$", re.DOTALL)
+
+
+def split_invoice_no(invoice_no: str):
+    """Splits an invoice number into (prefix, sequence, digit width)"""
+    value = (invoice_no or "").strip()
+    match = INVOICE_NO_PATTERN.match(value)
+    if not match:
+        return value, 0, 0
+    return match.group(1), int(match.group(2)), len(match.group(2))
+
+
+def invoice_prefix(invoice_no: str) -> str:
+    """The registry prefix of an invoice number: text prefix, digit width and, past MAX_SEQ, sequence page"""
+    prefix, seq, width = split_invoice_no(invoice_no)
+    page = seq >> SEQ_BITS
+    registry = f"{prefix}#w{width}"
+    return f"{registry}#p{page}" if page else registry
+
+
+def encode_invoice_no(invoice_no: str, prefix_ids: dict) -> int:
+    """
+    Packs an invoice number into an unsigned 32-bit key.
+    `prefix_ids` maps known registry prefixes (invoice_prefix) to registry ids
+    (see daily_rollup.load_prefix_ids).
+    """
+    prefix = invoice_prefix(invoice_no)
+    if prefix not in prefix_ids:
+        raise KeyError(f"Unregistered invoice prefix: {prefix!r}")
+    return (prefix_ids[prefix] << SEQ_BITS) | (split_invoice_no(invoice_no)[1] & MAX_SEQ)
+
+
+def decode_invoice_key(key: int, prefixes_by_id: dict) -> str:
+    """Reverses encode_invoice_no"""
+    registry = prefixes_by_id[key >> SEQ_BITS]
+    match = REGISTRY_PREFIX_PATTERN.match(registry)
+    if not match:
+        raise ValueError(f"Not a registry prefix: {registry!r}")
+    prefix, width, page = match.group(1), int(match.group(2)), int(match.group(3) or 0)
+    seq = (page << SEQ_BITS) | (key & MAX_SEQ)
+    return f"{prefix}{seq:0{width}d}" if width else prefix
+
+
+class HyperLogLog:
+    """Minimal mergeable HyperLogLog (default 2^12 registers, ~1.6% standard error)"""
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError("Register size does not match precision")
+
+    def add(self, value: str):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)  # small-range correction
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.p]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(precision=data[0], registers=data[1:])
@@ -0,0 +1,4 @@
+"""
+Jacadi DSR jobs behind a single command line (see jacadi_dsr.cli).
+Nothing is imported here so `python -m jacadi_dsr --help` stays fast.
+"""
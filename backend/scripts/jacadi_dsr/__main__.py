@@ -0,0 +1,5 @@
+import sys
+
+from jacadi_dsr.cli import main
+
+sys.exit(main())
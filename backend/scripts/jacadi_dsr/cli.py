@@ -0,0 +1,319 @@
+"""
+Jacadi DSR Command Line
+One entry point for the Python jobs the API, cron and operators run:
+
+    python -m jacadi_dsr fetch olabi [--date YYYY-MM-DD]
+    python -m jacadi_dsr fetch footfall
+    python -m jacadi_dsr backfill 11-01-2026 30-01-2026
+    python -m jacadi_dsr ingest [--refresh-only]
+    python -m jacadi_dsr rebuild [--pack] [--target DB] [--workers N] [--skip-derived] [--promote]
+    python -m jacadi_dsr query --saved NAME [--params JSON] [--format json|arrow --out PATH]
+    python -m jacadi_dsr query --sql "SELECT ..." [--max-rows N] [--timeout S] | --list | --build
+    python -m jacadi_dsr report [--store NAME ...] [--out DIR] [--allow-stale]
+    python -m jacadi_dsr calendar [--first-fy YYYY] [--years N] [--out PATH]
+    python -m jacadi_dsr bench startup [--runs 5]
+    python -m jacadi_dsr bench bulk-upsert|load|store-fanout [-- script options]
+
+Run from backend/scripts, where the job modules live. A subcommand imports its
+modules only when it runs, so `--help` and argument errors never load
+Playwright, openpyxl or pymongo. Logs go to stderr; with `--json` stdout
+carries exactly one line, {"ok", "command", "result", "seconds"} or
+{"ok": false, "command", "error"}, which the API parses instead of log text.
+
+Configuration (environment):
+    CLI_HELP_BUDGET_MS        startup budget for `--help` (bench startup)
+    CLI_INGEST_BUDGET_MS      startup budget for a no-op `ingest --refresh-only`
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import contextlib
+
+logger = logging.getLogger("jacadi_dsr")
+
+HELP_BUDGET_MS = float(os.environ.get("CLI_HELP_BUDGET_MS", "150"))
+INGEST_BUDGET_MS = float(os.environ.get("CLI_INGEST_BUDGET_MS", "600"))
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# --- Subcommands -----------------------------------------------------------
+
+def fetch_olabi(args) -> dict:
+    from datetime import datetime
+
+    import fetch_jacadi_report
+
+    target_date = datetime.strptime(args.date, "%Y-%m-%d") if args.date else None
+    return {"path": fetch_jacadi_report.download_report(target_date)}
+
+
+def fetch_footfall(args) -> dict:
+    import fetch_footfall_report
+
+    return {"path": fetch_footfall_report.download_footfall_report()}
+
+
+def backfill(args) -> dict:
+    import backfill_footfall
+
+    path = backfill_footfall.download_footfall_for_date_range(args.start, args.end)
+    return {"path": path, "rows": backfill_footfall.load_backfill(path)}
+
+
+def ingest(args) -> dict:
+    """Ingests DATA_INPUT_DIR like the watcher, then rolls up every unmarked day"""
+    import loaders
+    import daily_rollup
+
+    db = loaders.get_db()
+    result = {}
+    if not args.refresh_only:
+        from ingest_watcher import IngestWatcher
+
+        watcher = IngestWatcher(force_poll=True, db=db)
+        result["files"] = watcher.run_once()
+        watcher.shutdown()
+
+    db.daily_rollup.create_index([("date", 1), ("location_name", 1)])
+    ranges = daily_rollup.find_unmarked_ranges(db)
+    result["rollup_ranges"] = len(ranges)
+    result["rollup_rows"] = sum(daily_rollup.build_rollup(db, start, end) for start, end in ranges)
+    result["derived"] = daily_rollup.refresh_derived(db)
+    return result
+
+
+def rebuild(args) -> dict:
+    import rebuild as archive_rebuild
+
+    pack_dir = args.pack_dir or archive_rebuild.PACK_DIR
+    workers = args.workers or archive_rebuild.WORKERS
+    manifest = archive_rebuild.pack(args.archive or archive_rebuild.DATA_ARCHIVE_DIR, pack_dir, workers)
+    if args.pack:
+        return {"files": len(manifest["files"])}
+
+    target = args.target or f"{archive_rebuild.mongo_store.DB_NAME}_rebuild"
+    summary = archive_rebuild.rebuild(target, pack_dir, workers, derived=not args.skip_derived)
+    if args.promote:
+        summary["promoted"] = archive_rebuild.promote(target)
+    return summary
+
+
+def query(args) -> dict:
+    import adhoc_query
+
+    if args.build:
+        return adhoc_query.refresh_warehouse(args.workers)
+    if args.list:
+        return {"saved": adhoc_query.saved_catalog()}
+
+    params = {**json.loads(args.params or "{}"), **adhoc_query.parse_params(args.param)}
+    result = adhoc_query.run_query(args.sql, args.saved, params, args.max_rows, args.timeout)
+    if args.format == "arrow":
+        if not args.out:
+            raise adhoc_query.QueryError("--format arrow needs --out")
+        return adhoc_query.write_arrow(result, args.out)
+    return adhoc_query.to_json(result)
+
+
+def report(args) -> dict:
+    import dsr_report
+
+    return dsr_report.generate_reports(out_dir=args.out or dsr_report.REPORT_DIR, stores=args.store,
+                                       allow_stale=args.allow_stale, workers=args.workers)
+
+
+def calendar(args) -> dict:
+    """Writes the date dimension the API loads at startup (calendar.service.ts)"""
+    import fiscal_calendar
+
+    path = args.out or fiscal_calendar.DATE_DIM_PATH
+    days = fiscal_calendar.write_date_dim(path, args.first_fy or fiscal_calendar.DEFAULT_FIRST_FY,
+                                          args.years or fiscal_calendar.DEFAULT_YEARS)
+    return {"path": path, "days": days}
+
+
+def bench(args) -> dict:
+    if args.suite == "startup":
+        return bench_startup(args.runs)
+
+    module = {"bulk-upsert": "bench_bulk_upsert", "load": "load_test", "store-fanout": "bench_store_fanout"}[args.suite]
+    return {"suite": args.suite, "exit_code": run_script(module, args.script_args)}
+
+
+def run_script(module_name: str, argv: list) -> int:
+    """Runs a standalone script's main() with its own argv"""
+    import importlib
+
+    module = importlib.import_module(module_name)
+    saved = sys.argv
+    sys.argv = [module_name + ".py"] + list(argv)
+    try:
+        code = module.main()
+    except SystemExit as e:
+        code = e.code
+    finally:
+        sys.argv = saved
+    return int(code or 0)
+
+
+# --- Startup benchmark -----------------------------------------------------
+
+def startup_probes() -> dict:
+    """Command lines timed by `bench startup`, with their budgets"""
+    return {
+        "help": ([sys.executable, "-m", "jacadi_dsr", "--help"], HELP_BUDGET_MS, {}),
+        "ingest --help": ([sys.executable, "-m", "jacadi_dsr", "ingest", "--help"], HELP_BUDGET_MS, {}),
+        # Full ingest path (pymongo, loaders, rollup builders) against an empty in-memory store
+        "ingest": ([sys.executable, "-m", "jacadi_dsr", "ingest", "--refresh-only", "--json"], INGEST_BUDGET_MS,
+                   {"MONGO_URL": "mongomock://localhost"}),
+    }
+
+
+def bench_startup(runs: int) -> dict:
+    import statistics
+    import subprocess
+
+    results = {}
+    for name, (command, budget_ms, env) in startup_probes().items():
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run(command, cwd=SCRIPTS_DIR, env={**os.environ, **env}, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append((time.perf_counter() - started) * 1000)
+        median = statistics.median(timings)
+        results[name] = {"median_ms": round(median, 1), "max_ms": round(max(timings), 1),
+                         "budget_ms": budget_ms, "within_budget": median <= budget_ms}
+        logger.info(f"{name}: median {median:.0f}ms over {runs} runs (budget {budget_ms:.0f}ms)")
+
+    over = [name for name, r in results.items() if not r["within_budget"]]
+    if over:
+        raise BudgetExceeded(f"Startup over budget: {', '.join(over)}", results)
+    return {"probes": results}
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, message: str, results: dict):
+        super().__init__(message)
+        self.results = results
+
+
+# --- Parser ----------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    # --json / --quiet are accepted before or after the subcommand
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", action="store_true", default=argparse.SUPPRESS,
+                        help="Print a single JSON result line on stdout")
+    common.add_argument("--quiet", action="store_true", default=argparse.SUPPRESS, help="Only log warnings")
+
+    # Separate actions for the top level: parents share action objects, so defaults set here would leak
+    parser = argparse.ArgumentParser(prog="jacadi_dsr", description="Jacadi DSR data jobs")
+    parser.add_argument("--json", action="store_true", help="Print a single JSON result line on stdout")
+    parser.add_argument("--quiet", action="store_true", help="Only log warnings")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    fetch = commands.add_parser("fetch", parents=[common], help="Download a report into DATA_INPUT_DIR")
+    sources = fetch.add_subparsers(dest="source", metavar="SOURCE", required=True)
+    olabi = sources.add_parser("olabi", parents=[common], help="Olabi invoice detail report")
+    olabi.add_argument("--date", help="Report date YYYY-MM-DD (default: yesterday)")
+    olabi.set_defaults(handler=fetch_olabi, label="fetch olabi")
+    footfall = sources.add_parser("footfall", parents=[common], help="Surecount hourly footfall for yesterday")
+    footfall.set_defaults(handler=fetch_footfall, label="fetch footfall")
+
+    fill = commands.add_parser("backfill", parents=[common], help="Download and load footfall for a date range")
+    fill.add_argument("start", help="Start date DD-MM-YYYY")
+    fill.add_argument("end", help="End date DD-MM-YYYY")
+    fill.set_defaults(handler=backfill, label="backfill")
+
+    load = commands.add_parser("ingest", parents=[common], help="Ingest DATA_INPUT_DIR and refresh rollups")
+    load.add_argument("--refresh-only", action="store_true", help="Only roll up days without a marker")
+    load.set_defaults(handler=ingest, label="ingest")
+
+    replay = commands.add_parser("rebuild", parents=[common], help="Rebuild state from the raw report archive")
+    replay.add_argument("--pack", action="store_true", help="Only compress new archive files")
+    replay.add_argument("--archive", help="Raw report archive directory (default DATA_ARCHIVE_DIR)")
+    replay.add_argument("--pack-dir", help="Directory for .zst files and manifest.json")
+    replay.add_argument("--target", help="Database to rebuild into (default <DB_NAME>_rebuild)")
+    replay.add_argument("--workers", type=int, help="Worker processes (default REBUILD_WORKERS)")
+    replay.add_argument("--skip-derived", action="store_true", help="Do not build the rollup and derived tables")
+    replay.add_argument("--promote", action="store_true", help="Replace the live collections with the rebuild")
+    replay.set_defaults(handler=rebuild, label="rebuild")
+
+    ask = commands.add_parser("query", parents=[common], help="Read-only SQL over the archive warehouse (DuckDB)")
+    source = ask.add_mutually_exclusive_group(required=True)
+    source.add_argument("--sql", help="A single SELECT statement")
+    source.add_argument("--saved", help="Saved query name")
+    source.add_argument("--list", action="store_true", help="List saved queries and their parameters")
+    source.add_argument("--build", action="store_true", help="Rebuild the warehouse from the packed archive")
+    ask.add_argument("--params", help="Named parameters as a JSON object")
+    ask.add_argument("--param", action="append", help="Named parameter name=value (repeatable)")
+    ask.add_argument("--max-rows", type=int, help="Row limit (capped at QUERY_MAX_ROWS)")
+    ask.add_argument("--timeout", type=float, help="Seconds before the query is interrupted (capped)")
+    ask.add_argument("--format", choices=("json", "arrow"), default="json")
+    ask.add_argument("--out", help="Arrow IPC stream file for --format arrow")
+    ask.add_argument("--workers", type=int, help="Worker processes for --build")
+    ask.set_defaults(handler=query, label="query")
+
+    excel = commands.add_parser("report", parents=[common], help="Write the DSR Excel workbooks from the snapshots")
+    excel.add_argument("--store", action="append", help="Only this store's workbook (repeatable)")
+    excel.add_argument("--out", help="Report root directory (default REPORT_DIR)")
+    excel.add_argument("--allow-stale", action="store_true", help="Skip the snapshot freshness check")
+    excel.add_argument("--workers", type=int, help="Worker processes for the Store KPIs (default STORE_METRICS_WORKERS)")
+    excel.set_defaults(handler=report, label="report")
+
+    dates = commands.add_parser("calendar", parents=[common], help="Write the fiscal date dimension JSON")
+    dates.add_argument("--first-fy", type=int, help="Start year of the first FY (April)")
+    dates.add_argument("--years", type=int, help="Number of financial years")
+    dates.add_argument("--out", help="Output JSON path (default DATE_DIM_PATH)")
+    dates.set_defaults(handler=calendar, label="calendar")
+
+    measure = commands.add_parser("bench", parents=[common], help="Benchmarks")
+    measure.add_argument("suite", choices=("startup", "bulk-upsert", "load", "store-fanout"))
+    measure.add_argument("--runs", type=int, default=5, help="Runs per probe (startup)")
+    measure.set_defaults(handler=bench, label="bench")
+    return parser
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Everything after `--` is passed through to the bench script unparsed"""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    script_args = []
+    if "--" in argv:
+        cut = argv.index("--")
+        argv, script_args = argv[:cut], argv[cut + 1:]
+    args = build_parser().parse_args(argv)
+    args.script_args = script_args
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    started = time.monotonic()
+    payload = {"command": args.label}
+    try:
+        # In --json mode anything a job prints goes to stderr, keeping stdout to the result line
+        with contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext():
+            result = args.handler(args)
+        payload.update({"ok": True, "result": result})
+    except BudgetExceeded as e:
+        payload.update({"ok": False, "error": str(e), "result": {"probes": e.results}})
+    except Exception as e:
+        logger.exception(f"{args.label} failed")
+        payload.update({"ok": False, "error": str(e), "error_type": type(e).__name__})
+    payload["seconds"] = round(time.monotonic() - started, 3)
+
+    if args.json:
+        print(json.dumps(payload, default=str), flush=True)
+    elif payload["ok"]:
+        print(f"SUCCESS: {args.label}: {json.dumps(payload['result'], default=str)}")
+    else:
+        print(f"FAILED: {args.label}: {payload['error']}")
+    return 0 if payload["ok"] else 1
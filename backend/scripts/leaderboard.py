@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Product Leaderboard Builder
+Keeps SKU and category sales per (store, day) in `product_daily`, plus a
+bounded heavy-hitter summary per (store, month, kind) in `product_summary`:
+the top SUMMARY_SIZE items by value and by quantity, and a `floor` (the
+smallest listed count) bounding every item left out.
+
+Top-N for any range merges the month summaries of the months it fully covers
+with the exact day totals of the edge days. An item's true total lies between
+its listed sum and that sum plus the floors of the summaries it is missing
+from, so only items whose upper bound reaches the N-th best lower bound can
+rank; those candidates are re-counted exactly from `product_daily`. Worst
+sellers have no heavy-hitter shortcut and are an exact group over day totals.
+
+Only sales bills (IV/IR, MH1 "Sales") count, so totals are never negative.
+Coverage follows `rollup_days` markers (kind "leaderboard").
+
+Requires: pymongo (via mongo_store)
+
+Usage:
+    python leaderboard.py                           # process all unmarked days
+    python leaderboard.py --start 2026-01-01 --end 2026-01-31
+    python leaderboard.py --top 2025-04-01 2026-03-31 [--kind category] [--metric qty] [-n 10] [--worst]
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+from pymongo import ReplaceOne
+
+import batch_publish
+from mongo_store import bulk_write, get_db
+from daily_rollup import daterange, find_unmarked_ranges, is_sales_bill, mark_built
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_KIND = "leaderboard"
+SUMMARY_SIZE = int(os.environ.get("LEADERBOARD_SUMMARY_SIZE", "200"))
+KINDS = {"sku": ("product_code", "product_name"), "category": ("category_name", "category_name")}
+METRICS = ("value", "qty")
+
+
+def accumulate_products(lines) -> dict:
+    """{(date, location, kind, key): {name, qty, value}} for sales bills"""
+    totals = {}
+    for line in lines:
+        if not is_sales_bill(line):
+            continue
+        for kind, (key_field, name_field) in KINDS.items():
+            key = (line.get(key_field) or "").strip()
+            if not key:
+                continue
+            ident = (line["invoice_date"], line.get("location_name", ""), kind, key)
+            row = totals.get(ident)
+            if row is None:
+                row = totals[ident] = {"name": (line.get(name_field) or "").strip(), "qty": 0, "value": 0.0}
+            row["qty"] += line.get("total_sales_qty") or 0
+            row["value"] += line.get("nett_invoice_value") or 0
+    return totals
+
+
+def summarize(totals: dict, size: int = None) -> dict:
+    """Top-`size` items per metric of exact {key: {qty, value}} totals, with the floor bounding the rest"""
+    size = size or SUMMARY_SIZE
+    summary = {"top": {}, "floor": {}}
+    for metric in METRICS:
+        ranked = sorted(((k, t[metric]) for k, t in totals.items()), key=lambda kv: (-kv[1], kv[0]))
+        kept = ranked[:size]
+        summary["top"][metric] = [[k, round(c, 2)] for k, c in kept]
+        summary["floor"][metric] = kept[-1][1] if len(ranked) > size else 0
+    return summary
+
+
+def month_bounds(month: str):
+    first = datetime.strptime(month + "-01", "%Y-%m-%d").date()
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def split_range(start_date: str, end_date: str):
+    """(months fully inside the range, remaining edge days)"""
+    months, edge_days = [], []
+    day = datetime.strptime(start_date, "%Y-%m-%d").date()
+    last = datetime.strptime(end_date, "%Y-%m-%d").date()
+    while day <= last:
+        first, month_end = month_bounds(day.strftime("%Y-%m"))
+        if day.isoformat() == first and month_end <= end_date:
+            months.append(day.strftime("%Y-%m"))
+            day = date.fromisoformat(month_end) + timedelta(days=1)
+        else:
+            edge_days.append(day.isoformat())
+            day += timedelta(days=1)
+    return months, edge_days
+
+
+def build_month_summaries(db, months, now) -> int:
+    ops = []
+    for month in sorted(months):
+        first, last = month_bounds(month)
+        groups = {}
+        for row in db.product_daily.find({"date": {"$gte": first, "$lte": last}}):
+            items = groups.setdefault((row["location_name"], row["kind"]), {})
+            item = items.setdefault(row["key"], {"qty": 0, "value": 0.0})
+            item["qty"] += row["qty"]
+            item["value"] += row["value"]
+
+        ids = []
+        for (location, kind), items in groups.items():
+            ids.append(f"{month}|{location}|{kind}")
+            ops.append(ReplaceOne(
+                {"_id": ids[-1]},
+                {"month": month, "location_name": location, "kind": kind, **summarize(items), "built_at": now},
+                upsert=True,
+            ))
+        db.product_summary.delete_many({"month": month, "_id": {"$nin": ids}})
+    bulk_write(db.product_summary, ops)
+    return len(ops)
+
+
+def build_leaderboard(db, start_date: str, end_date: str) -> int:
+    """Rewrites day totals for [start_date, end_date] and the summaries of the months it touches"""
+    seq = batch_publish.published_seq(db)
+    cursor = db.sales_transactions.find(
+        batch_publish.visible(db, {"invoice_date": {"$gte": start_date, "$lte": end_date}}, seq),
+        {"_id": 0, "invoice_date": 1, "location_name": 1, "transaction_type": 1, "mh1_description": 1,
+         "product_code": 1, "product_name": 1, "category_name": 1, "total_sales_qty": 1,
+         "nett_invoice_value": 1},
+        batch_size=5000,
+    )
+    totals = accumulate_products(cursor)
+
+    db.product_daily.delete_many({"date": {"$gte": start_date, "$lte": end_date}})
+    bulk_write(db.product_daily, (
+        ReplaceOne(
+            {"_id": f"{d}|{location}|{kind}|{key}"},
+            {"date": d, "location_name": location, "kind": kind, "key": key, **row},
+            upsert=True,
+        )
+        for (d, location, kind, key), row in totals.items()
+    ))
+
+    now = datetime.now(timezone.utc)
+    days = list(daterange(start_date, end_date))
+    summaries = build_month_summaries(db, {d[:7] for d in days}, now)
+    mark_built(db, LEADERBOARD_KIND, days, seq, now)
+
+    logger.info(f"Wrote {len(totals)} product day totals and {summaries} month summaries over {len(days)} days")
+    return len(totals)
+
+
+def refresh(db) -> int:
+    return sum(build_leaderboard(db, start, end) for start, end in find_unmarked_ranges(db, LEADERBOARD_KIND))
+
+
+def ensure_indexes(db):
+    db.product_daily.create_index([("kind", 1), ("date", 1), ("location_name", 1)])
+    db.product_daily.create_index([("kind", 1), ("key", 1), ("date", 1)])
+    db.product_summary.create_index([("kind", 1), ("month", 1)])
+
+
+def exact_totals(db, start_date: str, end_date: str, kind: str, locations=None, keys=None) -> dict:
+    match = {"kind": kind, "date": {"$gte": start_date, "$lte": end_date}}
+    if locations:
+        match["location_name"] = {"$in": list(locations)}
+    if keys is not None:
+        match["key"] = {"$in": list(keys)}
+    result = {}
+    for row in db.product_daily.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$key", "name": {"$last": "$name"}, "qty": {"$sum": "$qty"}, "value": {"$sum": "$value"}}},
+    ], allowDiskUse=True):
+        result[row["_id"]] = {"key": row["_id"], "name": row["name"], "qty": row["qty"], "value": round(row["value"], 2)}
+    return result
+
+
+def rank(totals: dict, metric: str, n: int, worst: bool = False) -> list:
+    order = sorted(totals.values(), key=lambda r: (r[metric], r["key"]) if worst else (-r[metric], r["key"]))
+    return order[:n]
+
+
+def top_n(db, start_date: str, end_date: str, kind: str = "sku", metric: str = "value", n: int = 10,
+          locations=None, worst: bool = False) -> list:
+    """Best (or worst) N items for a range, with exact totals for every listed item"""
+    if worst:
+        return rank(exact_totals(db, start_date, end_date, kind, locations), metric, n, worst=True)
+
+    months, edge_days = split_range(start_date, end_date)
+    lower = {}
+    listed_floor = {}
+    total_floor = 0
+
+    summary_query = {"kind": kind, "month": {"$in": months}}
+    if locations:
+        summary_query["location_name"] = {"$in": list(locations)}
+    for summary in db.product_summary.find(summary_query, {"top": 1, "floor": 1}):
+        floor = summary["floor"][metric]
+        total_floor += floor
+        for key, count in summary["top"][metric]:
+            lower[key] = lower.get(key, 0) + count
+            listed_floor[key] = listed_floor.get(key, 0) + floor
+
+    for d_start, d_end in contiguous(edge_days):
+        for key, row in exact_totals(db, d_start, d_end, kind, locations).items():
+            lower[key] = lower.get(key, 0) + row[metric]
+
+    ranked = sorted(lower.values(), reverse=True)
+    threshold = ranked[n - 1] if len(ranked) >= n else 0
+    if total_floor > threshold or threshold == 0:
+        # An item missing from every summary could still rank: count everything exactly
+        candidates = None
+    else:
+        candidates = [k for k, low in lower.items() if low + total_floor - listed_floor.get(k, 0) >= threshold]
+
+    return rank(exact_totals(db, start_date, end_date, kind, locations, candidates), metric, n)
+
+
+def contiguous(days):
+    """['2026-01-30', '2026-01-31', '2026-03-01'] -> [('2026-01-30', '2026-01-31'), ('2026-03-01', '2026-03-01')]"""
+    ranges = []
+    for day in days:
+        if ranges and date.fromisoformat(ranges[-1][1]) + timedelta(days=1) == date.fromisoformat(day):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(r) for r in ranges]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain SKU / category leaderboards")
+    parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="End date YYYY-MM-DD")
+    parser.add_argument("--top", nargs=2, metavar=("START", "END"), help="Print the leaderboard for a range")
+    parser.add_argument("--kind", choices=sorted(KINDS), default="sku")
+    parser.add_argument("--metric", choices=METRICS, default="value")
+    parser.add_argument("-n", type=int, default=10)
+    parser.add_argument("--worst", action="store_true", help="Worst sellers instead of best")
+    parser.add_argument("--location", action="append", help="Restrict --top to location(s)")
+    args = parser.parse_args()
+
+    db = get_db()
+    ensure_indexes(db)
+
+    if args.top:
+        rows = top_n(db, args.top[0], args.top[1], args.kind, args.metric, args.n, args.location, args.worst)
+        print(json.dumps(rows, indent=2))
+        return
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            logger.error("--start and --end must be given together")
+            sys.exit(1)
+        total = build_leaderboard(db, args.start, args.end)
+    else:
+        total = refresh(db)
+    print(f"SUCCESS: Wrote {total} product day totals")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Dashboard Load Test
+Replays the morning DSR peak against a running API: each virtual manager logs
+in, loads the filter metadata, then fires the eight /api/dashboards/default/*
+data calls in parallel (as Dashboard.tsx does) for a few filter changes.
+Concurrency is ramped through stages; every stage reports p50/p95/p99
+latency, throughput and error rate per endpoint.
+
+A saved baseline turns the run into a regression gate: the process exits 1
+when any endpoint's p95 at the peak stage grows past the tolerance or its
+error rate rises.
+
+Requires: httpx
+
+Usage:
+    python load_test.py                                   # ramp 5,10,20,30 users
+    python load_test.py --stages 30 --sessions 3 --save-baseline load_baseline.json
+    python load_test.py --baseline load_baseline.json --tolerance 0.25
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = os.environ.get("LOAD_TEST_URL", "http://localhost:8001")
+LOAD_TEST_EMAIL = os.environ.get("LOAD_TEST_EMAIL", "admin@example.com")
+LOAD_TEST_PASSWORD = os.environ.get("LOAD_TEST_PASSWORD", "password")
+
+METADATA_ENDPOINTS = ("latest-date", "default/locations", "default/brands", "default/categories")
+DATA_ENDPOINTS = (
+    "default/retail-performance",
+    "default/retail-efficiency",
+    "default/retail-whatsapp",
+    "default/omni-channel-tm-lm",
+    "default/omni-channel-details",
+    "default/retail-omni-total",
+    "default/whatsapp-sales-breakdown",
+    "default/summary",
+)
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile (pct in 0-100); 0 for no samples"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))  # ceil without float error
+    return ordered[int(rank) - 1]
+
+
+class Recorder:
+    """Latency samples and failures per endpoint for one stage"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies.setdefault(endpoint, []).append(seconds * 1000)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, wall_seconds: float) -> dict:
+        result = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            errors = self.errors.get(endpoint, 0)
+            result[endpoint] = {
+                "requests": len(samples),
+                "error_rate": round(errors / len(samples), 4),
+                "p50_ms": round(percentile(samples, 50), 1),
+                "p95_ms": round(percentile(samples, 95), 1),
+                "p99_ms": round(percentile(samples, 99), 1),
+                "rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+            }
+        return result
+
+
+def filter_variants(meta: dict, rng: random.Random) -> dict:
+    """Filters a store / regional manager would pick: all stores, one store, a brand, or both"""
+    locations = meta.get("locations") or []
+    brands = meta.get("brands") or []
+    choice = rng.random()
+    params = {}
+    if locations and choice < 0.6:
+        params["location"] = rng.choice(locations)
+    if brands and choice > 0.4:
+        params["brand"] = rng.choice(brands)
+    return params
+
+
+async def timed_get(client, recorder: Recorder, endpoint: str, params: dict = None):
+    started = time.perf_counter()
+    ok = False
+    body = None
+    try:
+        response = await client.get(f"/api/dashboards/{endpoint}", params=params)
+        ok = response.status_code == 200
+        body = response.json() if ok else None
+    except Exception as e:
+        logger.debug(f"{endpoint}: {e}")
+    recorder.record(endpoint, time.perf_counter() - started, ok)
+    return body
+
+
+async def session(client, recorder: Recorder, meta: dict, rng: random.Random, filter_changes: int, think_seconds: float):
+    """One manager opening the dashboard, then changing filters `filter_changes` times"""
+    results = await asyncio.gather(*(timed_get(client, recorder, e) for e in METADATA_ENDPOINTS))
+    latest = (results[0] or {}).get("date") or meta["date"]
+    start = latest[:8] + "01"
+
+    for _ in range(1 + filter_changes):
+        params = {"startDate": start, "endDate": latest, **filter_variants(meta, rng)}
+        await asyncio.gather(*(timed_get(client, recorder, e, params) for e in DATA_ENDPOINTS))
+        await asyncio.sleep(rng.uniform(0, think_seconds))
+
+
+async def login(client) -> str:
+    response = await client.post("/api/auth/login", json={"email": LOAD_TEST_EMAIL, "password": LOAD_TEST_PASSWORD})
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+async def load_metadata(client) -> dict:
+    date, locations, brands = await asyncio.gather(
+        client.get("/api/dashboards/latest-date"),
+        client.get("/api/dashboards/default/locations"),
+        client.get("/api/dashboards/default/brands"),
+    )
+    return {"date": date.json()["date"], "locations": locations.json(), "brands": brands.json()}
+
+
+async def run_stage(users: int, args, token: str, meta: dict) -> dict:
+    import httpx
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users * len(DATA_ENDPOINTS))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        async def manager(index: int):
+            rng = random.Random(args.seed * 1000 + index)
+            await asyncio.sleep(args.ramp_seconds * index / users)  # staggered arrival
+            for _ in range(args.sessions):
+                await session(client, recorder, meta, rng, args.filter_changes, args.think_seconds)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(manager(i) for i in range(users)))
+        wall = time.perf_counter() - started
+
+    return {"users": users, "wall_seconds": round(wall, 2), "endpoints": recorder.summary(wall)}
+
+
+def compare_to_baseline(current: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of the peak stage against a saved baseline, as human-readable strings"""
+    failures = []
+    for endpoint, base in baseline["endpoints"].items():
+        now = current["endpoints"].get(endpoint)
+        if now is None:
+            failures.append(f"{endpoint}: missing from this run")
+            continue
+        limit = base["p95_ms"] * (1 + tolerance)
+        if now["p95_ms"] > limit:
+            failures.append(f"{endpoint}: p95 {now['p95_ms']}ms > {limit:.1f}ms (baseline {base['p95_ms']}ms)")
+        if now["error_rate"] > base["error_rate"] + 0.01:
+            failures.append(f"{endpoint}: error rate {now['error_rate']:.2%} (baseline {base['error_rate']:.2%})")
+    return failures
+
+
+def print_stage(stage: dict):
+    print(f"\n=== {stage['users']} concurrent users ({stage['wall_seconds']}s) ===")
+    print(f"{'endpoint':<36} {'reqs':>6} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>7}")
+    for endpoint, s in stage["endpoints"].items():
+        print(f"{endpoint:<36} {s['requests']:>6} {s['error_rate'] * 100:>5.1f}% "
+              f"{s['p50_ms']:>7.0f}ms {s['p95_ms']:>6.0f}ms {s['p99_ms']:>6.0f}ms {s['rps']:>7.1f}")
+
+
+async def main_async(args) -> int:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        token = await login(client)
+        client.headers["Authorization"] = f"Bearer {token}"
+        meta = await load_metadata(client)
+    logger.info(f"Target {args.url}, latest date {meta['date']}, {len(meta['locations'])} locations")
+
+    stages = []
+    for users in args.stages:
+        stage = await run_stage(users, args, token, meta)
+        stages.append(stage)
+        print_stage(stage)
+
+    peak = stages[-1]
+    report = {"url": args.url, "stages": stages}
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(peak, f, indent=2)
+        print(f"\nSUCCESS: Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare_to_baseline(peak, baseline, args.tolerance)
+        if failures:
+            print("\nFAILED: Regressions against baseline")
+            for failure in failures:
+                print(f"  - {failure}")
+            return 1
+        print(f"\nSUCCESS: Within {args.tolerance:.0%} of baseline")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-user load test for the DSR dashboard API")
+    parser.add_argument("--url", default=BASE_URL)
+    parser.add_argument("--stages", type=lambda s: [int(x) for x in s.split(",")], default=[5, 10, 20, 30],
+                        help="Comma-separated concurrent user counts, ramped in order")
+    parser.add_argument("--sessions", type=int, default=2, help="Dashboard opens per user per stage")
+    parser.add_argument("--filter-changes", type=int, default=2, help="Filter changes per session")
+    parser.add_argument("--think-seconds", type=float, default=1.0, help="Max pause between filter changes")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0, help="Arrival spread within a stage")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json-out", help="Write the full report as JSON")
+    parser.add_argument("--save-baseline", help="Save the peak stage as the new baseline")
+    parser.add_argument("--baseline", help="Fail if the peak stage regresses against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 growth over baseline")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
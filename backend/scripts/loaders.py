@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+CSV Loaders
+Python port of the parsers in src/services/etl.service.ts (processInvoiceCSV,
+processFootfallCSV, processEfficiencyCSV) so files can be ingested outside the
+API process. Location/channel normalization must stay in sync with the TS side.
+
+Requires: pymongo (via mongo_store) for the load_* writers, openpyxl for footfall reports that arrive as XLSX
+"""
+
+import csv
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+XLSX_MAGIC = b"PK\x03\x04"
+
+
+def get_db():
+    import mongo_store
+
+    return mongo_store.get_db()
+
+
+# --- Parsing helpers -------------------------------------------------------
+
+def parse_invoice_date(value: str) -> str:
+    """DD/MM/YYYY -> YYYY-MM-DD (falls back to today like the TS parser)"""
+    parts = (value or "").split("/")
+    if len(parts) == 3:
+        day, month, year = parts
+        return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def parse_invoice_hour(value: str):
+    """'HH:MM[:SS]' -> integer hour 0-23, None when missing or malformed"""
+    head = (value or "").strip().split(":", 1)[0]
+    if head.isdigit() and int(head) < 24:
+        return int(head)
+    return None
+
+
+def to_int(value) -> int:
+    try:
+        return int(float(str(value).replace(",", "")))
+    except (TypeError, ValueError):
+        return 0
+
+
+def to_float(value) -> float:
+    try:
+        return float(str(value).replace(",", "").replace("%", ""))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def read_rows(path: str):
+    """Yields dict rows from a CSV, or from an XLSX saved with a .csv name (Surecount does this)"""
+    with open(path, "rb") as f:
+        is_xlsx = f.read(4) == XLSX_MAGIC
+
+    if is_xlsx:
+        import openpyxl
+
+        # A file object, since openpyxl rejects paths that do not end in .xlsx
+        with open(path, "rb") as f:
+            wb = openpyxl.load_workbook(f, read_only=True)
+            rows = wb.active.iter_rows(values_only=True)
+            headers = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+            for values in rows:
+                yield {h: ("" if v is None else str(v)) for h, v in zip(headers, values)}
+            wb.close()
+        return
+
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def file_sha256(path: str) -> str:
+    """Content hash used to deduplicate ingested files regardless of their name"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_header(path: str) -> list:
+    """First row of a CSV/XLSX file, used for classification"""
+    for row in read_rows(path):
+        return list(row.keys())
+    return []
+
+
+# --- Location / channel normalization (mirrors etl.service.ts) ------------
+
+def resolve_invoice_location(row: dict):
+    """Returns (location_name, order_channel_name) or (None, None) for unmapped rows"""
+    order_associate = (row.get("Order Associate Name") or "").strip().lower()
+    is_online = any(k in order_associate for k in ("shopify", "webstore", "website"))
+    channel = "E-Commerce" if is_online else "Brick and Mortar"
+
+    location = None
+    if "palladium" in order_associate:
+        location = "Jacadi Palladium"
+    elif "asia" in order_associate or "moa" in order_associate:
+        location = "Jacadi MOA"
+    elif is_online:
+        location = "Shopify Webstore"
+
+    if not location:
+        name = (row.get("Invoice Associate Name") or "").strip().lower()
+        short = (row.get("Invoice Associate Short Name") or "").strip().lower()
+        code = (row.get("Invoice Associate Code ") or row.get("Invoice Associate Code") or "").strip().upper()
+
+        if "palladium" in name or "palladium" in short or "paddle" in short or "PALLADIUM" in code or "PHO" in code:
+            location = "Jacadi Palladium"
+        elif "moa" in name or "asia" in name or "moa" in short or "asia" in short or "JPBLRMOA" in code:
+            location = "Jacadi MOA"
+
+    return (location, channel) if location else (None, None)
+
+
+def resolve_footfall_location(raw: str):
+    value = (raw or "").lower()
+    if "palladium" in value:
+        return "Jacadi Palladium"
+    if "asia" in value or "moa" in value:
+        return "Jacadi MOA"
+    return None
+
+
+def resolve_efficiency_location(raw: str) -> str:
+    upper = raw.upper()
+    if "MALL OF ASIA" in upper or "MOA" in upper:
+        return "Jacadi MOA"
+    if "PALLADIUM" in upper:
+        return "Jacadi Palladium"
+    return raw
+
+
+# --- Parsers ---------------------------------------------------------------
+
+def parse_invoice_csv(path: str) -> list:
+    """Olabi invoice detail report -> sales_transactions documents"""
+    created_at = datetime.now(timezone.utc)
+    docs = []
+    for row in read_rows(path):
+        location, channel = resolve_invoice_location(row)
+        if not location:
+            continue
+        docs.append({
+            "invoice_no": row.get("Invoice No") or "",
+            "invoice_date": parse_invoice_date(row.get("Invoice Date")),
+            "invoice_month": row.get("Invoice Month") or "",
+            "invoice_time": row.get("Invoice Time") or "",
+            "invoice_hour": parse_invoice_hour(row.get("Invoice Time")),
+            "transaction_type": row.get("Sales Transaction Type (IV/SR/IR)") or "",
+            "order_channel_code": row.get("Order Business Channel Code") or "",
+            "order_channel_name": channel,
+            "invoice_channel_code": row.get("Invoice Business Channel Code") or "",
+            "invoice_channel_name": row.get("Invoice Business Channel Name") or "",
+            "sub_channel_code": row.get("Invoice Business Sub Channel Code") or "",
+            "sub_channel_name": row.get("Invoice Business Sub Channel Name") or "",
+            "location_code": row.get("Invoice Associate Code ") or "",
+            "location_name": location,
+            "store_type": "",
+            "city": row.get("Invoice Associate Town name") or "",
+            "state": row.get("Invoice Associate State name") or "",
+            "total_sales_qty": to_int(row.get("Total Sales Qty")),
+            "unit_mrp": to_float(row.get("Unit MRP")),
+            "invoice_mrp_value": to_float(row.get("Invoice MRP Value")),
+            "invoice_discount_value": to_float(row.get("Invoice Discount Value")),
+            "invoice_discount_pct": to_float(row.get("Invoice Discount Percentage")),
+            "invoice_basic_value": to_float(row.get("Invoice Basic Value")),
+            "total_tax_pct": to_float(row.get("Total Tax %")),
+            "total_tax_amt": to_float(row.get("Total Tax Amt")),
+            "nett_invoice_value": to_float(row.get("Nett Invoice Value")),
+            "sales_person_code": row.get("Sales Person Code") or "",
+            "sales_person_name": row.get("Sales Person Name") or "",
+            "consumer_code": row.get("Consumer Code") or "",
+            "consumer_name": row.get("Consumer Name") or "",
+            "consumer_mobile": row.get("Consumer Mobile") or "",
+            "product_code": row.get("Product Code") or "",
+            "product_name": row.get("Product SKU Desc") or "",
+            "category_name": row.get("Category Name") or "",
+            "brand_name": row.get("Brand Name") or "",
+            "mh1_description": (row.get("MH1 Description") or "").strip(),
+            "created_at": created_at,
+        })
+    return docs
+
+
+def parse_footfall_csv(path: str) -> list:
+    """Surecount hourly footfall -> daily footfall documents per location"""
+    totals = {}
+    for row in read_rows(path):
+        location = resolve_footfall_location(row.get("Store Name"))
+        if not location:
+            continue
+        count = to_int(row.get("Total IN"))
+        if count > 0:
+            key = (parse_invoice_date(row.get("Date")), location)
+            totals[key] = totals.get(key, 0) + count
+
+    return [
+        {"date": date, "location_name": location, "footfall_count": count}
+        for (date, location), count in totals.items()
+    ]
+
+
+def parse_efficiency_csv(path: str) -> list:
+    """Location efficiency report -> location_efficiency documents for today"""
+    report_date = datetime.now().strftime("%Y-%m-%d")
+    docs = []
+    for raw in read_rows(path):
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in raw.items()}
+        location = row.get("location", "")
+        if not location or location.lower() == "total":
+            continue
+        docs.append({
+            "location_name": resolve_efficiency_location(location),
+            "report_date": report_date,
+            "footfall": to_int(row.get("mtd footfall")),
+            "conversion_pct": to_float(row.get("mtd conversion %")),
+            "multies_pct": to_float(row.get("mtd multies")),
+            "pm_footfall": to_int(row.get("pm footfall")),
+            "pm_conversion_pct": to_float(row.get("pm conversion %")),
+            "pm_multies_pct": to_float(row.get("pm multies")),
+        })
+    return docs
+
+
+# --- Writers ---------------------------------------------------------------
+
+def invalidate_rollup_days(db, dates):
+    if dates:
+        db.rollup_days.delete_many({"date": {"$in": sorted(dates)}})
+
+
+def load_invoices(path: str, db=None) -> dict:
+    """
+    Replaces every invoice present in the file (last file wins), like
+    processInvoiceCSV, as one atomically published batch
+    """
+    import batch_publish
+
+    db = db if db is not None else get_db()
+    docs = parse_invoice_csv(path)
+    invoice_nos = sorted({d["invoice_no"] for d in docs if d["invoice_no"]})
+    affected = {d["invoice_date"] for d in docs}
+
+    if invoice_nos:
+        affected.update(db.sales_transactions.distinct(
+            "invoice_date", batch_publish.visible(db, {"invoice_no": {"$in": invoice_nos}})))
+    batch_publish.publish_invoice_batch(db, docs, invoice_nos, os.path.basename(path), affected)
+
+    return {"rows": len(docs), "invoices": len(invoice_nos), "dates": sorted(affected)}
+
+
+def load_footfall(path: str, db=None) -> dict:
+    import mongo_store
+
+    db = db if db is not None else get_db()
+    docs = parse_footfall_csv(path)
+    mongo_store.bulk_upsert(db.footfall, docs, ("date", "location_name"))
+    return {"rows": len(docs), "dates": sorted({d["date"] for d in docs})}
+
+
+def load_efficiency(path: str, db=None) -> dict:
+    import mongo_store
+
+    db = db if db is not None else get_db()
+    docs = parse_efficiency_csv(path)
+    mongo_store.bulk_upsert(db.location_efficiency, docs, ("location_name", "report_date"))
+    return {"rows": len(docs), "dates": sorted({d["report_date"] for d in docs})}
+
+
+LOADERS = {
+    "invoice": load_invoices,
+    "footfall": load_footfall,
+    "efficiency": load_efficiency,
+}
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Shared MongoDB access for the Python loaders.
+One bounded `MongoClient` pool per process, plus unordered bulk writes in
+fixed-size batches with retry on transient (network / failover) errors.
+
+Configuration (environment):
+    MONGO_URL                 mongodb://localhost:27017 (or mongomock:// for tests/benchmarks)
+    DB_NAME                   jacadi_dsr
+    MONGO_MAX_POOL_SIZE       20
+    MONGO_MIN_POOL_SIZE       0
+    MONGO_BULK_BATCH_SIZE     1000
+    MONGO_WRITE_RETRIES       3
+"""
+
+import os
+import time
+import logging
+import threading
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, NetworkTimeout, NotPrimaryError
+
+logger = logging.getLogger(__name__)
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "jacadi_dsr")
+MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "20"))
+MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+BATCH_SIZE = int(os.environ.get("MONGO_BULK_BATCH_SIZE", "1000"))
+WRITE_RETRIES = int(os.environ.get("MONGO_WRITE_RETRIES", "3"))
+
+TRANSIENT_ERRORS = (AutoReconnect, ConnectionFailure, NetworkTimeout, NotPrimaryError)
+DUPLICATE_KEY = 11000
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client; recreated after fork since pymongo clients are not fork-safe"""
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            if MONGO_URL.startswith("mongomock://"):
+                import mongomock
+
+                _client = mongomock.MongoClient()
+            else:
+                _client = MongoClient(
+                    MONGO_URL,
+                    maxPoolSize=MAX_POOL_SIZE,
+                    minPoolSize=MIN_POOL_SIZE,
+                    maxIdleTimeMS=60000,
+                    serverSelectionTimeoutMS=10000,
+                    retryWrites=True,
+                    appname="jacadi-dsr-loaders",
+                )
+            _client_pid = os.getpid()
+        return _client
+
+
+def get_db(name: str = None):
+    return get_client()[name or DB_NAME]
+
+
+def close_client():
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def with_retry(fn, attempts: int = WRITE_RETRIES, base_delay: float = 0.5):
+    """Runs `fn`, retrying transient errors with exponential backoff"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except TRANSIENT_ERRORS as e:
+            if attempt == attempts:
+                raise
+            delay = base_delay * 2 ** (attempt - 1)
+            logger.warning(f"Transient MongoDB error ({e}), retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_write(collection, operations, batch_size: int = BATCH_SIZE) -> dict:
+    """Unordered bulk_write in batches; each batch is retried on transient errors"""
+    totals = {"inserted": 0, "matched": 0, "modified": 0, "upserted": 0, "deleted": 0}
+    for batch in batched(operations, batch_size):
+        result = with_retry(lambda: collection.bulk_write(batch, ordered=False))
+        totals["inserted"] += result.inserted_count
+        totals["matched"] += result.matched_count
+        totals["modified"] += result.modified_count
+        totals["upserted"] += result.upserted_count
+        totals["deleted"] += result.deleted_count
+    return totals
+
+
+def bulk_upsert(collection, docs, key_fields, batch_size: int = BATCH_SIZE, operator: str = "$set") -> dict:
+    """
+    Upserts documents keyed on `key_fields`.
+    operator="$set" overwrites existing rows; "$setOnInsert" only inserts missing ones.
+    Re-running a batch is idempotent, so retries are always safe.
+    """
+    operations = (
+        UpdateOne({k: doc[k] for k in key_fields}, {operator: doc}, upsert=True)
+        for doc in docs
+    )
+    return bulk_write(collection, operations, batch_size)
+
+
+def bulk_insert(collection, docs, batch_size: int = BATCH_SIZE, skip_duplicates: bool = False) -> int:
+    """
+    insert_many in unordered batches. Documents get their _id client-side, so a
+    retried batch only reports duplicate-key errors for rows that already landed;
+    those count as inserted. Duplicates on a batch's first attempt are raised
+    unless the caller opts in with skip_duplicates=True, and are then logged.
+    """
+    inserted = skipped = 0
+    for batch in batched(docs, batch_size):
+        attempts = []
+
+        def insert():
+            attempts.append(None)
+            try:
+                return len(collection.insert_many(batch, ordered=False).inserted_ids), 0
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                    raise
+                if len(attempts) > 1:
+                    return e.details.get("nInserted", 0) + len(errors), 0
+                if not skip_duplicates:
+                    raise
+                return e.details.get("nInserted", 0), len(errors)
+
+        batch_inserted, batch_skipped = with_retry(insert)
+        inserted += batch_inserted
+        skipped += batch_skipped
+    if skipped:
+        logger.warning(f"{collection.name}: skipped {skipped} duplicate-key documents, inserted {inserted}")
+    return inserted
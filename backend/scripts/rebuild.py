@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Archive Rebuild
+Rebuilds sales and footfall state from the raw Olabi invoice and Surecount
+footfall files in DATA_ARCHIVE_DIR, using the current normalization logic in
+loaders.py (e.g. after a location mapping change).
+
+Packing compresses every archived report with zstd into REBUILD_PACK_DIR and
+records it in `manifest.json`: SHA-256 of the raw bytes, report kind, report
+timestamp (from the file name, mtime otherwise), rows and date coverage.
+Packing is incremental; files already in the manifest are not re-read.
+
+Replay runs in two parallel passes over the packed files:
+    1. each file's keys (invoice numbers / date+store for footfall) are read
+       and every key is assigned to the latest report containing it;
+    2. each file is parsed again and inserts only the rows whose key it owns.
+The result is the same as re-ingesting the files one by one in report order
+(last file wins per invoice, identical content is ingested once), but the
+files can be processed in any order and on any number of workers.
+
+Replay writes into a separate database (default `<DB_NAME>_rebuild`), which is
+dropped first and seeded with the live surrogate key registries (`counters`,
+`invoice_prefixes`, `dim_*`), then builds the daily rollup and derived tables
+there, so rebuilt bitmaps and facts use the live keys and number new values
+after them.
+
+`--promote` renames the rebuilt collections over the live ones while holding
+the batch_publish lease, so no invoice batch publishes in between; the archive
+must then hold the full history (rows loaded by ingest_historical.py are
+pre-normalized exports, not raw reports, and are not replayed). It refuses if
+a report was ingested since the archive was packed and is not in the
+manifest. The key registries are never replaced: keys the rebuild added are
+merged into the live ones, and a key that changed meaning since the rebuild
+was seeded aborts the promote. The promote then publishes a new sequence that
+the rebuilt rollup markers are stamped with, logs a successful ingestion, so
+the API re-renders its snapshots and runs the post-ingest stages, and with
+--skip-derived drops the live rollup markers.
+
+Requires: pymongo (via mongo_store), zstandard
+
+Usage:
+    python rebuild.py --pack                        # compress new archive files, update the manifest
+    python rebuild.py                               # pack, then replay into jacadi_dsr_rebuild
+    python rebuild.py --target jacadi_dsr_v2 --workers 8 [--skip-derived] [--promote]
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo import UpdateOne
+
+import batch_publish
+import loaders
+import mongo_store
+from ingest_watcher import DATA_ARCHIVE_DIR, classify_header, is_candidate
+
+logger = logging.getLogger(__name__)
+
+PACK_DIR = os.environ.get("REBUILD_PACK_DIR", os.path.join(DATA_ARCHIVE_DIR, "packed"))
+ZSTD_LEVEL = int(os.environ.get("REBUILD_ZSTD_LEVEL", "10"))
+WORKERS = int(os.environ.get("REBUILD_WORKERS", str(os.cpu_count() or 4)))
+MANIFEST_NAME = "manifest.json"
+
+# Efficiency reports are stamped with the ingest date, so replaying them is meaningless
+REPLAYED_KINDS = ("invoice", "footfall")
+
+# Surrogate key registries (plus every `dim_*`): keys are never reused, so they outlive rebuilds
+KEY_REGISTRIES = ("counters", "invoice_prefixes")
+# Publication state belongs to the live database
+LIVE_ONLY = ("publications", "ingest_batches")
+
+INVOICE_STAMP = re.compile(r"invoicedetailreport(\d{14})", re.IGNORECASE)
+FOOTFALL_STAMP = re.compile(r"_(\d{8}_\d{6})(?=\D)")
+UPLOAD_STAMP = re.compile(r"^manual_(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})")
+
+
+def report_timestamp(filename: str, mtime: float) -> str:
+    """When the report was generated: Olabi, fetcher or upload stamp in the name, else mtime"""
+    stamps = (
+        (INVOICE_STAMP, "%d%m%Y%H%M%S"),
+        (FOOTFALL_STAMP, "%Y%m%d_%H%M%S"),
+        (UPLOAD_STAMP, "%Y-%m-%dT%H-%M-%S"),
+    )
+    for pattern, fmt in stamps:
+        for match in pattern.finditer(filename):
+            try:
+                return datetime.strptime(match.group(1), fmt).isoformat()
+            except ValueError:
+                continue
+    return datetime.utcfromtimestamp(mtime).replace(microsecond=0).isoformat()
+
+
+def parse(kind: str, path: str) -> list:
+    return loaders.parse_invoice_csv(path) if kind == "invoice" else loaders.parse_footfall_csv(path)
+
+
+def row_key(kind: str, doc: dict) -> str:
+    """Unit of last-file-wins: the invoice, or the store-day for footfall (upserted per date+location)"""
+    if kind == "invoice":
+        return doc["invoice_no"]
+    return f"{doc['date']}|{doc['location_name']}"
+
+
+def row_date(kind: str, doc: dict) -> str:
+    return doc["invoice_date"] if kind == "invoice" else doc["date"]
+
+
+# --- Packing ---------------------------------------------------------------
+
+def manifest_path(pack_dir: str) -> str:
+    return os.path.join(pack_dir, MANIFEST_NAME)
+
+
+def load_manifest(pack_dir: str = PACK_DIR) -> dict:
+    try:
+        with open(manifest_path(pack_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"files": []}
+
+
+def write_manifest(pack_dir: str, manifest: dict):
+    tmp = manifest_path(pack_dir) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path(pack_dir))
+
+
+def pack_file(path: str, pack_dir: str) -> dict:
+    """Compresses one archived report and describes it for the manifest"""
+    import zstandard
+
+    name = os.path.basename(path)
+    kind = classify_header(loaders.read_header(path))
+    entry = {
+        "name": name,
+        "packed": name + ".zst",
+        "kind": kind,
+        "sha256": loaders.file_sha256(path),
+        "bytes": os.path.getsize(path),
+        "report_time": report_timestamp(name, os.path.getmtime(path)),
+    }
+
+    tmp = os.path.join(pack_dir, entry["packed"] + ".tmp")
+    with open(path, "rb") as src, open(tmp, "wb") as dst:
+        zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst)
+    os.replace(tmp, os.path.join(pack_dir, entry["packed"]))
+    entry["packed_bytes"] = os.path.getsize(os.path.join(pack_dir, entry["packed"]))
+
+    if kind in REPLAYED_KINDS:
+        docs = parse(kind, path)
+        dates = sorted({row_date(kind, d) for d in docs})
+        entry.update({
+            "rows": len(docs),
+            "first_date": dates[0] if dates else None,
+            "last_date": dates[-1] if dates else None,
+            "days": len(dates),
+        })
+    return entry
+
+
+def pack(archive_dir: str = DATA_ARCHIVE_DIR, pack_dir: str = PACK_DIR, workers: int = WORKERS) -> dict:
+    """Packs archive files not yet in the manifest; returns the updated manifest"""
+    os.makedirs(pack_dir, exist_ok=True)
+    # Taken before listing, so every ingestion logged after it is checked by promote
+    started = datetime.now(timezone.utc).replace(microsecond=0)
+    manifest = load_manifest(pack_dir)
+    known = {e["name"] for e in manifest["files"]}
+    new = [
+        os.path.join(archive_dir, name) for name in sorted(os.listdir(archive_dir))
+        if name not in known and is_candidate(name) and os.path.isfile(os.path.join(archive_dir, name))
+    ]
+
+    entries = run_parallel(pack_file, [(path, pack_dir) for path in new], workers)
+    manifest["files"] = sorted(manifest["files"] + entries, key=lambda e: (e["report_time"], e["name"]))
+    manifest["packed_at"] = started.isoformat()
+    write_manifest(pack_dir, manifest)
+
+    raw = sum(e["bytes"] for e in entries)
+    packed = sum(e["packed_bytes"] for e in entries)
+    logger.info(f"Packed {len(entries)} new files ({raw} -> {packed} bytes), manifest holds {len(manifest['files'])}")
+    return manifest
+
+
+@contextmanager
+def unpacked(entry: dict, pack_dir: str):
+    """Decompresses a packed report to a temp file (XLSX needs a seekable file) and checks its hash"""
+    import zstandard
+
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(entry["name"])[1])
+    try:
+        with open(os.path.join(pack_dir, entry["packed"]), "rb") as src, os.fdopen(fd, "wb") as dst:
+            zstandard.ZstdDecompressor().copy_stream(src, dst)
+        if loaders.file_sha256(tmp) != entry["sha256"]:
+            raise ValueError(f"Packed copy of {entry['name']} does not match its manifest hash")
+        yield tmp
+    finally:
+        os.remove(tmp)
+
+
+# --- Replay ----------------------------------------------------------------
+
+def replay_order(manifest: dict) -> list:
+    """Replayed reports in ingest order, keeping only the first copy of identical content"""
+    seen = set()
+    ordered = []
+    for entry in sorted(manifest["files"], key=lambda e: (e["report_time"], e["name"])):
+        if entry["kind"] not in REPLAYED_KINDS or entry["sha256"] in seen:
+            continue
+        seen.add(entry["sha256"])
+        ordered.append(entry)
+    return ordered
+
+
+def scan_keys(entry: dict, pack_dir: str) -> list:
+    with unpacked(entry, pack_dir) as path:
+        return sorted({row_key(entry["kind"], d) for d in parse(entry["kind"], path)})
+
+
+def assign_owners(ordered: list, keys_per_file: list) -> list:
+    """Set of keys each file owns: a key belongs to the last file (in ingest order) containing it"""
+    owner = {}
+    for index, (entry, keys) in enumerate(zip(ordered, keys_per_file)):
+        for key in keys:
+            owner[(entry["kind"], key)] = index
+    owned = [set() for _ in ordered]
+    for (_, key), index in owner.items():
+        owned[index].add(key)
+    return owned
+
+
+def owned_rows(entry: dict, owned: set, pack_dir: str) -> list:
+    """The rows of a packed report that survive in the replayed state"""
+    kind = entry["kind"]
+    with unpacked(entry, pack_dir) as path:
+        # Invoice lines without a number are never replaced by later files, so every copy is kept
+        return [d for d in parse(kind, path) if row_key(kind, d) in owned or (kind == "invoice" and not d["invoice_no"])]
+
+
+def replay_file(entry: dict, owned: set, pack_dir: str, target: str) -> int:
+    db = mongo_store.get_db(target)
+    kind = entry["kind"]
+    docs = owned_rows(entry, owned, pack_dir)
+    if kind == "invoice":
+        return mongo_store.bulk_insert(db.sales_transactions, docs)
+    mongo_store.bulk_upsert(db.footfall, docs, ("date", "location_name"))
+    return len(docs)
+
+
+def run_parallel(fn, arg_tuples: list, workers: int) -> list:
+    """fn(*args) for each tuple, in order; in-process when workers <= 1"""
+    if workers <= 1 or len(arg_tuples) <= 1:
+        return [fn(*args) for args in arg_tuples]
+    with ProcessPoolExecutor(max_workers=min(workers, len(arg_tuples))) as pool:
+        return list(pool.map(fn, *zip(*arg_tuples)))
+
+
+def is_registry(name: str) -> bool:
+    return name in KEY_REGISTRIES or name.startswith("dim_")
+
+
+def registry_names(db) -> list:
+    return sorted(name for name in db.list_collection_names() if is_registry(name))
+
+
+def seed_registries(live, db):
+    """Copies the live key registries into a fresh rebuild, which then only adds keys after them"""
+    for name in registry_names(live):
+        docs = list(live[name].find({}))
+        if docs:
+            db[name].insert_many(docs)
+
+
+def ensure_indexes(db):
+    db.sales_transactions.create_index("invoice_date")
+    db.sales_transactions.create_index("location_name")
+    db.sales_transactions.create_index("invoice_channel_name")
+    db.sales_transactions.create_index("invoice_no")
+    db.footfall.create_index("date")
+
+
+def rebuild(target: str, pack_dir: str = PACK_DIR, workers: int = WORKERS, derived: bool = True) -> dict:
+    """Replays the packed archive into a freshly dropped `target` database"""
+    if target == mongo_store.DB_NAME:
+        raise ValueError("Refusing to rebuild into the live database; use --promote after rebuilding")
+
+    started = time.monotonic()
+    ordered = replay_order(load_manifest(pack_dir))
+    if not ordered:
+        raise ValueError(f"No packed invoice or footfall reports in {pack_dir}, run --pack first")
+
+    mongo_store.get_client().drop_database(target)
+    db = mongo_store.get_db(target)
+    seed_registries(mongo_store.get_db(), db)
+    ensure_indexes(db)
+
+    keys = run_parallel(scan_keys, [(entry, pack_dir) for entry in ordered], workers)
+    owned = assign_owners(ordered, keys)
+    rows = run_parallel(
+        replay_file, [(entry, owned[i], pack_dir, target) for i, entry in enumerate(ordered)], workers
+    )
+    summary = {
+        "files": len(ordered),
+        "sales_rows": sum(r for e, r in zip(ordered, rows) if e["kind"] == "invoice"),
+        "footfall_rows": sum(r for e, r in zip(ordered, rows) if e["kind"] == "footfall"),
+    }
+    logger.info(f"Replayed {summary['files']} reports in {time.monotonic() - started:.1f}s")
+
+    if derived:
+        import daily_rollup
+
+        db.daily_rollup.create_index([("date", 1), ("location_name", 1)])
+        summary["rollup_rows"] = sum(
+            daily_rollup.build_rollup(db, start, end) for start, end in daily_rollup.find_unmarked_ranges(db)
+        )
+        summary["derived"] = daily_rollup.refresh_derived(db)
+
+    summary["seconds"] = round(time.monotonic() - started, 1)
+    return summary
+
+
+def mark_promoted(db, target: str, names: list):
+    """
+    Invalidates what still describes the replaced collections: without a
+    rebuilt `rollup_days` (--skip-derived) the live markers would keep vouching
+    for rollups of the old sales, and the ingestion stamp tells the API that
+    its snapshots, reports and warehouse are stale
+    """
+    if "rollup_days" not in names:
+        db.rollup_days.drop()
+    db.ingestion_logs.insert_one({"filename": f"rebuild:{target}", "status": "success", "source": "rebuild",
+                                  "collections": names, "created_at": datetime.now(timezone.utc)})
+
+
+def unpacked_ingestions(db, manifest: dict) -> list:
+    """Replayed kinds ingested since the archive was packed whose content the manifest does not hold"""
+    packed_at = datetime.fromisoformat(manifest["packed_at"])
+    hashes = {e["sha256"] for e in manifest["files"]}
+    logs = db.ingestion_logs.find(
+        {"status": "success", "source": {"$ne": "rebuild"}, "created_at": {"$gt": packed_at}},
+        {"filename": 1, "file_type": 1, "content_hash": 1},
+    )
+    return [log["filename"] for log in logs
+            if log.get("content_hash") not in hashes and log.get("file_type", "invoice") in REPLAYED_KINDS]
+
+
+def merge_registries(live, rebuilt) -> int:
+    """
+    Adds the keys the rebuild registered to the live registries. Live counters
+    are first moved past the rebuild's, so nothing registered from now on can
+    collide; a value or key registered differently since the rebuild was
+    seeded means the rebuilt tables disagree with the live keys.
+    """
+    for counter in rebuilt.counters.find({}):
+        live.counters.update_one({"_id": counter["_id"]}, {"$max": {"seq": counter["seq"]}}, upsert=True)
+
+    added = {}
+    for name in registry_names(rebuilt):
+        if name == "counters":
+            continue
+        live_keys = {doc["_id"]: doc["key"] for doc in live[name].find({}, {"key": 1})}
+        taken = set(live_keys.values())
+        added[name] = []
+        for doc in rebuilt[name].find({}):
+            key = live_keys.get(doc["_id"])
+            if key == doc["key"]:
+                continue
+            if key is not None or doc["key"] in taken:
+                raise ValueError(f"{name} key {doc['key']} for {doc['_id']!r} was registered differently "
+                                 "since the rebuild; rebuild again")
+            added[name].append(doc)
+
+    for name, docs in added.items():
+        if docs:
+            live[name].insert_many(docs)
+    return sum(len(docs) for docs in added.values())
+
+
+def stamp_rebuilt_markers(db, seq: int):
+    """Marks every rebuilt structure as built from `seq`, the sequence the promote publishes"""
+    mongo_store.bulk_write(db.rollup_days, (
+        UpdateOne(
+            {"_id": marker["_id"]},
+            {"$set": {**{f"built_seq.{kind}": seq for kind in marker.get("kinds", [])}, "changed_seq": seq},
+             "$unset": {"pending_seq": ""}},
+        )
+        for marker in db.rollup_days.find({}, {"kinds": 1})
+    ))
+
+
+def promote(target: str, manifest: dict) -> list:
+    """
+    Renames every rebuilt collection except the key registries and publication
+    state over its live counterpart, under the publication lease, and
+    publishes the result as a new sequence
+    """
+    client = mongo_store.get_client()
+    live, rebuilt = client[mongo_store.DB_NAME], client[target]
+    writer = f"rebuild:{target}:{uuid.uuid4()}"
+    published = batch_publish.acquire_lease(live, writer)
+    seq = published + 1
+    try:
+        missing = unpacked_ingestions(live, manifest)
+        if missing:
+            raise ValueError(f"{len(missing)} report(s) ingested since the archive was packed are not in it "
+                             f"({', '.join(missing[:5])}); rebuild again")
+        merged = merge_registries(live, rebuilt)
+        stamp_rebuilt_markers(rebuilt, seq)
+
+        names = sorted(n for n in rebuilt.list_collection_names() if not is_registry(n) and n not in LIVE_ONLY)
+        for name in names:
+            batch_publish.renew_lease(live, writer)
+            client.admin.command("renameCollection", f"{target}.{name}", to=f"{live.name}.{name}", dropTarget=True)
+        batch_publish.flip(live, writer, seq)
+    finally:
+        batch_publish.release_lease(live, writer)
+
+    mark_promoted(live, target, names)
+    logger.info(f"Promoted {len(names)} collections from {target} to {live.name} as sequence {seq}, "
+                f"merged {merged} new registry keys")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild sales and footfall state from the raw report archive")
+    parser.add_argument("--pack", action="store_true", help="Only compress new archive files and update the manifest")
+    parser.add_argument("--archive", default=DATA_ARCHIVE_DIR, help="Raw report archive directory")
+    parser.add_argument("--pack-dir", default=PACK_DIR, help="Directory for .zst files and manifest.json")
+    parser.add_argument("--target", default=f"{mongo_store.DB_NAME}_rebuild", help="Database to rebuild into")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--skip-derived", action="store_true", help="Do not build the rollup and derived tables")
+    parser.add_argument("--promote", action="store_true", help="Replace the live collections with the rebuild")
+    args = parser.parse_args()
+
+    manifest = pack(args.archive, args.pack_dir, args.workers)
+    if args.pack:
+        print(f"SUCCESS: Manifest holds {len(manifest['files'])} files")
+        return
+
+    try:
+        summary = rebuild(args.target, args.pack_dir, args.workers, derived=not args.skip_derived)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    if args.promote:
+        try:
+            summary["promoted"] = promote(args.target, manifest)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+
+    print(json.dumps(summary, indent=2, default=str))
+    print(f"SUCCESS: Rebuilt {summary['sales_rows']} sales rows and {summary['footfall_rows']} "
+          f"footfall rows from {summary['files']} reports in {summary['seconds']}s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
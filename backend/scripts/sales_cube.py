@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Hourly Sales Cube Builder
+Maintains a dense day x hour x location cube in `sales_cube`: one document per
+(date, location) holding 24-slot arrays of sales-bill net value, distinct bill
+count and quantity, plus the day's all-lines net sales. /api/analytics/hourly
+and /trends read a range as a slice-and-sum over these documents instead of
+re-parsing `invoice_time` and regrouping line items.
+
+Coverage uses the same `rollup_days` markers as daily_rollup.py (kind
+"sales_cube"); publishing a batch makes the markers of the days it rewrites stale.
+
+Requires: pymongo (via mongo_store)
+
+Usage:
+    python sales_cube.py                            # build all unmarked days
+    python sales_cube.py --start 2026-01-01 --end 2026-01-31
+    python sales_cube.py --hourly 2026-01-01 2026-01-31 [--location "Jacadi MOA"]
+"""
+
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime, timezone
+
+from pymongo import ReplaceOne
+
+import batch_publish
+from mongo_store import bulk_write, get_db
+from daily_rollup import daterange, find_unmarked_ranges, is_sales_bill, mark_built
+from loaders import parse_invoice_hour
+
+logger = logging.getLogger(__name__)
+
+CUBE_KIND = "sales_cube"
+HOURS = 24
+
+
+def line_hour(line: dict):
+    """Ingestion stores `invoice_hour`; rows loaded before that only have `invoice_time`"""
+    hour = line.get("invoice_hour")
+    return hour if hour is not None else parse_invoice_hour(line.get("invoice_time"))
+
+
+def accumulate(lines) -> dict:
+    """Folds line items into {(date, location): cell} with dense per-hour arrays"""
+    cells = {}
+    for line in lines:
+        key = (line["invoice_date"], line.get("location_name", ""))
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = {
+                "day_sales": 0.0,
+                "sales": [0.0] * HOURS,
+                "qty": [0] * HOURS,
+                "bill_sets": [set() for _ in range(HOURS)],
+            }
+
+        value = line.get("nett_invoice_value") or 0
+        cell["day_sales"] += value
+
+        hour = line_hour(line)
+        if hour is None or not is_sales_bill(line):
+            continue
+        cell["sales"][hour] += value
+        cell["qty"][hour] += line.get("total_sales_qty") or 0
+        if line.get("invoice_no"):
+            cell["bill_sets"][hour].add(line["invoice_no"])
+
+    for cell in cells.values():
+        cell["bills"] = [len(s) for s in cell.pop("bill_sets")]
+    return cells
+
+
+def sum_hours(docs) -> list:
+    """Slice-and-sum: hourly totals over cube documents, only hours with sales"""
+    sales = [0.0] * HOURS
+    bills = [0] * HOURS
+    for doc in docs:
+        for h in range(HOURS):
+            sales[h] += doc["sales"][h]
+            bills[h] += doc["bills"][h]
+    return [
+        {"hour": f"{h:02d}", "trx_count": bills[h], "total_sales": sales[h]}
+        for h in range(HOURS)
+        if bills[h] or sales[h]
+    ]
+
+
+def build_cube(db, start_date: str, end_date: str) -> int:
+    """Recomputes cube documents for every day in [start_date, end_date]"""
+    seq = batch_publish.published_seq(db)
+    cursor = db.sales_transactions.find(
+        batch_publish.visible(db, {"invoice_date": {"$gte": start_date, "$lte": end_date}}, seq),
+        {"_id": 0, "invoice_no": 1, "invoice_date": 1, "invoice_time": 1, "invoice_hour": 1,
+         "location_name": 1, "transaction_type": 1, "mh1_description": 1,
+         "nett_invoice_value": 1, "total_sales_qty": 1},
+        batch_size=5000,
+    )
+    cells = accumulate(cursor)
+
+    now = datetime.now(timezone.utc)
+    ids = [f"{date}|{location}" for date, location in cells]
+    ops = [
+        ReplaceOne(
+            {"_id": _id},
+            {"date": date, "location_name": location, **cell, "built_at": now},
+            upsert=True,
+        )
+        for _id, ((date, location), cell) in zip(ids, cells.items())
+    ]
+
+    db.sales_cube.delete_many({
+        "date": {"$gte": start_date, "$lte": end_date},
+        "_id": {"$nin": ids},
+    })
+    bulk_write(db.sales_cube, ops)
+
+    days = list(daterange(start_date, end_date))
+    mark_built(db, CUBE_KIND, days, seq, now)
+
+    logger.info(f"Built {len(ops)} cube rows over {len(days)} days")
+    return len(ops)
+
+
+def refresh(db) -> int:
+    """Builds every unmarked range; called after each rollup refresh"""
+    return sum(build_cube(db, start, end) for start, end in find_unmarked_ranges(db, CUBE_KIND))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the day x hour x location sales cube")
+    parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="End date YYYY-MM-DD")
+    parser.add_argument("--hourly", nargs=2, metavar=("START", "END"), help="Print hourly totals for a range")
+    parser.add_argument("--location", action="append", help="Restrict --hourly to location(s)")
+    args = parser.parse_args()
+
+    db = get_db()
+    db.sales_cube.create_index([("date", 1), ("location_name", 1)])
+
+    if args.hourly:
+        query = {"date": {"$gte": args.hourly[0], "$lte": args.hourly[1]}}
+        if args.location:
+            query["location_name"] = {"$in": args.location}
+        print(json.dumps(sum_hours(db.sales_cube.find(query, {"sales": 1, "bills": 1})), indent=2))
+        return
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            logger.error("--start and --end must be given together")
+            sys.exit(1)
+        total = build_cube(db, args.start, args.end)
+    else:
+        total = refresh(db)
+    print(f"SUCCESS: Built {total} cube rows")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
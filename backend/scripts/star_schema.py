@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Star Schema Builder
+Dictionary-encodes sales line items into a narrow `sales_facts` collection of
+ints and floats, with dimension tables holding each long string once:
+
+    dim_location     location_name (+ code, city, state, store type)
+    dim_product      product_code (+ name)
+    dim_category     category_name
+    dim_brand        brand_name
+    dim_salesperson  sales_person_code (+ name)
+    dim_channel      order/invoice/sub channel combination
+
+Every dimension document is {_id: natural key, key: int, ...attributes};
+surrogate keys come from `counters` like the invoice prefix registry and are
+never reused, so keys cached by the API stay valid across rebuilds.
+
+`sales_transactions` stays the system of record. Facts are rebuilt per day
+range and tracked with `rollup_days` markers (kind "sales_facts"), so
+re-ingested days are re-encoded on the next refresh.
+
+Facts are a read-side copy: they make filters and group-bys compare ints, but
+they add to storage rather than replace the line items. Dropping the repeated
+strings from `sales_transactions` would need the loaders to write facts
+directly and every reader of those columns (ETL service, customer state,
+leaderboards, exports, rebuild) to move to facts and dimensions; `--stats`
+reports what the star schema adds.
+
+Requires: pymongo (via mongo_store)
+
+Usage:
+    python star_schema.py                           # encode all unmarked days
+    python star_schema.py --start 2026-01-01 --end 2026-01-31
+    python star_schema.py --stats                   # storage of facts vs line items
+"""
+
+import sys
+import logging
+import argparse
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+import batch_publish
+from mongo_store import bulk_insert, get_db
+from daily_rollup import daterange, find_unmarked_ranges, is_sales_bill, mark_built, load_prefix_ids, register_prefix
+from invoice_sketch import encode_invoice_no, invoice_prefix
+from loaders import parse_invoice_hour
+
+logger = logging.getLogger(__name__)
+
+FACTS_KIND = "sales_facts"
+
+# dimension -> (fact field, natural key fields, attribute fields)
+DIMENSIONS = {
+    "location": ("loc", ("location_name",), ("location_code", "city", "state", "store_type")),
+    "product": ("prod", ("product_code",), ("product_name",)),
+    "category": ("cat", ("category_name",), ()),
+    "brand": ("brand", ("brand_name",), ()),
+    "salesperson": ("sp", ("sales_person_code",), ("sales_person_name",)),
+    "channel": ("ch", ("order_channel_name", "invoice_channel_code", "invoice_channel_name",
+                       "sub_channel_code", "sub_channel_name"), ()),
+}
+
+# line item field -> fact field
+MEASURES = {
+    "total_sales_qty": "qty",
+    "nett_invoice_value": "nett",
+    "invoice_mrp_value": "mrp",
+    "invoice_discount_value": "disc",
+    "invoice_basic_value": "basic",
+    "total_tax_amt": "tax",
+}
+
+LINE_PROJECTION = dict.fromkeys(
+    ["invoice_no", "invoice_date", "invoice_time", "invoice_hour", "transaction_type", "mh1_description"]
+    + [f for _, keys, attrs in DIMENSIONS.values() for f in keys + attrs]
+    + list(MEASURES),
+    1,
+)
+
+
+def date_key(date: str) -> int:
+    """'2026-01-31' -> 20260131 (sorts and compares like the string)"""
+    return int(date.replace("-", ""))
+
+
+def natural_key(line: dict, fields) -> str:
+    return "|".join(str(line.get(f) or "") for f in fields)
+
+
+class Dimension:
+    """In-memory view of one dimension table; unseen values are registered on first use"""
+
+    def __init__(self, db, name: str):
+        self.db = db
+        self.name = name
+        self.collection = db[f"dim_{name}"]
+        self.fact_field, self.key_fields, self.attr_fields = DIMENSIONS[name]
+        self.keys = {doc["_id"]: doc["key"] for doc in self.collection.find({}, {"key": 1})}
+
+    def key_for(self, line: dict) -> int:
+        natural = natural_key(line, self.key_fields)
+        key = self.keys.get(natural)
+        if key is None:
+            key = self.keys[natural] = self.register(natural, line)
+        return key
+
+    def register(self, natural: str, line: dict) -> int:
+        counter = self.db.counters.find_one_and_update(
+            {"_id": f"dim_{self.name}"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        attrs = {f: line.get(f) or "" for f in self.key_fields + self.attr_fields}
+        # $setOnInsert keeps the first key if another process registered the value concurrently
+        self.collection.update_one(
+            {"_id": natural}, {"$setOnInsert": {"key": counter["seq"], **attrs}}, upsert=True
+        )
+        return self.collection.find_one({"_id": natural}, {"key": 1})["key"]
+
+
+def to_fact(line: dict, dimensions: dict, prefix_ids: dict, db) -> dict:
+    fact = {"d": date_key(line["invoice_date"])}
+
+    hour = line.get("invoice_hour")
+    hour = hour if hour is not None else parse_invoice_hour(line.get("invoice_time"))
+    if hour is not None:
+        fact["h"] = hour
+
+    invoice_no = line.get("invoice_no")
+    if invoice_no:
+        prefix = invoice_prefix(invoice_no)
+        if prefix not in prefix_ids:
+            register_prefix(db, prefix, prefix_ids)
+        fact["inv"] = encode_invoice_no(invoice_no, prefix_ids)
+    fact["tt"] = line.get("transaction_type") or ""
+    fact["sb"] = 1 if is_sales_bill(line) else 0
+
+    for dimension in dimensions.values():
+        fact[dimension.fact_field] = dimension.key_for(line)
+    for source, target in MEASURES.items():
+        fact[target] = line.get(source) or 0
+    return fact
+
+
+def build_facts(db, start_date: str, end_date: str) -> int:
+    """Re-encodes every line item in [start_date, end_date] into sales_facts"""
+    seq = batch_publish.published_seq(db)
+    dimensions = {name: Dimension(db, name) for name in DIMENSIONS}
+    prefix_ids = load_prefix_ids(db)
+
+    cursor = db.sales_transactions.find(
+        batch_publish.visible(db, {"invoice_date": {"$gte": start_date, "$lte": end_date}}, seq),
+        {"_id": 0, **LINE_PROJECTION},
+        batch_size=5000,
+    )
+    facts = (to_fact(line, dimensions, prefix_ids, db) for line in cursor)
+
+    db.sales_facts.delete_many({"d": {"$gte": date_key(start_date), "$lte": date_key(end_date)}})
+    written = bulk_insert(db.sales_facts, facts)
+
+    now = datetime.now(timezone.utc)
+    days = list(daterange(start_date, end_date))
+    mark_built(db, FACTS_KIND, days, seq, now)
+
+    logger.info(f"Encoded {written} facts over {len(days)} days")
+    return written
+
+
+def refresh(db) -> int:
+    return sum(build_facts(db, start, end) for start, end in find_unmarked_ranges(db, FACTS_KIND))
+
+
+def ensure_indexes(db):
+    db.sales_facts.create_index([("d", 1), ("loc", 1)])
+    db.sales_facts.create_index([("brand", 1), ("d", 1)])
+    db.sales_facts.create_index([("cat", 1), ("d", 1)])
+    for name in DIMENSIONS:
+        db[f"dim_{name}"].create_index("key", unique=True)
+
+
+def storage_stats(db) -> dict:
+    def stats(name):
+        s = db.command("collStats", name)
+        return {"count": s.get("count", 0), "size": s.get("size", 0),
+                "storage": s.get("storageSize", 0), "indexes": s.get("totalIndexSize", 0)}
+
+    result = {"sales_transactions": stats("sales_transactions"), "sales_facts": stats("sales_facts")}
+    for name in DIMENSIONS:
+        result[f"dim_{name}"] = stats(f"dim_{name}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dictionary-encoded sales fact table")
+    parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="End date YYYY-MM-DD")
+    parser.add_argument("--stats", action="store_true", help="Print storage of line items, facts and dimensions")
+    args = parser.parse_args()
+
+    db = get_db()
+    ensure_indexes(db)
+
+    if args.stats:
+        stats = storage_stats(db)
+        for name, s in stats.items():
+            print(f"{name:<20} {s['count']:>10} docs  data {s['size'] / 1e6:9.2f} MB  "
+                  f"storage {s['storage'] / 1e6:9.2f} MB  indexes {s['indexes'] / 1e6:9.2f} MB")
+        added = sum(s["storage"] + s["indexes"] for name, s in stats.items() if name != "sales_transactions")
+        print(f"{'star schema adds':<20} {added / 1e6:9.2f} MB (storage + indexes)")
+        return
+
+    if args.start or args.end:
+        if not (args.start and args.end):
+            logger.error("--start and --end must be given together")
+            sys.exit(1)
+        total = build_facts(db, args.start, args.end)
+    else:
+        total = refresh(db)
+    print(f"SUCCESS: Encoded {total} facts")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Per-Store DSR Metrics
+Computes the DSR store rows (net sales, units, TRX, ATV, UPT) for a date range
+by fanning the line items out over a process pool, one task per store or per
+store x window of days, instead of one pass over every store.
+
+Line items are loaded once into columnar arrays in shared memory, sorted by
+(store, day), so every task is a contiguous slice that workers read in place
+without pickling rows. Each task returns a partial (correctly rounded sum, units,
+lines and the roaring bitmap of its sales bills). The reducer merges partials
+in (store, window) order - sums with math.fsum, bills by bitmap union - so the
+store rows and the total row are identical for any worker count or completion
+order. TRX in the total row is the union of all store bills, as on the
+dashboard, not the sum of store TRX.
+
+dsr_report.py uses these rows for the Store KPIs sheet of the DSR workbooks.
+
+Requires: pymongo (via mongo_store), pyroaring
+
+Configuration (environment):
+    STORE_METRICS_WORKERS     worker processes (default: CPU count)
+
+Usage:
+    python store_metrics.py --start 2026-01-01 --end 2026-01-31 [--workers 8] [--window-days 7]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+from array import array
+from bisect import bisect_left
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from pyroaring import BitMap
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get("STORE_METRICS_WORKERS", "0")) or os.cpu_count() or 1
+NO_BILL = -1
+
+# name -> array typecode; `bill` is the encoded invoice id of a sales bill line, NO_BILL otherwise
+COLUMNS = {"store": "i", "day": "i", "nett": "d", "qty": "q", "bill": "q"}
+
+
+class SharedColumns:
+    """Equal-length typed columns in shared memory blocks, attachable by name from other processes"""
+
+    def __init__(self, blocks: dict, length: int):
+        self.blocks = blocks
+        self.length = length
+        self.views = {
+            name: block.buf.cast(COLUMNS[name])[:length] for name, block in blocks.items()
+        }
+
+    @classmethod
+    def create(cls, columns: dict):
+        length = len(columns["store"])
+        blocks = {}
+        for name, values in columns.items():
+            data = array(COLUMNS[name], values)
+            block = shared_memory.SharedMemory(create=True, size=max(len(data) * data.itemsize, 8))
+            block.buf[:len(data) * data.itemsize] = data.tobytes()
+            blocks[name] = block
+        return cls(blocks, length)
+
+    @classmethod
+    def attach(cls, spec: dict):
+        blocks = {name: shared_memory.SharedMemory(name=block_name) for name, block_name in spec["blocks"].items()}
+        return cls(blocks, spec["length"])
+
+    @property
+    def spec(self) -> dict:
+        return {"blocks": {name: block.name for name, block in self.blocks.items()}, "length": self.length}
+
+    def close(self, unlink: bool = False):
+        for view in self.views.values():
+            view.release()
+        self.views = {}
+        for block in self.blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+
+
+def columnize(lines, prefix_ids: dict, start_date: str, register=None):
+    """
+    Line items -> (store names, columns sorted by (store, day)). `register(prefix)`
+    assigns registry ids to unseen invoice prefixes (daily_rollup.register_prefix).
+    """
+    from daily_rollup import is_sales_bill
+    from invoice_sketch import encode_invoice_no, invoice_prefix
+
+    first = date.fromisoformat(start_date)
+    rows = []
+    for line in lines:
+        bill = NO_BILL
+        invoice_no = line.get("invoice_no")
+        if is_sales_bill(line) and invoice_no:
+            prefix = invoice_prefix(invoice_no)
+            if prefix not in prefix_ids and register:
+                register(prefix)
+            bill = encode_invoice_no(invoice_no, prefix_ids)
+        rows.append((
+            line.get("location_name") or "",
+            (date.fromisoformat(line["invoice_date"]) - first).days,
+            float(line.get("nett_invoice_value") or 0),
+            int(line.get("total_sales_qty") or 0) if bill != NO_BILL else 0,
+            bill,
+        ))
+    rows.sort(key=lambda r: (r[0], r[1]))
+
+    stores = sorted({r[0] for r in rows})
+    index = {name: i for i, name in enumerate(stores)}
+    columns = {
+        "store": [index[r[0]] for r in rows],
+        "day": [r[1] for r in rows],
+        "nett": [r[2] for r in rows],
+        "qty": [r[3] for r in rows],
+        "bill": [r[4] for r in rows],
+    }
+    return stores, columns
+
+
+def plan_tasks(store_col, day_col, window_days: int = 0) -> list:
+    """(store, window, lo, hi) slices of the sorted columns: one per store, or per store x window"""
+    tasks = []
+    lo, length = 0, len(store_col)
+    while lo < length:
+        store = store_col[lo]
+        hi = bisect_left(store_col, store + 1, lo)
+        if window_days:
+            cut = lo
+            while cut < hi:
+                window = day_col[cut] // window_days
+                end = bisect_left(day_col, (window + 1) * window_days, cut, hi)
+                tasks.append((store, window, cut, end))
+                cut = end
+        else:
+            tasks.append((store, 0, lo, hi))
+        lo = hi
+    return tasks
+
+
+_columns = None
+
+
+def _attach(spec: dict):
+    global _columns
+    _columns = SharedColumns.attach(spec)
+
+
+def slice_metrics(task: tuple) -> tuple:
+    """Partial metrics for one (store, window, lo, hi) slice of the shared columns"""
+    store, window, lo, hi = task
+    views = _columns.views
+    bills = BitMap(b for b in views["bill"][lo:hi] if b != NO_BILL)
+    return (store, window, math.fsum(views["nett"][lo:hi]), sum(views["qty"][lo:hi]), hi - lo, bills.serialize())
+
+
+def store_row(name: str, nett: float, qty: int, lines: int, bills: BitMap) -> dict:
+    trx = len(bills)
+    return {
+        "location_name": name,
+        "nett_sales": round(nett, 2),
+        "sales_qty": qty,
+        "line_count": lines,
+        "trx": trx,
+        "atv": round(nett / trx, 2) if trx else 0,
+        "upt": round(qty / trx, 2) if trx else 0,
+    }
+
+
+def reduce_partials(stores: list, partials) -> dict:
+    """Store rows and the total row, independent of the order partials arrive in"""
+    merged = {}
+    for store, window, nett, qty, lines, bills in sorted(partials, key=lambda p: (p[0], p[1])):
+        entry = merged.setdefault(store, {"nett": [], "qty": 0, "lines": 0, "bills": BitMap()})
+        entry["nett"].append(nett)
+        entry["qty"] += qty
+        entry["lines"] += lines
+        entry["bills"] |= BitMap.deserialize(bills)
+
+    rows, all_bills = [], BitMap()
+    for store in sorted(merged):
+        entry = merged[store]
+        entry["nett"] = math.fsum(entry["nett"])
+        rows.append(store_row(stores[store], entry["nett"], entry["qty"], entry["lines"], entry["bills"]))
+        all_bills |= entry["bills"]
+
+    total = store_row(
+        "Total",
+        math.fsum(merged[s]["nett"] for s in sorted(merged)),
+        sum(e["qty"] for e in merged.values()),
+        sum(e["lines"] for e in merged.values()),
+        all_bills,
+    )
+    return {"stores": rows, "total": total}
+
+
+def compute(stores: list, columns: dict, workers: int = WORKERS, window_days: int = 0) -> dict:
+    """Fans the slices of `columns` out over `workers` processes and reduces them"""
+    shared = SharedColumns.create(columns)
+    try:
+        tasks = plan_tasks(shared.views["store"], shared.views["day"], window_days)
+        if workers <= 1 or len(tasks) <= 1:
+            _attach(shared.spec)
+            try:
+                partials = [slice_metrics(task) for task in tasks]
+            finally:
+                _columns.close()
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_attach,
+                                     initargs=(shared.spec,)) as pool:
+                partials = list(pool.map(slice_metrics, tasks, chunksize=max(len(tasks) // (workers * 4), 1)))
+    finally:
+        shared.close(unlink=True)
+    return reduce_partials(stores, partials)
+
+
+def store_metrics(db, start_date: str, end_date: str, workers: int = WORKERS, window_days: int = 0,
+                  locations=None) -> dict:
+    """
+    DSR store rows and total row for [start_date, end_date] from published
+    sales lines. `load_seconds` (Mongo read, columnize and sort, all on this
+    process) and `compute_seconds` (the fan-out) are reported separately.
+    """
+    import batch_publish
+    from daily_rollup import load_prefix_ids, register_prefix
+
+    started = time.monotonic()
+    query = {"invoice_date": {"$gte": start_date, "$lte": end_date}}
+    if locations:
+        query["location_name"] = {"$in": list(locations)}
+    cursor = db.sales_transactions.find(
+        batch_publish.visible(db, query),
+        {"_id": 0, "invoice_no": 1, "invoice_date": 1, "location_name": 1, "transaction_type": 1,
+         "mh1_description": 1, "nett_invoice_value": 1, "total_sales_qty": 1},
+        batch_size=5000,
+    )
+    prefix_ids = load_prefix_ids(db)
+    stores, columns = columnize(cursor, prefix_ids, start_date, lambda p: register_prefix(db, p, prefix_ids))
+    loaded = time.monotonic()
+    result = compute(stores, columns, workers, window_days)
+    result.update({"start_date": start_date, "end_date": end_date, "load_seconds": round(loaded - started, 3),
+                   "compute_seconds": round(time.monotonic() - loaded, 3)})
+    return result
+
+
+def main():
+    from mongo_store import get_db
+
+    parser = argparse.ArgumentParser(description="Per-store DSR metrics over a process pool")
+    parser.add_argument("--start", type=str, help="Start date YYYY-MM-DD")
+    parser.add_argument("--end", type=str, help="End date YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Worker processes")
+    parser.add_argument("--window-days", type=int, default=0, help="Also split each store into windows of N days")
+    parser.add_argument("--location", action="append", help="Restrict to location(s)")
+    args = parser.parse_args()
+
+    if not (args.start and args.end):
+        logger.error("--start and --end must be given together")
+        sys.exit(1)
+
+    result = store_metrics(get_db(), args.start, args.end, args.workers, args.window_days, args.location)
+    print(json.dumps(result))
+    print(f"SUCCESS: {len(result['stores'])} stores, total {result['total']['nett_sales']} "
+          f"over {result['total']['trx']} bills")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -8,6 +8,9 @@ import ingestionRoutes from './routes/ingestion.routes';
 import analyticsRoutes from './routes/analytics.routes';
 import { initScheduler } from './services/scheduler.service';
 import { connectDB } from './config/mongodb';
+import { pinPublication } from './services/publication.service';
+import { generateDateDim } from './services/ingestion.service';
+import { reloadDateDim } from './services/calendar.service';
 
 dotenv.config();
 
@@ -26,9 +29,9 @@ app.use((req, res, next) => {
 // Routes
 app.use('/api/auth', authRoutes);
 app.use('/api/users', userRoutes);
-app.use('/api/dashboards', dashboardRoutes);
+app.use('/api/dashboards', pinPublication, dashboardRoutes);
 app.use('/api/ingest', ingestionRoutes);
-app.use('/api/analytics', analyticsRoutes);
+app.use('/api/analytics', pinPublication, analyticsRoutes);
 
 app.get('/health', (req, res) => {
   res.json({ status: 'ok', timestamp: new Date().toISOString() });
@@ -42,6 +45,14 @@ const startServer = async () => {
   try {
     await connectDB();
     console.log('[Server] MongoDB connected successfully');
+
+    // Period windows read the fiscal date dimension; without it they are computed on the fly
+    try {
+      await generateDateDim();
+      reloadDateDim();
+    } catch (error) {
+      console.error('[Server] Date dimension generation failed, computing periods on the fly:', error);
+    }
     
     // Initialize Daily Ingestion Scheduler (6:00 AM) after DB is ready
     initScheduler();
@@ -33,6 +33,11 @@ const createIndexes = async () => {
         await db.collection('sales_transactions').createIndex({ location_name: 1 });
         await db.collection('sales_transactions').createIndex({ invoice_channel_name: 1 });
         await db.collection('sales_transactions').createIndex({ invoice_no: 1 });
+        await db.collection('sales_transactions').createIndex({ batch_seq: 1 }, { sparse: true });
+        await db.collection('sales_transactions').createIndex({ retired_seq: 1 }, { sparse: true });
+        
+        // Batch publication indexes
+        await db.collection('ingest_batches').createIndex({ status: 1, published_at: 1 });
         
         // Users indexes
         await db.collection('users').createIndex({ email: 1 }, { unique: true });
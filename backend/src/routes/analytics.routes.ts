@@ -1,6 +1,11 @@
 import { Router } from 'express';
 import { getCollection } from '../config/mongodb';
-import { authenticateJWT } from '../middleware/auth.middleware';
+import { authenticateJWT, authorizeRole } from '../middleware/auth.middleware';
+import { isRollupCovered, getHourlyCube, getDailySalesTrend } from '../services/rollup.service';
+import { getCustomerCounts } from '../services/customer.service';
+import { getLeaderboard, LeaderboardKind, LeaderboardMetric } from '../services/leaderboard.service';
+import { visibleSales } from '../services/publication.service';
+import { runAdhocQuery, runAdhocQueryArrow, listSavedQueries } from '../services/query.service';
 
 const router = Router();
 
@@ -20,13 +25,21 @@ const buildDateFilter = (startDate?: string, endDate?: string) => {
     return filter;
 };
 
+// The hourly cube only answers closed ranges whose every day has been built
+const cubeCovers = async (startDate?: string, endDate?: string): Promise<boolean> =>
+    startDate && endDate ? isRollupCovered('sales_cube', startDate, endDate) : false;
+
 // GET /api/analytics/trends - Sales Trend
 router.get('/trends', async (req, res) => {
     try {
         const { startDate, endDate } = req.query;
+        if (await cubeCovers(startDate as string, endDate as string)) {
+            return res.json(await getDailySalesTrend(startDate as string, endDate as string));
+        }
+
         const salesTx = getCollection('sales_transactions');
         
-        const dateFilter = buildDateFilter(startDate as string, endDate as string);
+        const dateFilter = await visibleSales(buildDateFilter(startDate as string, endDate as string));
         
         const result = await salesTx.aggregate([
             { $match: dateFilter },
@@ -50,9 +63,13 @@ router.get('/trends', async (req, res) => {
 router.get('/hourly', async (req, res) => {
     try {
         const { startDate, endDate } = req.query;
+        if (await cubeCovers(startDate as string, endDate as string)) {
+            return res.json(await getHourlyCube(startDate as string, endDate as string));
+        }
+
         const salesTx = getCollection('sales_transactions');
         
-        const dateFilter = buildDateFilter(startDate as string, endDate as string);
+        const dateFilter = await visibleSales(buildDateFilter(startDate as string, endDate as string));
         dateFilter.invoice_time = { $exists: true, $ne: '' };
         // Only count actual sales transactions (IV, IR) with mh1_description = 'Sales'
         dateFilter.transaction_type = { $in: ['IV', 'IR'] };
@@ -95,7 +112,7 @@ router.get('/summary', async (req, res) => {
         const { startDate, endDate } = req.query;
         const salesTx = getCollection('sales_transactions');
         
-        const dateFilter = buildDateFilter(startDate as string, endDate as string);
+        const dateFilter = await visibleSales(buildDateFilter(startDate as string, endDate as string));
         
         // Use the same logic as main dashboard KPI cards
         // Transactions: Only count invoices where transaction_type IN ('IV', 'IR') AND mh1_description = 'Sales'
@@ -180,7 +197,7 @@ router.get('/channel-split', async (req, res) => {
         const { startDate, endDate } = req.query;
         const salesTx = getCollection('sales_transactions');
         
-        const dateFilter = buildDateFilter(startDate as string, endDate as string);
+        const dateFilter = await visibleSales(buildDateFilter(startDate as string, endDate as string));
         
         const result = await salesTx.aggregate([
             { $match: dateFilter },
@@ -206,7 +223,7 @@ router.get('/store-performance', async (req, res) => {
         const { startDate, endDate } = req.query;
         const salesTx = getCollection('sales_transactions');
         
-        const dateFilter = buildDateFilter(startDate as string, endDate as string);
+        const dateFilter = await visibleSales(buildDateFilter(startDate as string, endDate as string));
         
         const result = await salesTx.aggregate([
             { $match: dateFilter },
@@ -256,4 +273,85 @@ router.get('/store-performance', async (req, res) => {
     }
 });
 
+// GET /api/analytics/customers - New / Repeat / Lapsed customers per location
+router.get('/customers', async (req, res) => {
+    try {
+        const { startDate, endDate, location } = req.query;
+        if (!startDate || !endDate) {
+            return res.status(400).json({ message: 'startDate and endDate are required' });
+        }
+        const locations = ((location as string) || '').split(',').filter(Boolean);
+        res.json(await getCustomerCounts(startDate as string, endDate as string, locations));
+    } catch (error: any) {
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+});
+
+// GET /api/analytics/top-products - Best / worst sellers by SKU or category
+router.get('/top-products', async (req, res) => {
+    try {
+        const { startDate, endDate, location } = req.query;
+        if (!startDate || !endDate) {
+            return res.status(400).json({ message: 'startDate and endDate are required' });
+        }
+
+        const kind: LeaderboardKind = req.query.kind === 'category' ? 'category' : 'sku';
+        const metric: LeaderboardMetric = req.query.metric === 'qty' ? 'qty' : 'value';
+        const n = Math.min(Math.max(parseInt((req.query.n as string) || '10', 10) || 10, 1), 100);
+        const worst = req.query.order === 'worst';
+        const locations = ((location as string) || '').split(',').filter(Boolean);
+
+        res.json(await getLeaderboard(startDate as string, endDate as string, kind, metric, n, locations, worst));
+    } catch (error: any) {
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+});
+
+// GET /api/analytics/query/saved - Saved ad-hoc queries and their parameters (Admin only)
+router.get('/query/saved', authorizeRole(['admin']), async (req, res) => {
+    try {
+        res.json(await listSavedQueries());
+    } catch (error: any) {
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+});
+
+// POST /api/analytics/query - Read-only SQL over the archive warehouse (Admin only)
+// Body: { sql | saved, params?, max_rows?, timeout_s?, format?: 'json' | 'arrow' }
+router.post('/query', authorizeRole(['admin']), async (req, res) => {
+    const { sql, saved, params, max_rows, timeout_s, format } = req.body || {};
+    if (!sql === !saved) {
+        return res.status(400).json({ message: 'Provide either sql or saved' });
+    }
+    if (params !== undefined && (params === null || typeof params !== 'object' || Array.isArray(params))) {
+        return res.status(400).json({ message: 'params must be an object of named parameters' });
+    }
+
+    const query = {
+        sql,
+        saved,
+        params,
+        maxRows: parseInt(max_rows, 10) || undefined,
+        timeoutS: parseFloat(timeout_s) || undefined
+    };
+    try {
+        if (format === 'arrow') {
+            const { data, truncated, rowCount } = await runAdhocQueryArrow(query);
+            res.setHeader('Content-Type', 'application/vnd.apache.arrow.stream');
+            res.setHeader('X-Query-Rows', String(rowCount));
+            res.setHeader('X-Query-Truncated', String(truncated));
+            return res.send(data);
+        }
+        res.json(await runAdhocQuery(query));
+    } catch (error: any) {
+        if (error.type === 'QueryTimeout') {
+            return res.status(504).json({ message: error.message });
+        }
+        if (error.type === 'QueryError') {
+            return res.status(400).json({ message: error.message });
+        }
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+});
+
 export default router;
@@ -14,6 +14,7 @@ import {
 } from '../services/etl.service';
 
 import { authenticateJWT } from '../middleware/auth.middleware';
+import { serveSnapshot } from '../services/snapshot.service';
 
 const router = Router();
 
@@ -87,6 +88,9 @@ router.get('/:id/categories', async (req, res) => {
     }
 });
 
+// Default views (latest date, all stores or one store) come from pre-rendered snapshots
+router.get('/:id/:tab', serveSnapshot);
+
 // Get retail efficiency metrics (Conversion, ATV, Footfall, etc)
 router.get('/:id/retail-efficiency', async (req, res) => {
     try {
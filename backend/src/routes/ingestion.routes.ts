@@ -3,6 +3,9 @@ import { authenticateJWT, authorizeRole } from '../middleware/auth.middleware';
 import { runDailyAutomation } from '../services/scheduler.service';
 import { getCollection } from '../config/mongodb';
 import { processInvoiceCSV, processFootfallCSV } from '../services/etl.service';
+import { isWatcherEnabled } from '../services/ingestion.service';
+import { renderSnapshots } from '../services/snapshot.service';
+import { visibleSales } from '../services/publication.service';
 import multer from 'multer';
 import path from 'path';
 import fs from 'fs';
@@ -49,6 +52,16 @@ router.post('/run', authenticateJWT, authorizeRole(['admin']), async (req, res)
     }
 });
 
+// Re-render the pre-rendered dashboard snapshots on demand
+router.post('/snapshots', authenticateJWT, authorizeRole(['admin']), async (req, res) => {
+    try {
+        const manifest = await renderSnapshots();
+        res.json({ message: 'Snapshots rendered', version: manifest.version, files: Object.keys(manifest.files).length });
+    } catch (error) {
+        res.status(500).json({ message: 'Snapshot render failed', error: (error as Error).message });
+    }
+});
+
 router.get('/logs', authenticateJWT, authorizeRole(['admin']), async (req, res) => {
     try {
         const logs = getCollection('ingestion_logs');
@@ -95,6 +108,11 @@ router.post('/upload/invoice', authenticateJWT, authorizeRole(['admin']), upload
     const filePath = req.file.path;
     const filename = req.file.filename;
 
+    // Upload already landed in DATA_INPUT_DIR; let the watcher classify, dedupe and ingest it
+    if (isWatcherEnabled()) {
+        return res.status(202).json({ message: 'File queued for ingestion', filename });
+    }
+
     try {
         console.log(`📤 Manual upload: Processing invoice file ${filename}`);
         
@@ -115,6 +133,13 @@ router.post('/upload/invoice', authenticateJWT, authorizeRole(['admin']), upload
         const archivePath = path.join(archiveDir, filename);
         fs.renameSync(filePath, archivePath);
 
+        // Rebuild rollups in the background; summaries use live aggregation meanwhile
+        import('../services/ingestion.service')
+            .then(({ refreshRollups }) => refreshRollups())
+            .catch(err => console.error('⚠️ Rollup refresh failed:', err))
+            .then(() => renderSnapshots())
+            .catch(err => console.error('⚠️ Snapshot render failed:', err));
+
         console.log(`✅ Manual upload successful: ${rowCount} invoice records processed`);
         res.json({ 
             message: 'Invoice file processed successfully', 
@@ -152,6 +177,11 @@ router.post('/upload/footfall', authenticateJWT, authorizeRole(['admin']), uploa
     const filePath = req.file.path;
     const filename = req.file.filename;
 
+    // Upload already landed in DATA_INPUT_DIR; let the watcher classify, dedupe and ingest it
+    if (isWatcherEnabled()) {
+        return res.status(202).json({ message: 'File queued for ingestion', filename });
+    }
+
     try {
         console.log(`📤 Manual upload: Processing footfall file ${filename}`);
         
@@ -274,7 +304,8 @@ router.get('/export-db', authenticateJWT, authorizeRole(['admin']), async (req,
         // If specific collection requested
         if (collection && typeof collection === 'string') {
             const coll = getCollection(collection);
-            const data = await coll.find({}, { projection: { _id: 0 } }).toArray();
+            const filter = collection === 'sales_transactions' ? await visibleSales() : {};
+            const data = await coll.find(filter, { projection: { _id: 0 } }).toArray();
             
             res.setHeader('Content-Type', 'application/json');
             res.setHeader('Content-Disposition', `attachment; filename="${collection}_${new Date().toISOString().split('T')[0]}.json"`);
@@ -288,7 +319,7 @@ router.get('/export-db', authenticateJWT, authorizeRole(['admin']), async (req,
         const logs = getCollection('ingestion_logs');
         
         const [salesData, footfallData, usersData, logsData] = await Promise.all([
-            salesTx.find({}, { projection: { _id: 0 } }).toArray(),
+            salesTx.find(await visibleSales(), { projection: { _id: 0 } }).toArray(),
             footfall.find({}, { projection: { _id: 0 } }).toArray(),
             users.find({}, { projection: { _id: 0, password_hash: 0 } }).toArray(),
             logs.find({}, { projection: { _id: 0 } }).toArray()
@@ -342,7 +373,8 @@ router.get('/export-csv/:collection', authenticateJWT, authorizeRole(['admin']),
             projection.password_hash = 0;
         }
         
-        const data = await coll.find({}, { projection }).toArray();
+        const filter = collection === 'sales_transactions' ? await visibleSales() : {};
+        const data = await coll.find(filter, { projection }).toArray();
         
         if (data.length === 0) {
             return res.status(404).json({ message: 'No data found in collection' });
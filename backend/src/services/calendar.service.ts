@@ -0,0 +1,112 @@
+import fs from 'fs';
+import path from 'path';
+
+/**
+ * Fiscal calendar lookups backed by the date dimension generated by
+ * scripts/fiscal_calendar.py. The table is loaded once per process; dates
+ * outside it fall back to the same clamped month/year arithmetic.
+ */
+
+interface DateDimRow {
+    date: string;
+    fy: number;
+    fy_start: string;
+    fy_week: number;
+    month_start: string;
+    pm_date: string;
+    py_date: string;
+    is_trading_day: boolean;
+}
+
+export interface PeriodWindows {
+    selectedDate: string;
+    startOfMonth: string;
+    startOfPM: string;
+    endOfPM: string;
+    startOfPY: string;
+    endOfPY: string;
+    startOfFY: string;
+}
+
+const DATE_DIM_PATH = process.env.DATE_DIM_PATH || path.join(__dirname, '../../data/date_dim.json');
+const FY_START_MONTH = 4; // April
+
+let dateDim: Map<string, DateDimRow> | null = null;
+
+const loadDateDim = (): Map<string, DateDimRow> => {
+    if (dateDim) return dateDim;
+
+    dateDim = new Map();
+    try {
+        if (fs.existsSync(DATE_DIM_PATH)) {
+            const { rows } = JSON.parse(fs.readFileSync(DATE_DIM_PATH, 'utf-8'));
+            for (const row of rows as DateDimRow[]) dateDim.set(row.date, row);
+            console.log(`[Calendar] Loaded ${dateDim.size} days from ${DATE_DIM_PATH}`);
+        } else {
+            console.warn(`[Calendar] ${DATE_DIM_PATH} not found, computing periods on the fly`);
+        }
+    } catch (error) {
+        console.error('[Calendar] Failed to load date dimension:', error);
+    }
+    return dateDim;
+};
+
+// Drops the cached table so the next lookup reads the regenerated file
+export const reloadDateDim = (): number => {
+    dateDim = null;
+    return loadDateDim().size;
+};
+
+const pad = (n: number) => String(n).padStart(2, '0');
+const daysInMonth = (year: number, month: number) => new Date(Date.UTC(year, month, 0)).getUTCDate();
+
+// Shift a YYYY-MM-DD date by whole months, clamping to month end (Mar 31 -> Feb 28)
+const shiftMonths = (dateStr: string, months: number): string => {
+    const [year, month, day] = dateStr.split('-').map(Number);
+    const index = year * 12 + (month - 1) + months;
+    const y = Math.floor(index / 12);
+    const m = (index % 12) + 1;
+    return `${y}-${pad(m)}-${pad(Math.min(day, daysInMonth(y, m)))}`;
+};
+
+const computeRow = (dateStr: string): DateDimRow => {
+    const [year, month] = dateStr.split('-').map(Number);
+    const fy = month >= FY_START_MONTH ? year : year - 1;
+    const fyStart = `${fy}-${pad(FY_START_MONTH)}-01`;
+    const fyDay = Math.round((Date.parse(dateStr) - Date.parse(fyStart)) / 86400000) + 1;
+    return {
+        date: dateStr,
+        fy,
+        fy_start: fyStart,
+        fy_week: Math.floor((fyDay - 1) / 7) + 1,
+        month_start: `${dateStr.slice(0, 8)}01`,
+        pm_date: shiftMonths(dateStr, -1),
+        py_date: shiftMonths(dateStr, -12),
+        is_trading_day: true
+    };
+};
+
+const normalizeDate = (value: string): string => {
+    if (/^\d{4}-\d{2}-\d{2}$/.test(value)) return value;
+    return new Date(value).toISOString().split('T')[0];
+};
+
+export const lookupDate = (value: string): DateDimRow => {
+    const dateStr = normalizeDate(value);
+    return loadDateDim().get(dateStr) || computeRow(dateStr);
+};
+
+export const resolvePeriodWindows = (endDate: string, startDate?: string): PeriodWindows => {
+    const end = lookupDate(endDate);
+    const start = startDate ? lookupDate(startDate) : lookupDate(end.month_start);
+
+    return {
+        selectedDate: end.date,
+        startOfMonth: start.date,
+        startOfPM: start.pm_date,
+        endOfPM: end.pm_date,
+        startOfPY: start.py_date,
+        endOfPY: end.py_date,
+        startOfFY: end.fy_start
+    };
+};
@@ -0,0 +1,97 @@
+import { getCollection } from '../config/mongodb';
+
+/**
+ * Repeat-purchase metrics from the incremental customer tables maintained by
+ * scripts/customer_state.py (`customer_visits` per day, `customer_state` per customer,
+ * `customer_lapsed` per day and home store).
+ */
+
+const LAPSED_DAYS = parseInt(process.env.CUSTOMER_LAPSED_DAYS || '180', 10);
+
+export interface CustomerCounts {
+    Location: string;
+    active: number;
+    new: number;
+    repeat: number;
+    lapsed: number;
+}
+
+const lapsedCutoff = (endDate: string): string => {
+    const d = new Date(`${endDate}T00:00:00Z`);
+    d.setUTCDate(d.getUTCDate() - LAPSED_DAYS);
+    return d.toISOString().split('T')[0];
+};
+
+/**
+ * Lapsed customers per home store as of endDate. Past days read that day's
+ * counts from `customer_lapsed` (rolled forward by scripts/customer_state.py);
+ * from the latest counted day on, every visit is at or before endDate, so the
+ * indexed `customer_state` (home_store, last_purchase) answers it directly.
+ */
+const getLapsedCounts = async (endDate: string, locations: string[]): Promise<Map<string, number>> => {
+    const state: any = await getCollection('pipeline_state').findOne({ _id: 'customer_lapsed' } as any);
+    const counts = new Map<string, number>();
+    if (state?.through && endDate < state.through) {
+        const filter: any = { date: endDate };
+        if (locations.length) filter.location_name = { $in: locations };
+        for (const doc of await getCollection('customer_lapsed').find(filter).toArray() as any[]) {
+            counts.set(doc.location_name, doc.lapsed);
+        }
+        return counts;
+    }
+
+    const match: any = { last_purchase: { $lt: lapsedCutoff(endDate) } };
+    if (locations.length) match.home_store = { $in: locations };
+    const groups = await getCollection('customer_state').aggregate([
+        { $match: match },
+        { $group: { _id: '$home_store', count: { $sum: 1 } } }
+    ]).toArray();
+    for (const doc of groups as any[]) {
+        if (doc._id) counts.set(doc._id, doc.count);
+    }
+    return counts;
+};
+
+export const getCustomerCounts = async (
+    startDate: string,
+    endDate: string,
+    locations: string[] = []
+): Promise<CustomerCounts[]> => {
+    const visitMatch: any = { date: { $gte: startDate, $lte: endDate }, bills: { $gt: 0 } };
+    if (locations.length) {
+        visitMatch.location_name = { $in: locations };
+    }
+
+    const [active, lapsed] = await Promise.all([
+        getCollection('customer_visits').aggregate([
+            { $match: visitMatch },
+            { $group: { _id: { location: '$location_name', customer: '$customer' } } },
+            { $lookup: { from: 'customer_state', localField: '_id.customer', foreignField: '_id', as: 'state' } },
+            { $project: { location: '$_id.location', first: { $arrayElemAt: ['$state.first_purchase', 0] } } },
+            {
+                $group: {
+                    _id: '$location',
+                    active: { $sum: 1 },
+                    new: { $sum: { $cond: [{ $gte: ['$first', startDate] }, 1, 0] } }
+                }
+            }
+        ], { allowDiskUse: true }).toArray(),
+        getLapsedCounts(endDate, locations)
+    ]);
+
+    const rows = new Map<string, CustomerCounts>();
+    const rowFor = (location: string) => {
+        if (!rows.has(location)) rows.set(location, { Location: location, active: 0, new: 0, repeat: 0, lapsed: 0 });
+        return rows.get(location)!;
+    };
+    for (const doc of active as any[]) {
+        const row = rowFor(doc._id);
+        row.active = doc.active;
+        row.new = doc.new;
+        row.repeat = doc.active - doc.new;
+    }
+    for (const [location, count] of lapsed) {
+        rowFor(location).lapsed = count;
+    }
+    return [...rows.values()].sort((a, b) => a.Location.localeCompare(b.Location));
+};
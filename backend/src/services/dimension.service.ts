@@ -0,0 +1,99 @@
+import { getCollection } from '../config/mongodb';
+import { visibleSales } from './publication.service';
+import { isRollupCovered } from './rollup.service';
+
+/**
+ * Reads the dictionary-encoded star schema built by scripts/star_schema.py.
+ * Dimension tables map natural values (location_name, brand_name, ...) to
+ * integer surrogate keys; `sales_facts` stores only those keys plus measures.
+ * Filter values are resolved to keys once per request, then facts are
+ * matched and grouped on ints.
+ */
+
+export type DimensionName = 'location' | 'product' | 'category' | 'brand' | 'salesperson' | 'channel';
+
+// Field on sales_facts holding each dimension's key
+export const FACT_FIELDS: Record<DimensionName, string> = {
+    location: 'loc',
+    product: 'prod',
+    category: 'cat',
+    brand: 'brand',
+    salesperson: 'sp',
+    channel: 'ch'
+};
+
+// '2026-01-31' -> 20260131, the encoding of sales_facts.d
+export const toDateKey = (date: string): number => parseInt(date.replace(/-/g, ''), 10);
+
+export const isFactsCovered = (startDate: string, endDate: string) =>
+    isRollupCovered('sales_facts', startDate, endDate);
+
+export const resolveKeys = async (dimension: DimensionName, values: string[]): Promise<number[]> => {
+    if (!values.length) return [];
+    const filter: any = { _id: { $in: values } };
+    const docs = await getCollection(`dim_${dimension}`)
+        .find(filter, { projection: { key: 1 } })
+        .toArray();
+    return docs.map((doc: any) => doc.key);
+};
+
+export const resolveNames = async (dimension: DimensionName, keys: number[]): Promise<string[]> => {
+    if (!keys.length) return [];
+    const filter: any = { key: { $in: keys } };
+    const docs = await getCollection(`dim_${dimension}`)
+        .find(filter, { projection: { _id: 1 } })
+        .toArray();
+    return docs.map((doc: any) => doc._id as string);
+};
+
+export interface FilterValues {
+    locations?: string[];
+    brands?: string[];
+    categories?: string[];
+}
+
+/**
+ * Builds a sales_facts $match for the request's filters. Returns null when a
+ * filter matches no dimension row, i.e. the answer is known to be empty.
+ */
+export const resolveFactFilter = async ({ locations = [], brands = [], categories = [] }: FilterValues) => {
+    const [locationKeys, brandKeys, categoryKeys] = await Promise.all([
+        resolveKeys('location', locations),
+        resolveKeys('brand', brands),
+        resolveKeys('category', categories)
+    ]);
+
+    const filter: any = {};
+    const pairs: [string[], number[], string][] = [
+        [locations, locationKeys, FACT_FIELDS.location],
+        [brands, brandKeys, FACT_FIELDS.brand],
+        [categories, categoryKeys, FACT_FIELDS.category]
+    ];
+    for (const [values, keys, field] of pairs) {
+        if (!values.length) continue;
+        if (!keys.length) return null;
+        filter[field] = { $in: keys };
+    }
+    return filter;
+};
+
+// Whether facts exist for every day that has line items (used for unbounded lookups)
+export const isFactsCoveredFully = async (): Promise<boolean> => {
+    const salesTx = getCollection('sales_transactions');
+    const projection = { projection: { invoice_date: 1, _id: 0 } };
+    const visible = await visibleSales();
+    const [first, last] = await Promise.all([
+        salesTx.find(visible, projection).sort({ invoice_date: 1 }).limit(1).toArray(),
+        salesTx.find(visible, projection).sort({ invoice_date: -1 }).limit(1).toArray()
+    ]);
+    if (!first.length || !last.length) return false;
+    return isFactsCovered((first[0] as any).invoice_date, (last[0] as any).invoice_date);
+};
+
+// Distinct values of `dimension` among facts matching the other filters
+export const distinctDimensionValues = async (dimension: DimensionName, filters: FilterValues): Promise<string[]> => {
+    const factFilter = await resolveFactFilter(filters);
+    if (!factFilter) return [];
+    const keys = await getCollection('sales_facts').distinct(FACT_FIELDS[dimension], factFilter);
+    return resolveNames(dimension, keys as number[]);
+};
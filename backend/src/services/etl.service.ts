@@ -3,6 +3,10 @@ import fs from 'fs';
 import path from 'path';
 import csv from 'csv-parser';
 import { v4 as uuidv4 } from 'uuid';
+import { resolvePeriodWindows } from './calendar.service';
+import { isRollupCovered, getDailyRollupTotals } from './rollup.service';
+import { isFactsCovered, isFactsCoveredFully, resolveFactFilter, distinctDimensionValues, toDateKey } from './dimension.service';
+import { publishInvoiceBatch, visibleSales } from './publication.service';
 
 interface InvoiceRow {
     'Invoice No': string;
@@ -53,6 +57,12 @@ const parseInvoiceDate = (dateStr: string): string => {
     return new Date().toISOString().split('T')[0];
 };
 
+// 'HH:MM[:SS]' -> integer hour, null when missing (feeds the hourly sales cube)
+const parseInvoiceHour = (timeStr: string): number | null => {
+    const hour = parseInt((timeStr || '').split(':')[0], 10);
+    return Number.isInteger(hour) && hour >= 0 && hour < 24 ? hour : null;
+};
+
 export const processInvoiceCSV = async (filePath: string): Promise<number> => {
     return new Promise((resolve, reject) => {
         const rows: any[] = [];
@@ -112,6 +122,7 @@ export const processInvoiceCSV = async (filePath: string): Promise<number> => {
                         invoice_date: invoiceDate,
                         invoice_month: row['Invoice Month'] || '',
                         invoice_time: row['Invoice Time'] || '',
+                        invoice_hour: parseInvoiceHour(row['Invoice Time']),
                         transaction_type: row['Sales Transaction Type (IV/SR/IR)'] || '',
                         order_channel_code: row['Order Business Channel Code'] || '',
                         order_channel_name: channelName,
@@ -154,17 +165,17 @@ export const processInvoiceCSV = async (filePath: string): Promise<number> => {
                     const uniqueInvoiceNos = [...new Set(rows.map(r => r.invoice_no).filter(n => n))];
                     console.log(`📋 Buffered ${rows.length} rows with ${uniqueInvoiceNos.length} unique invoices`);
 
-                    // Delete existing invoices
+                    // Days touched by this file (old and new copies of each invoice) lose their rollup markers
+                    const affectedDates = new Set<string>(rows.map(r => r.invoice_date));
                     if (uniqueInvoiceNos.length > 0) {
                         const salesTx = getCollection('sales_transactions');
-                        const deleteResult = await salesTx.deleteMany({ invoice_no: { $in: uniqueInvoiceNos } });
-                        console.log(`🗑️  Deleted ${deleteResult.deletedCount} existing invoice records`);
+                        const previousDates = await salesTx.distinct('invoice_date', await visibleSales({ invoice_no: { $in: uniqueInvoiceNos } }));
+                        previousDates.forEach((d: any) => affectedDates.add(d));
                     }
 
-                    // Insert new records
-                    if (rows.length > 0) {
-                        const salesTx = getCollection('sales_transactions');
-                        await salesTx.insertMany(rows);
+                    // Stage the new rows, retire the old copies and publish both at once
+                    if (rows.length > 0 || uniqueInvoiceNos.length > 0) {
+                        await publishInvoiceBatch(rows, uniqueInvoiceNos, path.basename(filePath), [...affectedDates]);
                     }
 
                     console.log(`✅ Processed ${rows.length} invoice records`);
@@ -229,14 +240,14 @@ export const processFootfallCSV = async (filePath: string): Promise<number> => {
                     if (rows.length > 0) {
                         const footfall = getCollection('footfall');
                         
-                        // Upsert: Update if exists for that date+location, otherwise insert
-                        for (const row of rows) {
-                            await footfall.updateOne(
-                                { date: row.date, location_name: row.location_name },
-                                { $set: row },
-                                { upsert: true }
-                            );
-                        }
+                        // Upsert: Update if exists for that date+location, otherwise insert (one unordered bulk)
+                        await footfall.bulkWrite(rows.map(row => ({
+                            updateOne: {
+                                filter: { date: row.date, location_name: row.location_name } as any,
+                                update: { $set: row },
+                                upsert: true
+                            }
+                        })), { ordered: false });
                     }
                     console.log(`✅ Processed ${rows.length} footfall records (daily aggregated)`);
                     resolve(rows.length);
@@ -297,13 +308,13 @@ export const processEfficiencyCSV = async (filePath: string): Promise<number> =>
 
         if (rowsToInsert.length > 0) {
             const efficiency = getCollection('location_efficiency');
-            for (const row of rowsToInsert) {
-                await efficiency.updateOne(
-                    { location_name: row.location_name, report_date: row.report_date },
-                    { $set: row },
-                    { upsert: true }
-                );
-            }
+            await efficiency.bulkWrite(rowsToInsert.map(row => ({
+                updateOne: {
+                    filter: { location_name: row.location_name, report_date: row.report_date } as any,
+                    update: { $set: row },
+                    upsert: true
+                }
+            })), { ordered: false });
         }
 
         console.log(`✅ Processed ${rowsToInsert.length} efficiency records`);
@@ -320,48 +331,12 @@ export const getReportingDates = async (requestedEndDate?: string, requestedStar
 
     if (!targetEndDateStr || targetEndDateStr === 'latest') {
         const salesTx = getCollection('sales_transactions');
-        const result = await salesTx.find({}).sort({ invoice_date: -1 }).limit(1).toArray();
+        const result = await salesTx.find(await visibleSales()).sort({ invoice_date: -1 }).limit(1).toArray();
         targetEndDateStr = (result[0] as any)?.invoice_date || new Date().toISOString().split('T')[0];
     }
 
-    const endDate = new Date(targetEndDateStr!);
-    let startDate: Date;
-    if (requestedStartDate) {
-        startDate = new Date(requestedStartDate);
-    } else {
-        startDate = new Date(endDate.getFullYear(), endDate.getMonth(), 1);
-    }
-
-    const startOfPM = new Date(startDate);
-    startOfPM.setMonth(startOfPM.getMonth() - 1);
-    const endOfPM = new Date(endDate);
-    endOfPM.setMonth(endOfPM.getMonth() - 1);
-
-    const currentMonth = endDate.getMonth();
-    const fyYear = currentMonth < 3 ? endDate.getFullYear() - 1 : endDate.getFullYear();
-    const startOfFY = new Date(fyYear, 3, 1);
-
-    const startOfPY = new Date(startDate);
-    startOfPY.setFullYear(startOfPY.getFullYear() - 1);
-    const endOfPY = new Date(endDate);
-    endOfPY.setFullYear(endOfPY.getFullYear() - 1);
-
-    const formatDate = (date: Date) => {
-        const year = date.getFullYear();
-        const month = String(date.getMonth() + 1).padStart(2, '0');
-        const day = String(date.getDate()).padStart(2, '0');
-        return `${year}-${month}-${day}`;
-    };
-
-    return {
-        selectedDate: targetEndDateStr!,
-        startOfMonth: formatDate(startDate),
-        startOfPM: formatDate(startOfPM),
-        endOfPM: formatDate(endOfPM),
-        startOfPY: formatDate(startOfPY),
-        endOfPY: formatDate(endOfPY),
-        startOfFY: formatDate(startOfFY)
-    };
+    // Period windows come from the precomputed fiscal calendar (see calendar.service.ts)
+    return resolvePeriodWindows(targetEndDateStr!, requestedStartDate);
 };
 
 // Dashboard data functions - MongoDB aggregations
@@ -380,7 +355,7 @@ export const getRetailPerformance = async (
     const salesTx = getCollection('sales_transactions');
     
     // Build match filter
-    const matchFilter: any = {};
+    const matchFilter: any = await visibleSales();
     if (locations.length) matchFilter.location_name = { $in: locations };
     if (brands.length) matchFilter.brand_name = { $in: brands };
     if (categories.length) matchFilter.category_name = { $in: categories };
@@ -665,7 +640,7 @@ export const getWhatsappSalesBreakdown = async (
 
     const salesTx = getCollection('sales_transactions');
     
-    const matchFilter: any = { location_name: { $ne: 'Shopify Webstore' } };
+    const matchFilter: any = await visibleSales({ location_name: { $ne: 'Shopify Webstore' } });
     if (locations.length) matchFilter.location_name = { $in: locations.filter(l => l !== 'Shopify Webstore') };
     if (brands.length) matchFilter.brand_name = { $in: brands };
     if (categories.length) matchFilter.category_name = { $in: categories };
@@ -759,7 +734,7 @@ export const getOmniChannelTmLm = async (
     const dates = await getReportingDates(baseDate, startDate);
     const salesTx = getCollection('sales_transactions');
     
-    const matchFilter: any = {};
+    const matchFilter: any = await visibleSales();
     const locations = Array.isArray(location) ? location : (location ? [location] : []);
     const brands = Array.isArray(brand) ? brand : (brand ? [brand] : []);
     const categories = Array.isArray(category) ? category : (category ? [category] : []);
@@ -905,7 +880,7 @@ export const getRetailOmniTotal = async (
     const dates = await getReportingDates(baseDate, startDate);
     const salesTx = getCollection('sales_transactions');
     
-    const matchFilter: any = {};
+    const matchFilter: any = await visibleSales();
     const locations = Array.isArray(location) ? location : (location ? [location] : []);
     const brands = Array.isArray(brand) ? brand : (brand ? [brand] : []);
     const categories = Array.isArray(category) ? category : (category ? [category] : []);
@@ -1006,7 +981,7 @@ export const getDashboardSummary = async (
     const dates = await getReportingDates(baseDate, startDate);
     const salesTx = getCollection('sales_transactions');
     
-    const matchFilter: any = {};
+    const matchFilter: any = await visibleSales();
     const locations = Array.isArray(location) ? location : (location ? [location] : []);
     const brands = Array.isArray(brand) ? brand : (brand ? [brand] : []);
     const categories = Array.isArray(category) ? category : (category ? [category] : []);
@@ -1015,70 +990,148 @@ export const getDashboardSummary = async (
     if (brands.length) matchFilter.brand_name = { $in: brands };
     if (categories.length) matchFilter.category_name = { $in: categories };
 
-    const pipeline = [
+    const toSummary = (total_transactions: number, total_revenue: number, pm_transactions: number, pm_revenue: number, total_locations: number) => ({
+        total_transactions,
+        total_revenue,
+        pm_transactions,
+        pm_revenue,
+        total_locations,
+        avg_transaction_value: total_transactions > 0 ? total_revenue / total_transactions : 0,
+        pm_atv: pm_transactions > 0 ? pm_revenue / pm_transactions : 0
+    });
+
+    // Location-only views are answered from the daily rollup (bitmap unions) when it covers both windows
+    if (!brands.length && !categories.length) {
+        const [mtdCovered, pmCovered] = await Promise.all([
+            isRollupCovered('daily_rollup', dates.startOfMonth, dates.selectedDate),
+            isRollupCovered('daily_rollup', dates.startOfPM, dates.endOfPM)
+        ]);
+        if (mtdCovered && pmCovered) {
+            const [mtd, pm] = await Promise.all([
+                getDailyRollupTotals(dates.startOfMonth, dates.selectedDate, locations),
+                getDailyRollupTotals(dates.startOfPM, dates.endOfPM, locations)
+            ]);
+            return toSummary(mtd.transactions, mtd.nett_sales, pm.transactions, pm.nett_sales, mtd.locations.length);
+        }
+    }
+
+    // Filtered views: match and group the dictionary-encoded fact table on integer keys
+    const [mtdFacts, pmFacts] = await Promise.all([
+        isFactsCovered(dates.startOfMonth, dates.selectedDate),
+        isFactsCovered(dates.startOfPM, dates.endOfPM)
+    ]);
+    if (mtdFacts && pmFacts) {
+        const factFilter = await resolveFactFilter({ locations, brands, categories });
+        if (!factFilter) return toSummary(0, 0, 0, 0, 0);
+
+        const windows = {
+            mtd: [toDateKey(dates.startOfMonth), toDateKey(dates.selectedDate)],
+            pm: [toDateKey(dates.startOfPM), toDateKey(dates.endOfPM)]
+        };
+        const result = await getCollection('sales_facts')
+            .aggregate(buildSummaryPipeline(factFilter, FACT_SUMMARY_FIELDS, windows), { allowDiskUse: true })
+            .toArray();
+        return summaryFromFacet(result[0], toSummary);
+    }
+
+    // Fallback: count distinct bills with a two-level $group instead of an in-memory $addToSet
+    const windows = {
+        mtd: [dates.startOfMonth, dates.selectedDate],
+        pm: [dates.startOfPM, dates.endOfPM]
+    };
+    const result = await salesTx
+        .aggregate(buildSummaryPipeline(matchFilter, LINE_SUMMARY_FIELDS, windows), { allowDiskUse: true })
+        .toArray();
+    return summaryFromFacet(result[0], toSummary);
+};
+
+interface SummaryFields {
+    date: string;
+    value: string;
+    location: string;
+    bill: string;
+    salesBill: any;
+}
+
+const LINE_SUMMARY_FIELDS: SummaryFields = {
+    date: 'invoice_date',
+    value: '$nett_invoice_value',
+    location: '$location_name',
+    bill: '$invoice_no',
+    salesBill: { transaction_type: { $in: ['IV', 'IR'] }, mh1_description: 'Sales' }
+};
+
+const FACT_SUMMARY_FIELDS: SummaryFields = {
+    date: 'd',
+    value: '$nett',
+    location: '$loc',
+    bill: '$inv',
+    salesBill: { sb: 1 }
+};
+
+// MTD / PM revenue and distinct-bill counts as one $facet over line items or facts
+const buildSummaryPipeline = (matchFilter: any, f: SummaryFields, windows: { mtd: any[]; pm: any[] }) => {
+    const inWindow = ([start, end]: any[]) => ({ [f.date]: { $gte: start, $lte: end } });
+    return [
         { $match: matchFilter },
         {
             $facet: {
                 mtd: [
-                    {
-                        $match: {
-                            invoice_date: { $gte: dates.startOfMonth, $lte: dates.selectedDate }
-                        }
-                    },
+                    { $match: inWindow(windows.mtd) },
                     {
                         $group: {
                             _id: null,
-                            total_revenue: { $sum: '$nett_invoice_value' },
-                            unique_invoices: { $addToSet: { $cond: [{ $and: [{ $in: ['$transaction_type', ['IV', 'IR']] }, { $eq: ['$mh1_description', 'Sales'] }] }, '$invoice_no', null] } },
-                            locations: { $addToSet: '$location_name' }
+                            total_revenue: { $sum: f.value },
+                            locations: { $addToSet: f.location }
                         }
                     }
                 ],
+                mtd_trx: [
+                    { $match: { ...inWindow(windows.mtd), ...f.salesBill } },
+                    { $group: { _id: f.bill } },
+                    { $count: 'count' }
+                ],
                 pm: [
-                    {
-                        $match: {
-                            invoice_date: { $gte: dates.startOfPM, $lte: dates.endOfPM }
-                        }
-                    },
+                    { $match: inWindow(windows.pm) },
                     {
                         $group: {
                             _id: null,
-                            pm_revenue: { $sum: '$nett_invoice_value' },
-                            pm_invoices: { $addToSet: { $cond: [{ $and: [{ $in: ['$transaction_type', ['IV', 'IR']] }, { $eq: ['$mh1_description', 'Sales'] }] }, '$invoice_no', null] } }
+                            pm_revenue: { $sum: f.value }
                         }
                     }
+                ],
+                pm_trx: [
+                    { $match: { ...inWindow(windows.pm), ...f.salesBill } },
+                    { $group: { _id: f.bill } },
+                    { $count: 'count' }
                 ]
             }
         }
     ];
+};
 
-    const result = await salesTx.aggregate(pipeline).toArray();
-    
-    const mtdData = result[0]?.mtd[0] || { total_revenue: 0, unique_invoices: [], locations: [] };
-    const pmData = result[0]?.pm[0] || { pm_revenue: 0, pm_invoices: [] };
-    
-    const total_transactions = mtdData.unique_invoices.filter((i: any) => i !== null).length;
-    const total_revenue = mtdData.total_revenue || 0;
-    const pm_transactions = pmData.pm_invoices.filter((i: any) => i !== null).length;
-    const pm_revenue = pmData.pm_revenue || 0;
-    const total_locations = mtdData.locations.length;
-
-    return {
-        total_transactions,
-        total_revenue,
-        pm_transactions,
-        pm_revenue,
-        total_locations,
-        avg_transaction_value: total_transactions > 0 ? total_revenue / total_transactions : 0,
-        pm_atv: pm_transactions > 0 ? pm_revenue / pm_transactions : 0
-    };
+const summaryFromFacet = (facet: any, toSummary: (...args: number[]) => any) => {
+    const mtdData = facet?.mtd[0] || { total_revenue: 0, locations: [] };
+    const pmData = facet?.pm[0] || { pm_revenue: 0 };
+
+    return toSummary(
+        facet?.mtd_trx[0]?.count || 0,
+        mtdData.total_revenue || 0,
+        facet?.pm_trx[0]?.count || 0,
+        pmData.pm_revenue || 0,
+        mtdData.locations.length
+    );
 };
 
 export const getLocations = async (brand?: string | string[]) => {
     const salesTx = getCollection('sales_transactions');
     const brands = Array.isArray(brand) ? brand : (brand ? [brand] : []);
+
+    if (brands.length && await isFactsCoveredFully()) {
+        return (await distinctDimensionValues('location', { brands })).sort();
+    }
     
-    const matchFilter: any = {};
+    const matchFilter: any = await visibleSales();
     if (brands.length) matchFilter.brand_name = { $in: brands };
     
     const result = await salesTx.distinct('location_name', matchFilter);
@@ -1087,7 +1140,7 @@ export const getLocations = async (brand?: string | string[]) => {
 
 export const getBrands = async () => {
     const salesTx = getCollection('sales_transactions');
-    const result = await salesTx.distinct('brand_name', { brand_name: { $nin: [null, ''] } });
+    const result = await salesTx.distinct('brand_name', await visibleSales({ brand_name: { $nin: [null, ''] } }));
     return result.sort();
 };
 
@@ -1095,8 +1148,13 @@ export const getCategories = async (brand?: string | string[], location?: string
     const salesTx = getCollection('sales_transactions');
     const brands = Array.isArray(brand) ? brand : (brand ? [brand] : []);
     const locations = Array.isArray(location) ? location : (location ? [location] : []);
+
+    if ((brands.length || locations.length) && await isFactsCoveredFully()) {
+        const values = await distinctDimensionValues('category', { brands, locations });
+        return values.filter(v => v).sort();
+    }
     
-    const matchFilter: any = { category_name: { $nin: [null, ''] } };
+    const matchFilter: any = await visibleSales({ category_name: { $nin: [null, ''] } });
     if (brands.length) matchFilter.brand_name = { $in: brands };
     if (locations.length) matchFilter.location_name = { $in: locations };
     
@@ -1106,7 +1164,7 @@ export const getCategories = async (brand?: string | string[], location?: string
 
 export const getLatestInvoiceDate = async (): Promise<string> => {
     const salesTx = getCollection('sales_transactions');
-    const result = await salesTx.find({}, { projection: { invoice_date: 1, _id: 0 } })
+    const result = await salesTx.find(await visibleSales(), { projection: { invoice_date: 1, _id: 0 } })
         .sort({ invoice_date: -1 })
         .limit(1)
         .toArray();
@@ -1124,7 +1182,7 @@ export const getRetailEfficiency = async (
     const salesTx = getCollection('sales_transactions');
     const footfallCollection = getCollection('footfall');
     
-    const matchFilter: any = {};
+    const matchFilter: any = await visibleSales();
     const locations = Array.isArray(location) ? location : (location ? [location] : []);
     const brands = Array.isArray(brand) ? brand : (brand ? [brand] : []);
     const categories = Array.isArray(category) ? category : (category ? [category] : []);
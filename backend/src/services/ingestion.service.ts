@@ -3,46 +3,170 @@ import path from 'path';
 import csv from 'csv-parser';
 import { getCollection } from '../config/mongodb';
 import { v4 as uuidv4 } from 'uuid';
-import { exec } from 'child_process';
+import { execFile } from 'child_process';
+import crypto from 'crypto';
 
-export const downloadJacadiReport = async () => {
+const SCRIPTS_DIR = path.join(__dirname, '../../scripts');
+// Interpreter with the job dependencies (Playwright, pymongo) installed
+const PYTHON_BIN = process.env.PYTHON_BIN || 'python3';
+
+export interface CliResult {
+    ok: boolean;
+    command: string;
+    result?: any;
+    error?: string;
+    error_type?: string;
+    seconds: number;
+}
+
+/**
+ * Runs `python -m jacadi_dsr <args> --json` (scripts/jacadi_dsr) and resolves
+ * with its JSON result line; logs arrive on stderr and are passed through.
+ */
+export const runPythonCli = (args: string[], timeout: number): Promise<CliResult> => {
     return new Promise((resolve, reject) => {
-        const scriptPath = path.join(__dirname, '../../scripts/fetch_jacadi_report.py');
-        console.log(`Triggering Olabi automation script: ${scriptPath}`);
-
-        // Use the venv Python which has Playwright installed
-        exec(`/root/.venv/bin/python "${scriptPath}"`, { timeout: 180000 }, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Olabi Automation Error: ${error.message}`);
-                reject(error);
-                return;
-            }
-            console.log(`Olabi Automation Output: ${stdout}`);
-            resolve(stdout);
-        });
+        execFile(PYTHON_BIN, ['-m', 'jacadi_dsr', ...args, '--json'], { cwd: SCRIPTS_DIR, timeout, maxBuffer: 16 * 1024 * 1024 },
+            (error, stdout, stderr) => {
+                if (stderr) console.log(stderr.trimEnd());
+
+                const lines = String(stdout).trim().split('\n');
+                let result: CliResult | null = null;
+                try {
+                    result = JSON.parse(lines[lines.length - 1]);
+                } catch {
+                    result = null;
+                }
+
+                if (!result || !result.ok) {
+                    const message = result?.error || error?.message || 'no result line';
+                    console.error(`jacadi_dsr ${args.join(' ')} failed: ${message}`);
+                    // The Python exception class lets callers tell rejected input from failures
+                    const failure: any = new Error(message);
+                    failure.type = result?.error_type;
+                    reject(failure);
+                    return;
+                }
+                console.log(`jacadi_dsr ${result.command} finished in ${result.seconds}s:`, JSON.stringify(result.result));
+                resolve(result);
+            });
     });
 };
 
+export const downloadJacadiReport = async () => {
+    console.log('Triggering Olabi automation');
+    return runPythonCli(['fetch', 'olabi'], 180000);
+};
+
 export const downloadFootfallReport = async () => {
-    return new Promise((resolve, reject) => {
-        const scriptPath = path.join(__dirname, '../../scripts/fetch_footfall_report.py');
-        console.log(`Triggering Surecount footfall automation script: ${scriptPath}`);
-
-        // Use the venv Python which has Playwright installed
-        exec(`/root/.venv/bin/python "${scriptPath}"`, { timeout: 180000 }, (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Surecount Automation Error: ${error.message}`);
-                reject(error);
-                return;
-            }
-            console.log(`Surecount Automation Output: ${stdout}`);
-            resolve(stdout);
-        });
-    });
+    console.log('Triggering Surecount footfall automation');
+    return runPythonCli(['fetch', 'footfall'], 180000);
+};
+
+// Rolls up every day that has no rollup marker (new or re-ingested days)
+export const refreshRollups = async () => {
+    console.log('Refreshing daily rollup');
+    return runPythonCli(['ingest', '--refresh-only'], 600000);
+};
+
+// Replays the report archive into the DuckDB warehouse behind the ad-hoc query endpoint
+export const refreshWarehouse = async () => {
+    console.log('Refreshing ad-hoc query warehouse');
+    return runPythonCli(['query', '--build'], 1800000);
+};
+
+// Per-store and consolidated DSR workbooks (scripts/dsr_report.py) from the current snapshots
+export const generateReports = async () => {
+    console.log('Generating DSR Excel reports');
+    return runPythonCli(['report'], 600000);
+};
+
+// Fiscal date dimension (scripts/fiscal_calendar.py) that calendar.service.ts loads
+export const generateDateDim = async () => {
+    console.log('Generating fiscal date dimension');
+    return runPythonCli(['calendar'], 60000);
 };
 
 import { processInvoiceCSV } from './etl.service';
+
+// Watch-folder daemon (scripts/ingest_watcher.py) owns DATA_INPUT_DIR when enabled
+export const isWatcherEnabled = () => process.env.INGEST_WATCHER === 'true';
+
+export const hashFile = (filePath: string): string =>
+    crypto.createHash('sha256').update(fs.readFileSync(filePath)).digest('hex');
 import { createRestorePoint } from './backup.service';
+import { renderSnapshots, readIngestStamp } from './snapshot.service';
+
+// A newer ingestion younger than this may be followed by more files from the same batch
+const POST_INGEST_SETTLE_MS = parseInt(process.env.POST_INGEST_SETTLE_MS || '60000', 10);
+
+let postIngest: Promise<void> | null = null;
+
+/**
+ * Stages that follow any change to the sales data: rollups, dashboard
+ * snapshots, the DSR workbooks (rendered from those snapshots) and the ad-hoc
+ * query warehouse. runIngestion runs them itself; ingestions it does not see
+ * (the watch-folder daemon, archive rebuild promotes) are picked up by
+ * runPostIngestIfStale. The ingestion stamp processed last is kept in
+ * `pipeline_state`, so each ingestion goes through the stages once.
+ */
+export const runPostIngest = async (): Promise<void> => {
+    if (postIngest) return postIngest;
+    postIngest = (async () => {
+        const stamp = await readIngestStamp();
+
+        // Rebuild rollups for the days that changed; dashboards fall back to live queries until then
+        try {
+            await refreshRollups();
+        } catch (err) {
+            console.error('⚠️ Rollup refresh failed, dashboards will use live aggregation:', err);
+        }
+
+        // Re-render the default-view snapshots, then the distribution workbooks from them
+        let rendered = false;
+        try {
+            await renderSnapshots();
+            rendered = true;
+        } catch (err) {
+            console.error('⚠️ Snapshot render failed, dashboards will use live aggregation:', err);
+        }
+        if (rendered) {
+            try {
+                await generateReports();
+            } catch (err) {
+                console.error('⚠️ DSR report generation failed:', err);
+            }
+        } else {
+            console.error('⚠️ DSR reports not generated: no snapshot of the latest ingestion');
+        }
+
+        // Newly archived reports become queryable once the warehouse catches up
+        try {
+            await refreshWarehouse();
+        } catch (err) {
+            console.error('⚠️ Warehouse refresh failed, ad-hoc queries will read the previous build:', err);
+        }
+
+        await getCollection('pipeline_state').updateOne(
+            { _id: 'post_ingest' } as any,
+            { $set: { ingest_stamp: stamp, finished_at: new Date() } },
+            { upsert: true }
+        );
+    })().finally(() => { postIngest = null; });
+    return postIngest;
+};
+
+// Runs the post-ingest stages when an ingestion has landed since they last ran; true if they ran
+export const runPostIngestIfStale = async (): Promise<boolean> => {
+    const stamp = await readIngestStamp();
+    if (!stamp || postIngest) return false;
+    const state: any = await getCollection('pipeline_state').findOne({ _id: 'post_ingest' } as any);
+    if (state?.ingest_stamp === stamp) return false;
+    if (Date.now() - Date.parse(stamp) < POST_INGEST_SETTLE_MS) return false;
+
+    console.log(`🔁 Ingestion ${stamp} has not been through the post-ingest stages, running them`);
+    await runPostIngest();
+    return true;
+};
 
 export const runIngestion = async () => {
     console.log('🚀 Starting Ingestion Pipeline...');
@@ -77,8 +201,12 @@ export const runIngestion = async () => {
         const filePath = path.join(inputDir, file);
 
         try {
-            // 1. Check if file already ingested
-            const existingLog = await logsCollection.findOne({ filename: file, status: 'success' });
+            // 1. Check if file already ingested (same content, or same name for logs that predate hashing)
+            const contentHash = hashFile(filePath);
+            const existingLog = await logsCollection.findOne({
+                $or: [{ content_hash: contentHash }, { filename: file }],
+                status: 'success'
+            } as any);
 
             if (existingLog) {
                 console.log(`⏭️  File ${file} already processed, skipping.`);
@@ -95,6 +223,7 @@ export const runIngestion = async () => {
                 filename: file,
                 status: 'success',
                 rows_added: rowCount,
+                content_hash: contentHash,
                 created_at: new Date()
             } as any);
             console.log(`✅ Successfully ingested ${rowCount} rows from ${file}`);
@@ -125,4 +254,6 @@ export const runIngestion = async () => {
             } as any);
         }
     }
+
+    await runPostIngest();
 };
@@ -0,0 +1,163 @@
+import { getCollection } from '../config/mongodb';
+import { isRollupCovered } from './rollup.service';
+import { visibleSales } from './publication.service';
+
+/**
+ * Best / worst seller leaderboards over `product_daily` (exact per store/day
+ * totals) and `product_summary` (bounded top-K per store/month with a floor),
+ * both maintained by scripts/leaderboard.py. Mirrors leaderboard.top_n; ranges
+ * not yet built fall back to a live group over sales_transactions.
+ */
+
+export type LeaderboardKind = 'sku' | 'category';
+export type LeaderboardMetric = 'value' | 'qty';
+
+export interface LeaderboardRow {
+    key: string;
+    name: string;
+    qty: number;
+    value: number;
+}
+
+const isoDay = (d: Date) => d.toISOString().split('T')[0];
+
+const monthEnd = (month: string): string => {
+    const [y, m] = month.split('-').map(Number);
+    return isoDay(new Date(Date.UTC(y, m, 0)));
+};
+
+// Months fully inside [start, end] and the remaining edge-day ranges
+const splitRange = (startDate: string, endDate: string) => {
+    const months: string[] = [];
+    const edges: [string, string][] = [];
+    const day = new Date(`${startDate}T00:00:00Z`);
+    const last = new Date(`${endDate}T00:00:00Z`);
+
+    while (day <= last) {
+        const current = isoDay(day);
+        const month = current.slice(0, 7);
+        if (current.endsWith('-01') && monthEnd(month) <= endDate) {
+            months.push(month);
+            day.setUTCMonth(day.getUTCMonth() + 1);
+            continue;
+        }
+        const previous = edges[edges.length - 1];
+        const dayBefore = isoDay(new Date(day.getTime() - 86400000));
+        if (previous && previous[1] === dayBefore) previous[1] = current;
+        else edges.push([current, current]);
+        day.setUTCDate(day.getUTCDate() + 1);
+    }
+    return { months, edges };
+};
+
+const exactTotals = async (
+    startDate: string,
+    endDate: string,
+    kind: LeaderboardKind,
+    locations: string[],
+    keys?: string[]
+): Promise<LeaderboardRow[]> => {
+    const match: any = { kind, date: { $gte: startDate, $lte: endDate } };
+    if (locations.length) match.location_name = { $in: locations };
+    if (keys) match.key = { $in: keys };
+
+    const rows = await getCollection('product_daily').aggregate([
+        { $match: match },
+        { $group: { _id: '$key', name: { $last: '$name' }, qty: { $sum: '$qty' }, value: { $sum: '$value' } } },
+        { $project: { _id: 0, key: '$_id', name: 1, qty: 1, value: { $round: ['$value', 2] } } }
+    ], { allowDiskUse: true }).toArray();
+    return rows as any[];
+};
+
+const KEY_FIELDS: Record<LeaderboardKind, [string, string]> = {
+    sku: ['product_code', 'product_name'],
+    category: ['category_name', 'category_name']
+};
+
+const liveTotals = async (
+    startDate: string,
+    endDate: string,
+    kind: LeaderboardKind,
+    locations: string[]
+): Promise<LeaderboardRow[]> => {
+    const [keyField, nameField] = KEY_FIELDS[kind];
+    const match: any = await visibleSales({
+        invoice_date: { $gte: startDate, $lte: endDate },
+        transaction_type: { $in: ['IV', 'IR'] },
+        mh1_description: 'Sales',
+        [keyField]: { $nin: [null, ''] }
+    });
+    if (locations.length) match.location_name = { $in: locations };
+
+    const rows = await getCollection('sales_transactions').aggregate([
+        { $match: match },
+        {
+            $group: {
+                _id: `$${keyField}`,
+                name: { $last: `$${nameField}` },
+                qty: { $sum: { $ifNull: ['$total_sales_qty', 0] } },
+                value: { $sum: { $ifNull: ['$nett_invoice_value', 0] } }
+            }
+        },
+        { $project: { _id: 0, key: '$_id', name: 1, qty: 1, value: { $round: ['$value', 2] } } }
+    ], { allowDiskUse: true }).toArray();
+    return rows as any[];
+};
+
+const rank = (rows: LeaderboardRow[], metric: LeaderboardMetric, n: number, worst: boolean) =>
+    rows
+        .sort((a, b) => (worst ? a[metric] - b[metric] : b[metric] - a[metric]) || a.key.localeCompare(b.key))
+        .slice(0, n);
+
+export const getLeaderboard = async (
+    startDate: string,
+    endDate: string,
+    kind: LeaderboardKind = 'sku',
+    metric: LeaderboardMetric = 'value',
+    n: number = 10,
+    locations: string[] = [],
+    worst: boolean = false
+): Promise<LeaderboardRow[]> => {
+    if (!(await isRollupCovered('leaderboard', startDate, endDate))) {
+        return rank(await liveTotals(startDate, endDate, kind, locations), metric, n, worst);
+    }
+
+    // Worst sellers have no heavy-hitter shortcut: exact group over day totals
+    if (worst) return rank(await exactTotals(startDate, endDate, kind, locations), metric, n, true);
+
+    const { months, edges } = splitRange(startDate, endDate);
+    const lower = new Map<string, number>();
+    const listedFloor = new Map<string, number>();
+    let totalFloor = 0;
+
+    const summaryFilter: any = { kind, month: { $in: months } };
+    if (locations.length) summaryFilter.location_name = { $in: locations };
+    const summaries = await getCollection('product_summary')
+        .find(summaryFilter, { projection: { top: 1, floor: 1 } })
+        .toArray();
+    for (const summary of summaries as any[]) {
+        const floor = summary.floor[metric];
+        totalFloor += floor;
+        for (const [key, count] of summary.top[metric]) {
+            lower.set(key, (lower.get(key) || 0) + count);
+            listedFloor.set(key, (listedFloor.get(key) || 0) + floor);
+        }
+    }
+
+    const edgeTotals = await Promise.all(edges.map(([s, e]) => exactTotals(s, e, kind, locations)));
+    for (const rows of edgeTotals) {
+        for (const row of rows) lower.set(row.key, (lower.get(row.key) || 0) + row[metric]);
+    }
+
+    const ranked = [...lower.values()].sort((a, b) => b - a);
+    const threshold = ranked.length >= n ? ranked[n - 1] : 0;
+
+    // Only items whose upper bound reaches the N-th best lower bound can rank
+    let candidates: string[] | undefined;
+    if (threshold > 0 && totalFloor <= threshold) {
+        candidates = [...lower.keys()].filter(
+            key => (lower.get(key) || 0) + totalFloor - (listedFloor.get(key) || 0) >= threshold
+        );
+    }
+    return rank(await exactTotals(startDate, endDate, kind, locations, candidates), metric, n, false);
+};
@@ -0,0 +1,218 @@
+import { AsyncLocalStorage } from 'async_hooks';
+import { Request, Response, NextFunction } from 'express';
+import { v4 as uuidv4 } from 'uuid';
+import { getCollection } from '../config/mongodb';
+
+/**
+ * Atomic publication of invoice batches in `sales_transactions`.
+ *
+ * Every row carries the sequence number of the batch that wrote it
+ * (`batch_seq`) and, once replaced, of the batch that retired it
+ * (`retired_seq`). The `publications` document holds the published sequence
+ * P; a row is visible at P when batch_seq <= P and retired_seq > P (missing
+ * fields count as visible, so rows from before batching stay readable).
+ *
+ * A writer stages its rows under P+1 and marks the rows they replace as
+ * retired at P+1 - both invisible changes at P - then moves the pointer with
+ * a single-document update. Readers fix P once per request, never wait on a
+ * writer and see either the whole batch or none of it. Retired rows are
+ * purged once no reader can still hold a pointer older than their retirement.
+ *
+ * The writer renews its lease before every staged chunk and flips only while
+ * it still holds it; a writer that lost the lease removes its own batch
+ * (`batch_id`) and nothing else.
+ *
+ * Rollup coverage is versioned by sequence: each `rollup_days` marker records
+ * the sequence every structure was built from (`built_seq.<kind>`), and a
+ * batch stamps the days it changes with `pending_seq` before the flip and
+ * `changed_seq` after it. isRollupCovered only trusts a marker when no change
+ * published at or before the request's sequence is newer than its build, so
+ * a refresh that read the previous sequence and marks days after the flip is
+ * never served for them, whatever order the writes land in.
+ * scripts/batch_publish.py implements the same protocol for the Python loaders.
+ */
+
+const PUBLICATION_ID = 'sales_transactions';
+const LEASE_MS = parseInt(process.env.PUBLISH_LEASE_MS || '600000', 10);
+const PURGE_GRACE_MS = parseInt(process.env.PUBLISH_PURGE_GRACE_MS || '600000', 10);
+const WRITE_CHUNK = 5000;
+
+const scope = new AsyncLocalStorage<{ seq: number }>();
+
+export const readPublishedSeq = async (): Promise<number> => {
+    const doc: any = await getCollection('publications').findOne({ _id: PUBLICATION_ID } as any, { projection: { seq: 1 } });
+    return doc?.seq || 0;
+};
+
+/**
+ * Express middleware: pins the published sequence for the whole request, so
+ * every query a handler runs reads the same snapshot.
+ */
+export const pinPublication = async (req: Request, res: Response, next: NextFunction) => {
+    try {
+        const seq = await readPublishedSeq();
+        scope.run({ seq }, () => next());
+    } catch (error) {
+        next(error);
+    }
+};
+
+export const publishedFilter = (seq: number): any => ({
+    batch_seq: { $not: { $gt: seq } },
+    retired_seq: { $not: { $lte: seq } }
+});
+
+// The request's pinned sequence, or the current one outside a request
+export const currentSeq = async (): Promise<number> => {
+    const pinned = scope.getStore();
+    return pinned ? pinned.seq : readPublishedSeq();
+};
+
+// `filter` restricted to rows visible at the request's pinned sequence (or the current one)
+export const visibleSales = async (filter: any = {}): Promise<any> => {
+    return { ...filter, ...publishedFilter(await currentSeq()) };
+};
+
+// Records on the `rollup_days` marker of each of `dates` that `seq` changes it
+const stampRollupDays = async (dates: string[], field: 'pending_seq' | 'changed_seq', seq: number) => {
+    if (!dates.length) return;
+    await getCollection('rollup_days').bulkWrite(dates.map(date => ({
+        updateOne: { filter: { _id: date } as any, update: { $set: { date }, $max: { [field]: seq } }, upsert: true }
+    })), { ordered: false });
+};
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Single writer at a time: a lease on the publication document, taken over once it expires
+const acquireLease = async (batchId: string): Promise<number> => {
+    const publications = getCollection('publications');
+    await publications.updateOne({ _id: PUBLICATION_ID } as any, { $setOnInsert: { seq: 0, writer: null } }, { upsert: true });
+
+    const deadline = Date.now() + LEASE_MS;
+    while (true) {
+        const now = new Date();
+        const doc: any = await publications.findOneAndUpdate(
+            { _id: PUBLICATION_ID, $or: [{ writer: null }, { writer_expires: { $lt: now } }] } as any,
+            { $set: { writer: batchId, writer_expires: new Date(now.getTime() + LEASE_MS) } },
+            { returnDocument: 'after' }
+        );
+        if (doc) return doc.seq || 0;
+        if (Date.now() > deadline) throw new Error('Timed out waiting for another ingestion to publish');
+        await sleep(500);
+    }
+};
+
+// Extends this writer's lease; throws once another writer has taken it over
+const renewLease = async (batchId: string) => {
+    const result = await getCollection('publications').updateOne(
+        { _id: PUBLICATION_ID, writer: batchId } as any,
+        { $set: { writer_expires: new Date(Date.now() + LEASE_MS) } }
+    );
+    if (result.matchedCount !== 1) throw new Error(`Publication lease lost for batch ${batchId}`);
+};
+
+const chunks = <T>(items: T[], size: number): T[][] => {
+    const out: T[][] = [];
+    for (let i = 0; i < items.length; i += size) out.push(items.slice(i, i + size));
+    return out;
+};
+
+// Rows staged by writers that lost the lease without publishing; only the lease holder may drop them
+const discardUnpublished = async (seq: number) => {
+    const salesTx = getCollection('sales_transactions');
+    await salesTx.deleteMany({ batch_seq: { $gt: seq } } as any);
+    await salesTx.updateMany({ retired_seq: { $gt: seq } } as any, { $unset: { retired_seq: '', retired_by: '' } });
+};
+
+// One writer's own staged rows and retirements
+const discardBatch = async (batchId: string, seq: number) => {
+    const salesTx = getCollection('sales_transactions');
+    await salesTx.deleteMany({ batch_seq: seq, batch_id: batchId } as any);
+    await salesTx.updateMany({ retired_seq: seq, retired_by: batchId } as any, { $unset: { retired_seq: '', retired_by: '' } });
+};
+
+// Deletes rows retired by batches published long enough ago that no request can still read them
+export const purgeRetired = async (): Promise<number> => {
+    const cutoff = new Date(Date.now() - PURGE_GRACE_MS);
+    const latest: any = await getCollection('ingest_batches')
+        .find({ status: 'published', published_at: { $lt: cutoff } } as any, { projection: { seq: 1 } })
+        .sort({ seq: -1 })
+        .limit(1)
+        .next();
+    if (!latest) return 0;
+    const result = await getCollection('sales_transactions').deleteMany({ retired_seq: { $lte: latest.seq } } as any);
+    return result.deletedCount;
+};
+
+export interface PublishResult {
+    batch_id: string;
+    seq: number;
+    inserted: number;
+    retired: number;
+}
+
+/**
+ * Replaces every invoice in `invoiceNos` with `rows` as one atomically
+ * published batch (last file wins per invoice); `dates` are the invoice dates
+ * whose rollups it changes.
+ */
+export const publishInvoiceBatch = async (
+    rows: any[],
+    invoiceNos: string[],
+    source: string,
+    dates: string[] = []
+): Promise<PublishResult> => {
+    const batchId = uuidv4();
+    const salesTx = getCollection('sales_transactions');
+    const batches = getCollection('ingest_batches');
+
+    const published = await acquireLease(batchId);
+    const seq = published + 1;
+    let flipped = false;
+    try {
+        await discardUnpublished(published);
+        await purgeRetired();
+        await batches.insertOne({ _id: batchId, seq, status: 'staging', source, created_at: new Date() } as any);
+
+        for (const chunk of chunks(rows, WRITE_CHUNK)) {
+            await renewLease(batchId);
+            await salesTx.insertMany(chunk.map(row => ({ ...row, batch_id: batchId, batch_seq: seq })), { ordered: false });
+        }
+        let retired = 0;
+        for (const chunk of chunks(invoiceNos, WRITE_CHUNK)) {
+            await renewLease(batchId);
+            const result = await salesTx.updateMany(
+                { invoice_no: { $in: chunk }, ...publishedFilter(published) } as any,
+                { $set: { retired_seq: seq, retired_by: batchId } }
+            );
+            retired += result.modifiedCount;
+        }
+
+        await renewLease(batchId);
+        await stampRollupDays(dates, 'pending_seq', seq);
+
+        const flip = await getCollection('publications').updateOne(
+            { _id: PUBLICATION_ID, writer: batchId } as any,
+            { $set: { seq, batch_id: batchId, published_at: new Date(), writer: null, writer_expires: null } }
+        );
+        if (flip.modifiedCount !== 1) throw new Error(`Publication lease lost for batch ${batchId}`);
+        flipped = true;
+        await stampRollupDays(dates, 'changed_seq', seq);
+
+        await batches.updateOne({ _id: batchId } as any, {
+            $set: { status: 'published', published_at: new Date(), rows: rows.length, retired }
+        });
+        console.log(`📢 Published batch ${seq}: ${rows.length} rows, ${retired} rows retired`);
+        return { batch_id: batchId, seq, inserted: rows.length, retired };
+    } catch (error) {
+        if (!flipped) {
+            await discardBatch(batchId, seq).catch(err => console.error('⚠️ Could not discard staged rows:', err));
+            await getCollection('publications').updateOne(
+                { _id: PUBLICATION_ID, writer: batchId } as any,
+                { $set: { writer: null, writer_expires: null } }
+            );
+            await batches.updateOne({ _id: batchId } as any, { $set: { status: 'aborted' } });
+        }
+        throw error;
+    }
+};
@@ -0,0 +1,55 @@
+import fs from 'fs';
+import os from 'os';
+import path from 'path';
+import { v4 as uuidv4 } from 'uuid';
+import { runPythonCli } from './ingestion.service';
+
+/**
+ * Ad-hoc read-only SQL over the DuckDB warehouse replayed from the report
+ * archive (scripts/adhoc_query.py, `jacadi_dsr query`). Row and time limits
+ * are enforced by the Python side; the live Mongo store is never queried.
+ */
+
+const QUERY_TIMEOUT_S = parseFloat(process.env.QUERY_TIMEOUT_S || '30');
+// Interpreter start-up and result encoding on top of the query's own time limit
+const CLI_SLACK_MS = 15000;
+
+export interface AdhocQuery {
+    sql?: string;
+    saved?: string;
+    params?: Record<string, any>;
+    maxRows?: number;
+    timeoutS?: number;
+}
+
+const queryArgs = (query: AdhocQuery): string[] => {
+    // `--name=value` keeps SQL starting with a comment ("-- ...") from being read as an option
+    const args = ['query', query.saved ? `--saved=${query.saved}` : `--sql=${query.sql}`];
+    if (query.params) args.push(`--params=${JSON.stringify(query.params)}`);
+    if (query.maxRows) args.push(`--max-rows=${query.maxRows}`);
+    if (query.timeoutS) args.push(`--timeout=${query.timeoutS}`);
+    return args;
+};
+
+const cliTimeout = (query: AdhocQuery) =>
+    Math.min(query.timeoutS || QUERY_TIMEOUT_S, QUERY_TIMEOUT_S) * 1000 + CLI_SLACK_MS;
+
+// { columns: [{ name, type }], rows: [[...]], row_count, truncated, seconds }
+export const runAdhocQuery = async (query: AdhocQuery) => {
+    return (await runPythonCli(queryArgs(query), cliTimeout(query))).result;
+};
+
+// Arrow IPC stream bytes of the result
+export const runAdhocQueryArrow = async (query: AdhocQuery): Promise<{ data: Buffer; truncated: boolean; rowCount: number }> => {
+    const out = path.join(os.tmpdir(), `adhoc_${uuidv4()}.arrow`);
+    try {
+        const { result } = await runPythonCli([...queryArgs(query), '--format=arrow', `--out=${out}`], cliTimeout(query));
+        return { data: fs.readFileSync(out), truncated: result.truncated, rowCount: result.row_count };
+    } finally {
+        fs.rmSync(out, { force: true });
+    }
+};
+
+export const listSavedQueries = async () => {
+    return (await runPythonCli(['query', '--list'], 30000)).result.saved;
+};
@@ -0,0 +1,129 @@
+import { RoaringBitmap32 } from 'roaring';
+import { getCollection } from '../config/mongodb';
+import { currentSeq } from './publication.service';
+
+/**
+ * Reads the per-day / per-location rollups maintained by scripts/daily_rollup.py.
+ * A range is only served from a rollup when every day in it carries a marker
+ * in `rollup_days` that is current at the request's pinned sequence (see
+ * publication.service.ts); otherwise callers fall back to live pipelines.
+ */
+
+const countDays = (startDate: string, endDate: string): number => {
+    const diff = Date.parse(endDate) - Date.parse(startDate);
+    return diff < 0 ? 0 : Math.round(diff / 86400000) + 1;
+};
+
+// Same rule as batch_publish.marker_current: no change published at or before `seq` is newer than the build
+const markerCurrent = (kind: string, seq: number): any => {
+    const built = { $ifNull: [`$built_seq.${kind}`, -1] };
+    const pending = { $ifNull: ['$pending_seq', 0] };
+    const changed = { $max: [{ $ifNull: ['$changed_seq', 0] }, { $cond: [{ $lte: [pending, seq] }, pending, 0] }] };
+    return { $expr: { $lte: [changed, { $min: [built, seq] }] } };
+};
+
+export const isRollupCovered = async (kind: string, startDate: string, endDate: string): Promise<boolean> => {
+    const expected = countDays(startDate, endDate);
+    if (expected === 0) return false;
+
+    const filter: any = {
+        date: { $gte: startDate, $lte: endDate },
+        kinds: kind,
+        ...markerCurrent(kind, await currentSeq())
+    };
+    const marked = await getCollection('rollup_days').countDocuments(filter);
+    return marked === expected;
+};
+
+export interface RollupTotals {
+    nett_sales: number;
+    sales_qty: number;
+    transactions: number;
+    locations: string[];
+}
+
+export const getDailyRollupTotals = async (
+    startDate: string,
+    endDate: string,
+    locations: string[] = []
+): Promise<RollupTotals> => {
+    const filter: any = { date: { $gte: startDate, $lte: endDate } };
+    if (locations.length) filter.location_name = { $in: locations };
+
+    const docs = await getCollection('daily_rollup')
+        .find(filter, { projection: { _id: 0, location_name: 1, nett_sales: 1, sales_qty: 1, line_count: 1, bills: 1 } })
+        .toArray();
+
+    let nett_sales = 0;
+    let sales_qty = 0;
+    const activeLocations = new Set<string>();
+    const bitmaps: RoaringBitmap32[] = [];
+
+    for (const doc of docs as any[]) {
+        nett_sales += doc.nett_sales || 0;
+        sales_qty += doc.sales_qty || 0;
+        if (doc.line_count > 0) activeLocations.add(doc.location_name);
+        if (doc.bills) bitmaps.push(RoaringBitmap32.deserialize(Buffer.from(doc.bills.buffer), true));
+    }
+
+    return {
+        nett_sales,
+        sales_qty,
+        transactions: bitmaps.length ? RoaringBitmap32.orMany(bitmaps).size : 0,
+        locations: [...activeLocations]
+    };
+};
+
+export interface HourlyCell {
+    hour: string;
+    trx_count: number;
+    total_sales: number;
+}
+
+// Slice-and-sum over `sales_cube` (scripts/sales_cube.py): 24 slots per (date, location) document
+export const getHourlyCube = async (
+    startDate: string,
+    endDate: string,
+    locations: string[] = []
+): Promise<HourlyCell[]> => {
+    const filter: any = { date: { $gte: startDate, $lte: endDate } };
+    if (locations.length) filter.location_name = { $in: locations };
+
+    const docs = await getCollection('sales_cube')
+        .find(filter, { projection: { _id: 0, sales: 1, bills: 1 } })
+        .toArray();
+
+    const sales = new Array(24).fill(0);
+    const bills = new Array(24).fill(0);
+    for (const doc of docs as any[]) {
+        for (let h = 0; h < 24; h++) {
+            sales[h] += doc.sales[h];
+            bills[h] += doc.bills[h];
+        }
+    }
+
+    const cells: HourlyCell[] = [];
+    for (let h = 0; h < 24; h++) {
+        if (sales[h] || bills[h]) {
+            cells.push({ hour: String(h).padStart(2, '0'), trx_count: bills[h], total_sales: sales[h] });
+        }
+    }
+    return cells;
+};
+
+export const getDailySalesTrend = async (
+    startDate: string,
+    endDate: string
+): Promise<{ date: string; sales: number }[]> => {
+    const filter: any = { date: { $gte: startDate, $lte: endDate } };
+    const docs = await getCollection('sales_cube')
+        .find(filter, { projection: { _id: 0, date: 1, day_sales: 1 } })
+        .sort({ date: 1 })
+        .toArray();
+
+    const byDate = new Map<string, number>();
+    for (const doc of docs as any[]) {
+        byDate.set(doc.date, (byDate.get(doc.date) || 0) + doc.day_sales);
+    }
+    return [...byDate].map(([date, sales]) => ({ date, sales }));
+};
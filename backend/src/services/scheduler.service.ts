@@ -1,4 +1,4 @@
-import { downloadJacadiReport, runIngestion } from './ingestion.service';
+import { downloadJacadiReport, runIngestion, isWatcherEnabled, runPostIngestIfStale } from './ingestion.service';
 import { createRestorePoint } from './backup.service';
 import dotenv from 'dotenv';
 
@@ -24,9 +24,13 @@ export const runDailyAutomation = async (targetDate?: string) => {
         // We can pass a date argument if we update the service to accept it.
         await downloadJacadiReport();
 
-        // Step 3: Ingest
-        console.log('Step 3: Processing downloaded files...');
-        await runIngestion();
+        // Step 3: Ingest (the watch-folder daemon picks the file up itself when enabled)
+        if (isWatcherEnabled()) {
+            console.log('Step 3: Skipped, ingestion watcher will process the downloaded file.');
+        } else {
+            console.log('Step 3: Processing downloaded files...');
+            await runIngestion();
+        }
 
         console.log('✅ Daily Automation Task Completed Successfully.');
     } catch (error: any) {
@@ -49,4 +53,13 @@ export const initScheduler = () => {
         }
     });
     console.log('✅ Daily Ingestion Scheduler Initialized (6:00 AM)');
+
+    // Snapshots, reports and the warehouse for ingestions runIngestion did not run (watcher, rebuild promote)
+    cron.schedule('* * * * *', async () => {
+        try {
+            await runPostIngestIfStale();
+        } catch (e) {
+            console.error('FAILED TO RUN POST-INGEST STAGES:', e);
+        }
+    });
 };
@@ -0,0 +1,222 @@
+import fs from 'fs';
+import path from 'path';
+import zlib from 'zlib';
+import crypto from 'crypto';
+import { Request, Response, NextFunction } from 'express';
+import { getCollection } from '../config/mongodb';
+import { resolvePeriodWindows } from './calendar.service';
+import {
+    getRetailPerformance,
+    getRetailEfficiency,
+    getWhatsappSalesBreakdown,
+    getOmniChannelTmLm,
+    getOmniChannelDetails,
+    getRetailOmniTotal,
+    getDashboardSummary,
+    getLocations,
+    getLatestInvoiceDate
+} from './etl.service';
+
+/**
+ * Pre-rendered DSR snapshots.
+ * After ingestion every dashboard tab is rendered for the latest date, for all
+ * locations and for each store, into gzipped JSON files under a versioned
+ * directory. `current.json` (swapped with an atomic rename) points at the live
+ * version. Default-view requests are answered from these files with an ETag;
+ * anything else, or a snapshot older than the last successful ingestion,
+ * falls through to live aggregation.
+ */
+
+const SNAPSHOT_DIR = process.env.SNAPSHOT_DIR || path.join(__dirname, '../../data/snapshots');
+const MANIFEST_PATH = path.join(SNAPSHOT_DIR, 'current.json');
+const KEEP_VERSIONS = 3;
+const INGEST_STAMP_TTL_MS = 15000;
+
+type TabRenderer = (date: string, location: string[] | undefined, startDate: string) => Promise<any>;
+
+// Every tab the dashboard loads; retail-whatsapp is an alias of retail-performance
+const TABS: Record<string, TabRenderer> = {
+    'retail-performance': (date, location, start) => getRetailPerformance(date, location, start),
+    'retail-whatsapp': (date, location, start) => getRetailPerformance(date, location, start),
+    'retail-efficiency': (date, location, start) => getRetailEfficiency(date, location, start),
+    'whatsapp-sales-breakdown': (date, location, start) => getWhatsappSalesBreakdown(date, location, start),
+    'omni-channel-tm-lm': (date, location, start) => getOmniChannelTmLm(date, location, start),
+    'omni-channel-details': (date, location, start) => getOmniChannelDetails(date, location, start),
+    'retail-omni-total': (date, location, start) => getRetailOmniTotal(date, location, start),
+    'summary': (date, location, start) => getDashboardSummary(date, location, start)
+};
+
+const ALL_SCOPE = '__all__';
+
+interface SnapshotManifest {
+    version: string;
+    date: string;
+    start_date: string;
+    ingest_stamp: string | null;
+    built_at: string;
+    files: Record<string, { file: string; etag: string }>;
+}
+
+const snapshotKey = (tab: string, scope: string) => `${tab}|${scope}`;
+
+const fileNameFor = (tab: string, scope: string) =>
+    `${tab}__${scope === ALL_SCOPE ? 'all' : scope.replace(/[^a-z0-9]+/gi, '_')}.json.gz`;
+
+// Latest successful ingestion; a snapshot rendered before it is stale
+export const readIngestStamp = async (): Promise<string | null> => {
+    const latest = await getCollection('ingestion_logs')
+        .find({ status: 'success' } as any, { projection: { created_at: 1 } })
+        .sort({ created_at: -1 })
+        .limit(1)
+        .toArray();
+    return latest.length ? new Date((latest[0] as any).created_at).toISOString() : null;
+};
+
+let ingestStampCache: { value: string | null; at: number } | null = null;
+
+const currentIngestStamp = async (): Promise<string | null> => {
+    if (!ingestStampCache || Date.now() - ingestStampCache.at > INGEST_STAMP_TTL_MS) {
+        ingestStampCache = { value: await readIngestStamp(), at: Date.now() };
+    }
+    return ingestStampCache.value;
+};
+
+let rendering: Promise<SnapshotManifest> | null = null;
+
+export const renderSnapshots = async (): Promise<SnapshotManifest> => {
+    // Concurrent triggers (scheduler, upload, stale read) share one render
+    if (rendering) return rendering;
+    rendering = (async () => {
+        const started = Date.now();
+        const ingestStamp = await readIngestStamp();
+        const date = await getLatestInvoiceDate();
+        const startDate = resolvePeriodWindows(date).startOfMonth;
+        const locations: string[] = await getLocations();
+
+        const version = `${date}_${started}`;
+        const versionDir = path.join(SNAPSHOT_DIR, version);
+        fs.mkdirSync(versionDir, { recursive: true });
+
+        const files: SnapshotManifest['files'] = {};
+        for (const scope of [ALL_SCOPE, ...locations]) {
+            const location = scope === ALL_SCOPE ? undefined : [scope];
+            for (const tab of Object.keys(TABS)) {
+                const body = JSON.stringify(await TABS[tab](date, location, startDate));
+                const file = fileNameFor(tab, scope);
+                fs.writeFileSync(path.join(versionDir, file), zlib.gzipSync(body));
+                files[snapshotKey(tab, scope)] = {
+                    file,
+                    etag: `"${crypto.createHash('sha1').update(body).digest('hex').slice(0, 20)}"`
+                };
+            }
+        }
+
+        const manifest: SnapshotManifest = {
+            version,
+            date,
+            start_date: startDate,
+            ingest_stamp: ingestStamp,
+            built_at: new Date().toISOString(),
+            files
+        };
+        const tmpPath = `${MANIFEST_PATH}.tmp`;
+        fs.writeFileSync(tmpPath, JSON.stringify(manifest, null, 2));
+        fs.renameSync(tmpPath, MANIFEST_PATH);
+        ingestStampCache = null;
+
+        pruneVersions(version);
+        console.log(`📸 Rendered ${Object.keys(files).length} DSR snapshots for ${date} in ${Date.now() - started}ms`);
+        return manifest;
+    })();
+
+    try {
+        return await rendering;
+    } finally {
+        rendering = null;
+    }
+};
+
+const pruneVersions = (current: string) => {
+    const versions = fs.readdirSync(SNAPSHOT_DIR, { withFileTypes: true })
+        .filter(d => d.isDirectory() && d.name !== current)
+        .map(d => d.name)
+        .sort()
+        .reverse();
+    for (const old of versions.slice(KEEP_VERSIONS - 1)) {
+        fs.rmSync(path.join(SNAPSHOT_DIR, old), { recursive: true, force: true });
+    }
+};
+
+let manifestCache: { manifest: SnapshotManifest; mtimeMs: number } | null = null;
+const bodyCache = new Map<string, Buffer>();
+
+const loadManifest = (): SnapshotManifest | null => {
+    let stat: fs.Stats;
+    try {
+        stat = fs.statSync(MANIFEST_PATH);
+    } catch {
+        return null;
+    }
+    if (!manifestCache || manifestCache.mtimeMs !== stat.mtimeMs) {
+        manifestCache = { manifest: JSON.parse(fs.readFileSync(MANIFEST_PATH, 'utf-8')), mtimeMs: stat.mtimeMs };
+        bodyCache.clear();
+    }
+    return manifestCache.manifest;
+};
+
+// Only the default view has a snapshot: latest date, default month start, no brand/category, all or one store
+const snapshotScope = (req: Request, manifest: SnapshotManifest): string | null => {
+    const { startDate, endDate, date, location, brand, category } = req.query as Record<string, string | undefined>;
+    if (brand || category || Array.isArray(location)) return null;
+    if ((endDate || date) !== manifest.date) return null;
+    if (startDate && startDate !== manifest.start_date) return null;
+
+    const locations = (location || '').split(',').filter(s => s.trim() !== '');
+    if (locations.length > 1) return null;
+    return locations.length ? locations[0] : ALL_SCOPE;
+};
+
+/**
+ * Express handler mounted ahead of the live dashboard routes: serves the
+ * matching snapshot (304 on If-None-Match) or calls next() for live aggregation.
+ */
+export const serveSnapshot = async (req: Request, res: Response, next: NextFunction) => {
+    try {
+        if (!Object.prototype.hasOwnProperty.call(TABS, req.params.tab)) return next();
+        const manifest = loadManifest();
+        if (!manifest) return next();
+
+        const scope = snapshotScope(req, manifest);
+        const entry = scope ? manifest.files[snapshotKey(req.params.tab, scope)] : undefined;
+        if (!entry) return next();
+
+        if (manifest.ingest_stamp !== await currentIngestStamp()) {
+            renderSnapshots().catch(err => console.error('⚠️ Snapshot re-render failed:', err));
+            return next();
+        }
+
+        res.setHeader('ETag', entry.etag);
+        res.setHeader('Cache-Control', 'private, no-cache');
+        res.setHeader('Vary', 'Accept-Encoding');
+        res.setHeader('X-DSR-Snapshot', manifest.version);
+        if (req.headers['if-none-match'] === entry.etag) {
+            return res.status(304).end();
+        }
+
+        let gz = bodyCache.get(entry.file);
+        if (!gz) {
+            gz = fs.readFileSync(path.join(SNAPSHOT_DIR, manifest.version, entry.file));
+            bodyCache.set(entry.file, gz);
+        }
+
+        res.type('application/json');
+        if (/\bgzip\b/.test(String(req.headers['accept-encoding'] || ''))) {
+            res.setHeader('Content-Encoding', 'gzip');
+            return res.send(gz);
+        }
+        return res.send(zlib.gunzipSync(gz));
+    } catch (error) {
+        console.error('Snapshot read failed, using live aggregation:', error);
+        return next();
+    }
+};
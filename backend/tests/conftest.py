@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the standalone modules in backend/scripts importable from tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
@@ -0,0 +1,123 @@
+"""
+Ad-hoc query warehouse tests: archive replay, saved queries, read-only guard and limits
+"""
+import csv
+import os
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("zstandard")
+duckdb = pytest.importorskip("duckdb")
+pa = pytest.importorskip("pyarrow")
+
+import adhoc_query  # noqa: E402
+import rebuild  # noqa: E402
+
+HEADER = ["Invoice No", "Invoice Date", "Invoice Time", "Sales Transaction Type (IV/SR/IR)",
+          "Order Associate Name", "Nett Invoice Value", "Total Sales Qty", "MH1 Description",
+          "Sales Person Name", "Category Name", "Invoice MRP Value", "Invoice Discount Value", "Consumer Mobile"]
+RANGE = {"start_date": "2026-01-01", "end_date": "2026-01-31"}
+
+
+def write_report(directory, name, rows):
+    with open(os.path.join(directory, name), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for invoice_no, date, value, person in rows:
+            writer.writerow([invoice_no, date, "11:30", "IV", "Jacadi Palladium", value, 1, "Sales", person,
+                             "Tops", value * 1.25, value * 0.25, "9800000000"])
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    archive, pack_dir = str(tmp_path / "archive"), str(tmp_path / "packed")
+    os.makedirs(archive)
+    write_report(archive, "JPHO@JPinvoicedetailreport01022026040000.csv",
+                 [("A1", "30/01/2026", 100, "Asha"), ("A2", "31/01/2026", 200, "Whatsapp Orders")])
+    # Restates A2; the later report wins
+    write_report(archive, "JPHO@JPinvoicedetailreport01022026050000.csv", [("A2", "31/01/2026", 300, "Whatsapp Orders")])
+    rebuild.pack(archive, pack_dir, workers=1)
+
+    path = str(tmp_path / "warehouse.duckdb")
+    summary = adhoc_query.build_warehouse(pack_dir, path, workers=1)
+    assert summary["sales_rows"] == 2 and not os.path.exists(path + ".building")
+    return path
+
+
+def rows(path, **kwargs):
+    return adhoc_query.to_json(adhoc_query.run_query(path=path, **kwargs))["rows"]
+
+
+def test_saved_queries_follow_last_file_wins(warehouse):
+    assert rows(warehouse, saved="summary", params=RANGE) == [[400.0, 2, 200.0, 1.0]]
+    assert rows(warehouse, saved="store_performance", params=RANGE) == [["Jacadi Palladium", 400.0, 2]]
+    assert rows(warehouse, saved="whatsapp_share", params=RANGE) == [["Jacadi Palladium", 300.0, 400.0, 75.0]]
+    assert rows(warehouse, saved="discount_by_category", params=RANGE)[0][-1] == 20.0
+    assert rows(warehouse, saved="top_products", params={**RANGE, "n": 1}) == []  # no product codes
+
+    # Every saved query binds its parameters and runs
+    for name in adhoc_query.SAVED_QUERIES:
+        rows(warehouse, saved=name, params=RANGE)
+
+
+def test_personal_data_is_not_copied(warehouse):
+    columns = [c[0] for c in rows(warehouse, sql="SELECT column_name FROM duckdb_columns() WHERE table_name = 'sales'")]
+    assert "consumer_mobile" not in columns and "consumer_name" not in columns
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM sales",
+    "SELECT 1; SELECT 2",
+    "COPY sales TO 'leak.csv'",
+    "SELECT * FROM read_csv('/etc/passwd')",
+])
+def test_only_reads_inside_the_warehouse(warehouse, sql):
+    with pytest.raises(adhoc_query.QueryError):
+        adhoc_query.run_query(sql=sql, path=warehouse)
+
+
+def test_saved_query_parameters_are_checked(warehouse):
+    with pytest.raises(adhoc_query.QueryError, match="Missing parameters"):
+        adhoc_query.run_query(saved="summary", params={"start_date": "2026-01-01"}, path=warehouse)
+    with pytest.raises(adhoc_query.QueryError, match="Unknown parameters"):
+        adhoc_query.run_query(saved="summary", params={**RANGE, "location": "x"}, path=warehouse)
+    with pytest.raises(adhoc_query.QueryError, match="Unknown saved query"):
+        adhoc_query.run_query(saved="nope", path=warehouse)
+
+
+def test_row_and_time_limits(warehouse):
+    result = adhoc_query.run_query(sql="SELECT * FROM sales ORDER BY invoice_no", max_rows=1, path=warehouse)
+    assert result["truncated"] and result["table"].num_rows == 1
+    assert not adhoc_query.run_query(sql="SELECT * FROM sales", max_rows=2, path=warehouse)["truncated"]
+
+    with pytest.raises(adhoc_query.QueryTimeout):
+        adhoc_query.run_query(sql="SELECT count(*) FROM range(10000000000000)", timeout=0.2, path=warehouse)
+
+
+def test_arrow_stream_round_trip(warehouse, tmp_path):
+    out = str(tmp_path / "result.arrow")
+    result = adhoc_query.run_query(sql="SELECT invoice_no, nett_invoice_value FROM sales ORDER BY 1",
+                                   path=warehouse)
+    adhoc_query.write_arrow(result, out)
+    with pa.OSFile(out, "rb") as source:
+        table = pa.ipc.open_stream(source).read_all()
+    assert table.to_pydict() == {"invoice_no": ["A1", "A2"], "nett_invoice_value": [100.0, 300.0]}
+
+
+def test_incremental_build_matches_a_full_build(warehouse, tmp_path):
+    archive, pack_dir = str(tmp_path / "archive"), str(tmp_path / "packed")
+    # A later report restates A1; a backfilled, older report loses A2 but adds A3
+    write_report(archive, "JPHO@JPinvoicedetailreport02022026040000.csv", [("A1", "30/01/2026", 500, "Asha")])
+    write_report(archive, "JPHO@JPinvoicedetailreport31012026040000.csv",
+                 [("A2", "31/01/2026", 999, "Asha"), ("A3", "31/01/2026", 7, "Asha")])
+    rebuild.pack(archive, pack_dir, workers=1)
+
+    summary = adhoc_query.build_warehouse(pack_dir, warehouse, workers=1)
+    assert summary == {**summary, "new_files": 2, "full": False, "sales_rows": 3}
+    assert adhoc_query.build_warehouse(pack_dir, warehouse, workers=1)["new_files"] == 0
+
+    fresh = str(tmp_path / "fresh.duckdb")
+    assert adhoc_query.build_warehouse(pack_dir, fresh, workers=1)["full"]
+    sql = "SELECT invoice_no, nett_invoice_value FROM sales ORDER BY 1"
+    assert rows(warehouse, sql=sql) == rows(fresh, sql=sql) == [["A1", 500.0], ["A2", 300.0], ["A3", 7.0]]
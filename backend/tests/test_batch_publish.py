@@ -0,0 +1,152 @@
+"""
+Batch publication tests: staged rows stay invisible, readers see old or new, dead writers are cleaned up
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+mongomock = pytest.importorskip("mongomock")
+
+import batch_publish  # noqa: E402
+import mongo_store  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def lines(invoice_no, value, count=1):
+    return [{"invoice_no": invoice_no, "invoice_date": "2026-01-31", "nett_invoice_value": value}
+            for _ in range(count)]
+
+
+def total(db, seq=None):
+    return sum(d["nett_invoice_value"] for d in db.sales_transactions.find(batch_publish.visible(db, seq=seq)))
+
+
+def test_publish_replaces_invoices_in_one_step(db):
+    first = batch_publish.publish_invoice_batch(db, lines("A1", 100) + lines("A2", 50), ["A1", "A2"], "a.csv")
+    assert first["seq"] == 1 and total(db) == 150
+
+    second = batch_publish.publish_invoice_batch(db, lines("A2", 80, count=2), ["A2"], "b.csv")
+    assert second == {**second, "seq": 2, "inserted": 2, "retired": 1}
+    assert total(db) == 260
+    # The replaced row is kept for readers still pinned to the previous sequence
+    assert total(db, seq=1) == 150 and db.sales_transactions.count_documents({}) == 4
+    assert db.ingest_batches.find_one({"_id": second["batch_id"]})["status"] == "published"
+
+
+def test_staged_batch_is_invisible_until_the_flip(db, monkeypatch):
+    batch_publish.publish_invoice_batch(db, lines("A1", 100), ["A1"], "a.csv")
+    seen = []
+    retry = mongo_store.with_retry
+
+    def observe(fn, *args, **kwargs):
+        seen.append(total(db))
+        return retry(fn, *args, **kwargs)
+
+    monkeypatch.setattr(mongo_store, "with_retry", observe)
+    batch_publish.publish_invoice_batch(db, lines("A1", 70) + lines("A9", 5), ["A1", "A9"], "b.csv")
+    assert seen and set(seen) == {100}
+    assert total(db) == 75
+
+
+def test_failed_batch_is_discarded(db, monkeypatch):
+    batch_publish.publish_invoice_batch(db, lines("A1", 100), ["A1"], "a.csv")
+
+    retry = mongo_store.with_retry
+    calls = []
+
+    def fail(fn, *args, **kwargs):
+        # Rows are staged by the first call; retiring the old ones fails
+        calls.append(fn)
+        if len(calls) > 1:
+            raise RuntimeError("connection lost")
+        return retry(fn, *args, **kwargs)
+
+    monkeypatch.setattr(mongo_store, "with_retry", fail)
+    with pytest.raises(RuntimeError):
+        batch_publish.publish_invoice_batch(db, lines("A1", 70), ["A1"], "b.csv")
+
+    assert total(db) == 100 and db.sales_transactions.count_documents({}) == 1
+    assert db.publications.find_one()["writer"] is None
+    assert db.ingest_batches.count_documents({"status": "aborted"}) == 1
+
+
+def test_dead_writer_lease_is_taken_over(db, monkeypatch):
+    batch_publish.publish_invoice_batch(db, lines("A1", 100), ["A1"], "a.csv")
+    # A writer that staged a row and retired A1, then died holding the lease
+    db.sales_transactions.insert_one({**lines("A1", 999)[0], "batch_seq": 2})
+    db.sales_transactions.update_many({"invoice_no": "A1", "batch_seq": 1}, {"$set": {"retired_seq": 2}})
+    db.publications.update_one({}, {"$set": {"writer": "dead", "writer_expires": datetime.utcnow() + timedelta(hours=1)}})
+
+    monkeypatch.setattr(batch_publish, "LEASE_MS", 100)
+    with pytest.raises(TimeoutError):
+        batch_publish.publish_invoice_batch(db, lines("A2", 1), ["A2"], "b.csv")
+
+    db.publications.update_one({}, {"$set": {"writer_expires": datetime.utcnow() - timedelta(seconds=1)}})
+    batch_publish.publish_invoice_batch(db, lines("A2", 1), ["A2"], "b.csv")
+    assert total(db) == 101 and db.sales_transactions.count_documents({"nett_invoice_value": 999}) == 0
+
+
+def test_purge_waits_for_the_grace_period(db):
+    batch_publish.publish_invoice_batch(db, lines("A1", 100), ["A1"], "a.csv")
+    batch_publish.publish_invoice_batch(db, lines("A1", 70), ["A1"], "b.csv")
+
+    assert batch_publish.purge_retired(db) == 0
+    assert batch_publish.purge_retired(db, grace_ms=-1000) == 1
+    assert db.sales_transactions.count_documents({}) == 1 and total(db) == 70
+
+
+def test_writer_that_lost_its_lease_only_discards_its_own_batch(db, monkeypatch):
+    batch_publish.publish_invoice_batch(db, lines("A1", 100), ["A1"], "a.csv")
+    retry = mongo_store.with_retry
+    calls = []
+
+    def take_over(fn, *args, **kwargs):
+        # While the slow writer stages, its lease expires and another writer stages under the same sequence
+        result = retry(fn, *args, **kwargs)
+        if not calls:
+            calls.append(fn)
+            db.publications.update_one({}, {"$set": {"writer": "other"}})
+            db.sales_transactions.insert_one({**lines("A1", 70)[0], "batch_id": "other", "batch_seq": 2})
+            db.sales_transactions.update_one({"batch_seq": 1}, {"$set": {"retired_seq": 2, "retired_by": "other"}})
+        return result
+
+    monkeypatch.setattr(mongo_store, "with_retry", take_over)
+    with pytest.raises(batch_publish.LeaseLost):
+        batch_publish.publish_invoice_batch(db, lines("A1", 5) + lines("A2", 5), ["A1", "A2"], "slow.csv")
+
+    assert db.sales_transactions.count_documents({"nett_invoice_value": 5}) == 0
+    assert db.sales_transactions.count_documents({"batch_id": "other"}) == 1
+    assert db.sales_transactions.find_one({"batch_seq": 1})["retired_by"] == "other"
+    assert db.publications.find_one()["writer"] == "other"
+
+
+def test_refresh_that_read_the_previous_sequence_is_not_served(db):
+    pytest.importorskip("pyroaring")
+    import daily_rollup
+
+    batch_publish.publish_invoice_batch(db, lines("A1", 100), ["A1"], "a.csv", dates={"2026-01-31"})
+    daily_rollup.build_rollup(db, "2026-01-31", "2026-01-31")
+    assert daily_rollup.find_unmarked_ranges(db) == []
+
+    # A refresh reads at seq 1, the batch flips to seq 2, then the refresh writes its markers
+    batch_publish.publish_invoice_batch(db, lines("A1", 70), ["A1"], "b.csv", dates={"2026-01-31"})
+    daily_rollup.mark_built(db, daily_rollup.ROLLUP_KIND, ["2026-01-31"], 1, datetime.utcnow())
+    marker = db.rollup_days.find_one({"_id": "2026-01-31"})
+    assert not batch_publish.marker_current(marker, daily_rollup.ROLLUP_KIND, 2)
+    assert daily_rollup.find_unmarked_ranges(db) == [("2026-01-31", "2026-01-31")]
+
+    daily_rollup.build_rollup(db, "2026-01-31", "2026-01-31")
+    assert daily_rollup.find_unmarked_ranges(db) == []
+    assert db.daily_rollup.find_one({"date": "2026-01-31"})["nett_sales"] == 70
+
+
+def test_pending_stamp_counts_once_its_sequence_is_published():
+    marker = {"built_seq": {"daily": 3}, "changed_seq": 2, "pending_seq": 4}
+    assert batch_publish.marker_current(marker, "daily", 3)  # seq 4 not flipped (or aborted)
+    assert not batch_publish.marker_current(marker, "daily", 4)  # flipped, changed_seq not stamped yet
+    assert not batch_publish.marker_current({"kinds": ["daily"]}, "daily", 3)  # built before versioning
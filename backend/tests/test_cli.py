@@ -0,0 +1,83 @@
+"""
+jacadi_dsr CLI tests: lazy imports, JSON result line and argument handling
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+HEAVY_MODULES = ("playwright", "openpyxl", "pandas", "pymongo", "mongomock")
+
+
+def run_cli(*args, env=None):
+    return subprocess.run(
+        [sys.executable, "-m", "jacadi_dsr", *args], cwd=SCRIPTS_DIR, capture_output=True, text=True,
+        env={**os.environ, **(env or {})},
+    )
+
+
+def test_parsing_loads_no_heavy_dependency():
+    probe = (
+        "import sys; from jacadi_dsr import cli; p = cli.build_parser()\n"
+        "for argv in (['fetch', 'olabi'], ['backfill', '01-01-2026', '02-01-2026'], ['ingest'], ['rebuild']):\n"
+        "    p.parse_args(argv)\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    out = subprocess.run([sys.executable, "-c", probe], cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_json_flag_before_or_after_subcommand():
+    from jacadi_dsr import cli
+
+    parser = cli.build_parser()
+    assert parser.parse_args(["--json", "rebuild", "--pack"]).json
+    assert parser.parse_args(["rebuild", "--pack", "--json"]).json
+    assert not parser.parse_args(["fetch", "footfall"]).json
+    args = cli.parse_args(["bench", "bulk-upsert", "--json", "--", "--rows", "10", "--json"])
+    assert args.json and args.script_args == ["--rows", "10", "--json"]
+
+
+def test_failure_is_a_single_json_line():
+    out = run_cli("fetch", "olabi", "--date", "31/01/2026", "--json")
+    assert out.returncode == 1
+    [line] = out.stdout.strip().splitlines()
+    payload = json.loads(line)
+    assert payload["ok"] is False and payload["command"] == "fetch olabi"
+    assert "does not match format" in payload["error"]
+
+
+def test_ingest_refresh_json_result():
+    pytest.importorskip("pymongo")
+    pytest.importorskip("pyroaring")
+    pytest.importorskip("mongomock")
+
+    out = run_cli("ingest", "--refresh-only", "--json", env={"MONGO_URL": "mongomock://localhost"})
+    assert out.returncode == 0, out.stderr
+    [line] = out.stdout.strip().splitlines()
+    payload = json.loads(line)
+    assert payload["ok"] and payload["result"]["rollup_ranges"] == 0
+    assert set(payload["result"]["derived"]) == {"sales_cube", "sales_facts", "customer_state", "leaderboard"}
+
+
+def test_calendar_writes_the_date_dimension(tmp_path):
+    out = run_cli("calendar", "--first-fy", "2025", "--years", "1", "--out", str(tmp_path / "date_dim.json"), "--json")
+    assert out.returncode == 0, out.stderr
+    payload = json.loads(out.stdout.strip())
+    assert payload["ok"] and payload["result"]["days"] == 365
+    with open(tmp_path / "date_dim.json") as f:
+        assert json.load(f)["rows"][0]["date"] == "2025-04-01"
+
+
+def test_importing_a_job_module_leaves_logging_to_the_entry_point():
+    pytest.importorskip("pymongo")
+    pytest.importorskip("pyroaring")
+    modules = ("customer_state", "daily_rollup", "leaderboard", "rebuild", "sales_cube", "star_schema",
+               "store_metrics", "ingest_watcher")
+    probe = f"import logging, {', '.join(modules)}; print(len(logging.getLogger().handlers))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "0"
@@ -0,0 +1,116 @@
+"""
+Customer state tests: identity, incremental refresh and new/repeat/lapsed counts
+"""
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("pyroaring")
+mongomock = pytest.importorskip("mongomock")
+
+import customer_state  # noqa: E402
+
+
+def line(invoice_no, date, value, code="CM00002925", mobile="7899237999", location="Jacadi MOA", trx="IV"):
+    return {
+        "invoice_no": invoice_no, "invoice_date": date, "location_name": location, "transaction_type": trx,
+        "mh1_description": "Sales", "nett_invoice_value": value, "consumer_code": code,
+        "consumer_mobile": mobile, "consumer_name": "ahmed",
+    }
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def test_placeholder_accounts_are_not_customers():
+    assert customer_state.customer_key(line("A1", "2026-01-01", 1)) == "CM00002925"
+    assert customer_state.customer_key(line("A1", "2026-01-01", 1, mobile="2222222222")) is None
+    assert customer_state.customer_key(line("A1", "2026-01-01", 1, mobile="")) is None
+    assert customer_state.customer_key(line("A1", "2026-01-01", 1, code="")) == "7899237999"
+
+
+def test_state_is_built_incrementally(db):
+    db.sales_transactions.insert_many([
+        line("J02GIV000001", "2025-12-10", 3000),
+        line("J02GIV000001", "2025-12-10", 1000),
+        line("J01FIV000001", "2026-01-05", 2000, location="Jacadi Palladium"),
+    ])
+    customer_state.build_customer_state(db, "2025-12-01", "2026-01-05")
+    state = db.customer_state.find_one({"_id": "CM00002925"})
+    assert state["first_purchase"] == "2025-12-10"
+    assert state["last_purchase"] == "2026-01-05"
+    assert state["visit_count"] == 2
+    assert state["ltv"] == 6000
+    assert state["home_store"] == "Jacadi Palladium"  # tie on bills, most recent wins
+
+    # A later day only touches that day's customers, and adds to their history
+    db.sales_transactions.insert_one(line("J02GIV000002", "2026-01-20", 500))
+    db.sales_transactions.insert_one(line("J02GIV000003", "2026-01-20", 800, code="CM00009999", mobile="9876543210"))
+    assert customer_state.build_customer_state(db, "2026-01-20", "2026-01-20") == 2
+    state = db.customer_state.find_one({"_id": "CM00002925"})
+    assert state["visit_count"] == 3 and state["ltv"] == 6500
+    assert state["home_store"] == "Jacadi MOA"
+
+
+def test_reprocessing_a_day_does_not_double_count(db):
+    db.sales_transactions.insert_one(line("J02GIV000001", "2026-01-10", 1000))
+    customer_state.build_customer_state(db, "2026-01-10", "2026-01-10")
+    customer_state.build_customer_state(db, "2026-01-10", "2026-01-10")
+    state = db.customer_state.find_one({"_id": "CM00002925"})
+    assert state["visit_count"] == 1 and state["ltv"] == 1000
+
+    # The invoice is re-ingested onto another customer: the old one disappears
+    db.sales_transactions.update_many({}, {"$set": {"consumer_code": "CM00000001"}})
+    customer_state.build_customer_state(db, "2026-01-10", "2026-01-10")
+    assert db.customer_state.find_one({"_id": "CM00002925"}) is None
+
+
+def test_period_counts(db):
+    db.sales_transactions.insert_many([
+        line("J02GIV000001", "2025-05-01", 900, code="CM1", mobile="9000000001"),
+        line("J02GIV000002", "2026-01-03", 1000, code="CM1", mobile="9000000001"),
+        line("J02GIV000003", "2026-01-04", 1000, code="CM2", mobile="9000000002"),
+        line("J02GIV000004", "2025-03-01", 700, code="CM3", mobile="9000000003"),
+    ])
+    customer_state.build_customer_state(db, "2025-03-01", "2026-01-31")
+
+    [row] = customer_state.period_counts(db, "2026-01-01", "2026-01-31")
+    assert row == {"Location": "Jacadi MOA", "active": 2, "new": 1, "repeat": 1, "lapsed": 1}
+
+
+def test_lapsed_counts_for_a_past_period_do_not_change_when_a_customer_returns(db):
+    db.sales_transactions.insert_many([
+        line("J02GIV000001", "2025-05-01", 900, code="CM1", mobile="9000000001"),
+        line("J02GIV000002", "2026-01-04", 1000, code="CM2", mobile="9000000002"),
+    ])
+    customer_state.build_customer_state(db, "2025-05-01", "2026-01-31")
+    before = customer_state.period_counts(db, "2026-01-01", "2026-01-31")
+    assert before[0]["lapsed"] == 1
+
+    # CM1 comes back in March, mostly at another store: January still counts them as lapsed at MOA
+    db.sales_transactions.insert_many([
+        line("J01FIV000001", "2026-03-02", 500, code="CM1", mobile="9000000001", location="Jacadi Palladium"),
+        line("J01FIV000002", "2026-03-03", 500, code="CM1", mobile="9000000001", location="Jacadi Palladium"),
+    ])
+    customer_state.build_customer_state(db, "2026-03-01", "2026-03-31")
+    assert customer_state.period_counts(db, "2026-01-01", "2026-01-31") == before
+    assert all(row["lapsed"] == 0 for row in customer_state.period_counts(db, "2026-03-01", "2026-03-31"))
+
+
+def test_backfilled_visit_updates_past_lapsed_counts(db):
+    db.sales_transactions.insert_many([
+        line("J02GIV000001", "2025-01-10", 900, code="CM1", mobile="9000000001"),
+        line("J02GIV000002", "2026-01-04", 1000, code="CM2", mobile="9000000002"),
+    ])
+    customer_state.build_customer_state(db, "2025-01-01", "2026-01-31")
+    db.sales_transactions.insert_one(line("J02GIV000003", "2026-02-10", 500, code="CM2", mobile="9000000002"))
+    customer_state.build_customer_state(db, "2026-02-01", "2026-02-28")
+    assert customer_state.period_counts(db, "2025-10-01", "2025-10-31")[0]["lapsed"] == 1
+    assert db.customer_lapsed.count_documents({"date": "2025-10-31"}) == 1
+
+    # A September purchase turns up late: CM1 was not lapsed at the end of October after all
+    db.sales_transactions.insert_one(line("J02GIV000004", "2025-09-01", 300, code="CM1", mobile="9000000001"))
+    customer_state.build_customer_state(db, "2025-09-01", "2025-09-30")
+    assert customer_state.period_counts(db, "2025-10-01", "2025-10-31") == []
+    assert customer_state.lapsed_counts(db, "2026-03-31") == {"Jacadi MOA": 1}
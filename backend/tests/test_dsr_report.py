@@ -0,0 +1,182 @@
+"""
+DSR Excel report tests: one workbook per store plus the consolidated file, totals and flat memory
+"""
+import gzip
+import json
+import os
+import tracemalloc
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("xlsxwriter")
+openpyxl = pytest.importorskip("openpyxl")
+pytest.importorskip("pyroaring")
+mongomock = pytest.importorskip("mongomock")
+
+import dsr_report  # noqa: E402
+
+DATE = "2026-01-31"
+INGESTED_AT = datetime(2026, 2, 1, 6, 0, 5, 123456)
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient().db
+    db.ingestion_logs.insert_one({"status": "success", "created_at": INGESTED_AT})
+
+    def line(invoice_no, location, value, qty):
+        return {"invoice_no": invoice_no, "invoice_date": "2026-01-15", "location_name": location,
+                "transaction_type": "IV", "mh1_description": "Sales", "nett_invoice_value": value,
+                "total_sales_qty": qty}
+
+    db.sales_transactions.insert_many([
+        line("S01/001", "Jacadi Store 01", 1000, 2), line("S01/001", "Jacadi Store 01", 500, 1),
+        line("S01/002", "Jacadi Store 01", 300, 1), line("S02/001", "Jacadi Store 02", 900, 3),
+    ])
+    return db
+
+
+def store_rows(location, i):
+    sale, trx = 10000 * (i + 1), 10 * (i + 1)
+    return {
+        "retail-performance": [{
+            "Location": location, "MTD_RETAIL_SALE": sale, "MTD_WHATSAPP_SALE": sale / 4, "MTD_RETAIL_TRX": trx,
+            "MTD_WHATSAPP_TRX": 2, "PM_RETAIL_SALE": sale / 2, "PM_WHATSAPP_SALE": 0, "PM_RETAIL_TRX": trx // 2,
+            "PM_WHATSAPP_TRX": 0, "MTD_QTY": trx * 2, "PM_QTY": trx, "YTD_SALE": sale * 3, "YTD_TRX": trx * 3,
+        }],
+        "retail-efficiency": [{
+            "Location": location, "MTD_FOOTFALL": trx * 4, "PM_FOOTFALL": trx * 2, "MTD_CONVERSION_PCT": 25,
+            "PM_CONVERSION_PCT": 25, "MTD_ATV": sale / trx, "PM_ATV": sale / trx, "MTD_BASKET_SIZE": 2,
+            "PM_BASKET_SIZE": 2, "MTD_MULTIES_PCT": 50, "PM_MULTIES_PCT": 50,
+            "MTD_RAW_SALE": sale, "MTD_RAW_TRX": trx, "MTD_RAW_QTY": trx * 2, "MTD_RAW_MULTI_TRX": trx / 2,
+            "PM_RAW_SALE": sale / 2, "PM_RAW_TRX": trx // 2, "PM_RAW_QTY": trx, "PM_RAW_MULTI_TRX": trx / 4,
+        }],
+        "whatsapp-sales-breakdown": [{
+            "Location": location, "MTD_RETAIL_SALES": sale, "MTD_WHATSAPP_SALES": sale / 4,
+            "PM_RETAIL_SALES": sale / 2, "PM_WHATSAPP_SALES": 0,
+        }],
+        "omni-channel-tm-lm": [{"Location": location, "MTD_SALE": sale, "MTD_TRX": trx, "MTD_UNITS": trx * 2,
+                                "PM_SALE": sale / 2, "PM_TRX": trx // 2, "PM_UNITS": trx}],
+        "omni-channel-details": [{"Location": location, "MTD_SALE": sale, "MTD_TRX": trx, "MTD_UNITS": trx * 2,
+                                  "PM_SALE": sale / 2, "PM_TRX": trx // 2, "PM_UNITS": trx}],
+        "retail-omni-total": [{"Location": location, "MTD_SALE": sale, "MTD_TRX": trx, "PM_SALE": sale / 2,
+                               "PM_TRX": trx // 2, "YTD_SALE": sale * 3, "YTD_TRX": trx * 3}],
+        "summary": {"total_transactions": trx, "total_revenue": sale, "pm_transactions": trx // 2,
+                    "pm_revenue": sale / 2, "total_locations": 1, "avg_transaction_value": sale / trx, "pm_atv": 0},
+    }
+
+
+def write_snapshots(directory, stores):
+    """A snapshot version laid out like snapshot.service.ts renders it"""
+    version = "v1"
+    os.makedirs(os.path.join(directory, version))
+    files, combined = {}, {}
+
+    def put(tab, scope, data):
+        name = f"{tab}__{'all' if scope == dsr_report.ALL_SCOPE else dsr_report.file_label(scope)}.json.gz"
+        with gzip.open(os.path.join(directory, version, name), "wt") as f:
+            json.dump(data, f)
+        files[f"{tab}|{scope}"] = {"file": name, "etag": name}
+
+    for i in range(stores):
+        location = f"Jacadi Store {i:02d}"
+        for tab, data in store_rows(location, i).items():
+            put(tab, location, data)
+            if tab != "summary":
+                combined.setdefault(tab, []).extend(data)
+    # An inactive store is dropped from Retail Sales, as on the dashboard
+    combined["retail-performance"].append({"Location": "Closed Store", "YTD_TRX": 0})
+    for tab, rows in combined.items():
+        put(tab, dsr_report.ALL_SCOPE, rows)
+    put("summary", dsr_report.ALL_SCOPE, {"total_revenue": 1, "total_locations": stores})
+
+    with open(os.path.join(directory, "current.json"), "w") as f:
+        json.dump({"version": version, "date": DATE, "start_date": "2026-01-01",
+                   "ingest_stamp": "2026-02-01T06:00:05.123Z", "files": files}, f)
+
+
+def values(path, sheet):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [list(row) for row in workbook[sheet].iter_rows(min_row=4, values_only=True)]
+    finally:
+        workbook.close()
+
+
+def test_workbook_per_store_and_consolidated(tmp_path, db):
+    snapshots, out = str(tmp_path / "snapshots"), str(tmp_path / "reports")
+    write_snapshots(snapshots, stores=50)
+
+    result = dsr_report.generate_reports(snapshots, out, db=db, workers=2)
+    assert result["date"] == DATE and len(result["files"]) == 51
+    assert sorted(os.listdir(os.path.join(out, DATE))) == sorted(result["files"])
+
+    consolidated = os.path.join(out, DATE, f"DSR_{DATE}_All_Stores.xlsx")
+    workbook = openpyxl.load_workbook(consolidated, read_only=True)
+    assert workbook.sheetnames == ["Summary"] + [sheet[0] for sheet in dsr_report.SHEETS]
+    workbook.close()
+
+    retail = values(consolidated, "Retail Sales")
+    assert retail[0][:4] == ["Location", "MTD Sale", "MTD Qty", "MTD TRX"]
+    assert len(retail) == 1 + 50 + 1 and retail[-1][0] == "TOTAL"
+    assert retail[-1][1] == sum(12500 * (i + 1) for i in range(50))
+
+    # Ratios on the TOTAL row come from the raw sums, not from adding store percentages
+    conversions = values(consolidated, "Conversions")
+    header, total = conversions[0], conversions[-1]
+    assert total[header.index("MTD Conversion %")] == 25 and total[header.index("MTD Basket Size")] == 2
+    assert total[header.index("MTD Multies %")] == 50
+
+    # Store rows from store_metrics; TRX on the TOTAL row is the union of bills
+    kpis = values(consolidated, "Store KPIs")
+    assert kpis == [["Location", "Net Sales", "Units", "Bills", "ATV", "UPT"],
+                    ["Jacadi Store 01", 1800, 4, 2, 900, 2], ["Jacadi Store 02", 900, 3, 1, 900, 3],
+                    ["TOTAL", 2700, 7, 3, 900, 2.33]]
+    assert values(os.path.join(out, DATE, f"DSR_{DATE}_Jacadi_Store_01.xlsx"), "Store KPIs")[1:] == [kpis[1]]
+
+    store = values(os.path.join(out, DATE, f"DSR_{DATE}_Jacadi_Store_03.xlsx"), "Omni TM-LM")
+    assert store == [["Location", "MTD Sale", "PM Sale", "Sale Growth %", "MTD TRX", "PM TRX", "TRX Growth %"],
+                     ["Jacadi Store 03", 40000, 20000, 100, 40, 20, 100]]
+
+
+def test_store_subset_keeps_other_workbooks(tmp_path, db):
+    snapshots, out = str(tmp_path / "snapshots"), str(tmp_path / "reports")
+    write_snapshots(snapshots, stores=3)
+    dsr_report.generate_reports(snapshots, out, db=db)
+
+    result = dsr_report.generate_reports(snapshots, out, stores=["Jacadi Store 01"], db=db)
+    assert result["files"] == [f"DSR_{DATE}_Jacadi_Store_01.xlsx"]
+    assert len(os.listdir(os.path.join(out, DATE))) == 4
+
+    with pytest.raises(ValueError, match="No snapshot"):
+        dsr_report.generate_reports(snapshots, out, stores=["Nowhere"], db=db)
+
+
+def test_snapshot_older_than_the_latest_ingestion_is_refused(tmp_path, db):
+    snapshots, out = str(tmp_path / "snapshots"), str(tmp_path / "reports")
+    write_snapshots(snapshots, stores=2)
+    # An ingestion after the render, whose snapshot render then failed
+    db.ingestion_logs.insert_one({"status": "success", "created_at": datetime(2026, 2, 2, 6, 0)})
+
+    with pytest.raises(dsr_report.StaleSnapshot, match="2026-02-02T06:00:00.000Z"):
+        dsr_report.generate_reports(snapshots, out, db=db)
+    assert not os.path.exists(out)
+    assert len(dsr_report.generate_reports(snapshots, out, db=db, allow_stale=True)["files"]) == 3
+
+
+def test_memory_does_not_grow_with_store_count(tmp_path, db):
+    # Per-store workbooks only; the consolidated one holds a row per store by design
+    peaks = {}
+    for stores in (5, 50):
+        snapshots = str(tmp_path / f"snapshots_{stores}")
+        write_snapshots(snapshots, stores)
+        names = [f"Jacadi Store {i:02d}" for i in range(stores)]
+        tracemalloc.start()
+        try:
+            dsr_report.generate_reports(snapshots, str(tmp_path / f"reports_{stores}"), stores=names,
+                                       db=db)
+            peaks[stores] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert peaks[50] < peaks[5] * 1.5
@@ -0,0 +1,66 @@
+"""
+Fiscal calendar / date dimension tests
+"""
+from datetime import date
+
+import fiscal_calendar
+from fiscal_calendar import FiscalCalendar, build_date_dim, shift_months
+
+
+class TestDateDimension:
+    """Dense date-dimension generation"""
+
+    def test_covers_full_financial_years(self):
+        rows = build_date_dim(2024, 2)
+        assert rows[0]["date"] == "2024-04-01"
+        assert rows[-1]["date"] == "2026-03-31"
+        assert len(rows) == 365 + 365
+
+    def test_fy_fields(self):
+        cal = FiscalCalendar(build_date_dim(2025, 1))
+        row = cal.lookup("2026-01-15")
+        assert row["fy"] == 2025
+        assert row["fy_label"] == "FY2025-26"
+        assert row["fy_start"] == "2025-04-01"
+        assert cal.lookup("2025-04-07")["fy_week"] == 1
+        assert cal.lookup("2025-04-08")["fy_week"] == 2
+
+    def test_lookup_outside_range_is_computed(self):
+        cal = FiscalCalendar([])
+        assert cal.lookup("2031-05-02")["fy"] == 2031
+
+
+class TestPeriodClamping:
+    """Prior-month and prior-year edge cases"""
+
+    def test_month_end_clamps(self):
+        assert shift_months(date(2026, 3, 31), -1) == date(2026, 2, 28)
+        assert shift_months(date(2024, 3, 31), -1) == date(2024, 2, 29)
+        assert shift_months(date(2026, 1, 31), -1) == date(2025, 12, 31)
+
+    def test_leap_day_prior_year(self):
+        assert fiscal_calendar.build_row(date(2024, 2, 29))["py_date"] == "2023-02-28"
+
+
+class TestPeriodWindows:
+    """Windows must match the keys used by getReportingDates"""
+
+    def test_default_mtd_windows(self):
+        cal = FiscalCalendar(build_date_dim(2025, 1))
+        windows = cal.period_windows("2026-03-31")
+        assert windows == {
+            "selectedDate": "2026-03-31",
+            "startOfMonth": "2026-03-01",
+            "startOfPM": "2026-02-01",
+            "endOfPM": "2026-02-28",
+            "startOfPY": "2025-03-01",
+            "endOfPY": "2025-03-31",
+            "startOfFY": "2025-04-01",
+        }
+
+    def test_explicit_start_date(self):
+        cal = FiscalCalendar(build_date_dim(2025, 1))
+        windows = cal.period_windows("2026-01-20", "2026-01-10")
+        assert windows["startOfMonth"] == "2026-01-10"
+        assert windows["startOfPM"] == "2025-12-10"
+        assert windows["endOfPM"] == "2025-12-20"
@@ -0,0 +1,118 @@
+"""
+Watch-folder ingestion tests: header sniffing, debouncing and the Python CSV parsers
+"""
+import os
+
+import pytest
+
+import loaders
+from ingest_watcher import FileSettler, IngestWatcher, classify_header, file_sha256, is_candidate
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_archive")
+INVOICE_CSV = os.path.join(ARCHIVE_DIR, "JPHO@JPinvoicedetailreport03022026040912.csv")
+FOOTFALL_CSV = os.path.join(ARCHIVE_DIR, "footfall_hourly_31012026_20260201_062939.csv")
+EFFICIENCY_CSV = os.path.join(ARCHIVE_DIR, "historical_location_efficiency.csv")
+
+
+class TestClassification:
+    """Reports are recognised by their header, not their filename"""
+
+    def test_invoice_report(self):
+        assert classify_header(loaders.read_header(INVOICE_CSV)) == "invoice"
+
+    def test_footfall_report(self):
+        assert classify_header(loaders.read_header(FOOTFALL_CSV)) == "footfall"
+
+    def test_efficiency_report(self):
+        headers = ["Location", "MTD Footfall", "MTD Conversion %", "MTD Multies"]
+        assert classify_header(headers) == "efficiency"
+
+    def test_unknown_layout(self):
+        assert classify_header(loaders.read_header(EFFICIENCY_CSV)) is None
+
+    def test_partial_downloads_ignored(self):
+        assert is_candidate("report.csv")
+        assert not is_candidate("report.csv.part")
+        assert not is_candidate(".report.csv")
+
+
+class TestFileSettler:
+    """A file is only dispatched once it stops changing"""
+
+    def test_waits_for_stable_file(self, tmp_path):
+        path = tmp_path / "a.csv"
+        path.write_text("Invoice No\n")
+        settler = FileSettler(settle_seconds=2)
+        settler.touch(str(path), now=0)
+        assert settler.ready(now=1) == []
+
+        path.write_text("Invoice No\nJ1\n")
+        settler.touch(str(path), now=1.5)
+        assert settler.ready(now=3) == []
+        assert settler.ready(now=3.6) == [str(path)]
+
+    def test_empty_file_not_ready(self, tmp_path):
+        path = tmp_path / "b.csv"
+        path.write_text("")
+        settler = FileSettler(settle_seconds=0)
+        settler.touch(str(path), now=0)
+        assert settler.ready(now=10) == []
+
+    def test_content_hash_ignores_name(self, tmp_path):
+        a, b = tmp_path / "a.csv", tmp_path / "b.csv"
+        a.write_text("same")
+        b.write_text("same")
+        assert file_sha256(str(a)) == file_sha256(str(b))
+
+
+class TestParsers:
+    """Python parsers must normalize like etl.service.ts"""
+
+    def test_invoice_rows(self):
+        docs = loaders.parse_invoice_csv(INVOICE_CSV)
+        assert docs
+        online = [d for d in docs if d["order_channel_name"] == "E-Commerce"]
+        assert online and all(d["location_name"] == "Shopify Webstore" for d in online)
+        assert all(len(d["invoice_date"]) == 10 for d in docs)
+
+    def test_footfall_daily_totals(self):
+        docs = loaders.parse_footfall_csv(FOOTFALL_CSV)
+        assert {d["location_name"] for d in docs} == {"Jacadi MOA", "Jacadi Palladium"}
+        assert all(d["date"] == "2026-01-31" and d["footfall_count"] > 0 for d in docs)
+
+    def test_location_mapping(self):
+        assert loaders.resolve_invoice_location({"Order Associate Name": "Mall of Asia-BLR"}) == ("Jacadi MOA", "Brick and Mortar")
+        assert loaders.resolve_invoice_location({"Invoice Associate Code ": "JPMUMPHO01"})[0] == "Jacadi Palladium"
+        assert loaders.resolve_invoice_location({"Order Associate Name": "Elsewhere"}) == (None, None)
+
+
+class TestQuarantine:
+    """Files the watcher cannot ingest are moved aside once, not retried on every scan"""
+
+    @pytest.fixture
+    def watcher(self, tmp_path, monkeypatch):
+        mongomock = pytest.importorskip("mongomock")
+        dirs = {name: str(tmp_path / name) for name in ("input", "archive", "failed")}
+        watcher = IngestWatcher(dirs["input"], dirs["archive"], workers=1, settle_seconds=0, force_poll=True,
+                                db=mongomock.MongoClient().db, failed_dir=dirs["failed"])
+        monkeypatch.setattr(watcher, "refresh_rollups", lambda db: None)
+        yield watcher, dirs
+        watcher.shutdown()
+
+    def test_unrecognised_and_failed_files_are_moved_aside(self, watcher, monkeypatch):
+        watcher, dirs = watcher
+        with open(os.path.join(dirs["input"], "notes.csv"), "w") as f:
+            f.write("a,b\n1,2\n")
+        with open(os.path.join(dirs["input"], "broken.csv"), "w") as f:
+            f.write("Store Name,Total IN\nx,1\n")
+
+        def fail(path, db):
+            raise ValueError("bad row")
+
+        monkeypatch.setitem(loaders.LOADERS, "footfall", fail)
+        watcher.run_once()
+        watcher.run_once()
+
+        assert os.listdir(dirs["input"]) == []
+        assert sorted(os.listdir(dirs["failed"])) == ["broken.csv", "notes.csv"]
+        assert watcher.db.ingestion_logs.count_documents({"status": "failed"}) == 1
@@ -0,0 +1,72 @@
+"""
+Invoice id encoding and HyperLogLog tests
+"""
+import pytest
+
+from invoice_sketch import HyperLogLog, decode_invoice_key, encode_invoice_no, invoice_prefix, split_invoice_no
+
+
+class TestInvoiceEncoding:
+    """Packing invoice numbers into 32-bit bitmap keys"""
+
+    def test_split(self):
+        assert split_invoice_no("J02GIV001568") == ("J02GIV", 1568, 6)
+        assert split_invoice_no("TEST001") == ("TEST", 1, 3)
+        assert split_invoice_no("ABC") == ("ABC", 0, 0)
+
+    def test_round_trip(self):
+        prefix_ids = {"J02GIV#w6": 3, "J01FIV#w6": 7}
+        key = encode_invoice_no("J02GIV001568", prefix_ids)
+        assert key < 2 ** 32
+        assert decode_invoice_key(key, {3: "J02GIV#w6", 7: "J01FIV#w6"}) == "J02GIV001568"
+
+    def test_distinct_prefixes_do_not_collide(self):
+        prefix_ids = {"J02GIV#w6": 1, "J01FIV#w6": 2}
+        assert encode_invoice_no("J02GIV000001", prefix_ids) != encode_invoice_no("J01FIV000001", prefix_ids)
+
+    def test_digit_width_is_part_of_the_key(self):
+        numbers = ["INV1", "INV01", "INV001", "ABC", "ABC0", "ABC00"]
+        prefixes = {invoice_prefix(n) for n in numbers}
+        assert prefixes == {"INV#w1", "INV#w2", "INV#w3", "ABC#w0", "ABC#w1", "ABC#w2"}
+        prefix_ids = {p: i for i, p in enumerate(sorted(prefixes), start=1)}
+        keys = [encode_invoice_no(n, prefix_ids) for n in numbers]
+        assert len(set(keys)) == len(numbers)
+        by_id = {i: p for p, i in prefix_ids.items()}
+        assert [decode_invoice_key(k, by_id) for k in keys] == numbers
+
+    def test_unregistered_prefix(self):
+        with pytest.raises(KeyError):
+            encode_invoice_no("X99IV000001", {})
+
+    def test_sequences_past_20_bits_roll_over_into_pages(self):
+        big = "J02GIV%d" % (3 * 2 ** 20 + 17)
+        assert invoice_prefix("J02GIV001568") == "J02GIV#w6" and invoice_prefix(big) == "J02GIV#w7#p3"
+        prefix_ids = {"J02GIV#w6": 1, "J02GIV#w7#p3": 2, "J02GIV#w7": 3}
+        key = encode_invoice_no(big, prefix_ids)
+        assert key < 2 ** 32 and key != encode_invoice_no("J02GIV0000017", prefix_ids)
+        assert decode_invoice_key(key, {1: "J02GIV#w6", 2: "J02GIV#w7#p3"}) == big
+
+
+class TestHyperLogLog:
+    """Approximate distinct counting for ad-hoc ranges"""
+
+    def test_estimate_within_error(self):
+        hll = HyperLogLog()
+        for i in range(20000):
+            hll.add(f"J02GIV{i:06d}")
+        assert abs(hll.count() - 20000) / 20000 < 0.05
+
+    def test_small_counts_are_near_exact(self):
+        hll = HyperLogLog()
+        for i in range(50):
+            hll.add(f"INV{i}")
+            hll.add(f"INV{i}")
+        assert abs(hll.count() - 50) <= 1
+
+    def test_merge_and_serialize(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            a.add(f"A{i}")
+            b.add(f"A{i + 1500}")
+        merged = HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+        assert abs(merged.count() - 4500) / 4500 < 0.05
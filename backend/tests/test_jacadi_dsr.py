@@ -313,5 +313,106 @@ class TestDataIntegrity:
             assert data["avg_transaction_value"] > 0
 
 
+
+class TestSnapshots:
+    """Default views are served from pre-rendered snapshots with ETags"""
+
+    def test_snapshot_etag_revalidation(self, auth_token):
+        """Test If-None-Match on a snapshot returns 304 and matches live data"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        latest = requests.get(f"{BASE_URL}/api/dashboards/latest-date", headers=headers).json()["date"]
+        params = {"startDate": latest[:8] + "01", "endDate": latest}
+
+        response = requests.get(f"{BASE_URL}/api/dashboards/default/summary", params=params, headers=headers)
+        assert response.status_code == 200
+        if "X-DSR-Snapshot" not in response.headers:
+            pytest.skip("No current snapshot - run POST /api/ingest/snapshots first")
+
+        etag = response.headers["ETag"]
+        cached = requests.get(
+            f"{BASE_URL}/api/dashboards/default/summary",
+            params=params,
+            headers={**headers, "If-None-Match": etag}
+        )
+        assert cached.status_code == 304
+
+        # A brand filter always falls through to live aggregation
+        live = requests.get(
+            f"{BASE_URL}/api/dashboards/default/summary",
+            params={**params, "brand": "Jacadi"},
+            headers=headers
+        )
+        assert live.status_code == 200
+        assert "X-DSR-Snapshot" not in live.headers
+
+class TestAtomicPublish:
+    """Summaries read either the previous or the new batch while a large file is ingested"""
+
+    STRESS_DATE = "2001-01-01"
+    HEADER = ["Invoice No", "Invoice Date", "Invoice Time", "Sales Transaction Type (IV/SR/IR)",
+              "Order Associate Name", "Nett Invoice Value", "Total Sales Qty", "MH1 Description"]
+
+    def write_report(self, path, invoices, lines_per_invoice, value):
+        import csv
+
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.HEADER)
+            for i in range(invoices):
+                for _ in range(lines_per_invoice):
+                    writer.writerow([f"STRESS{i:07d}", "01/01/2001", "11:30", "IV", "Jacadi Palladium", value, 1, "Sales"])
+
+    def test_summary_never_sees_a_partial_batch(self, auth_token, tmp_path):
+        """Hammer /api/analytics/summary during a 1M-row ingest; totals are always old or new"""
+        import threading
+
+        pytest.importorskip("pymongo")
+        import batch_publish
+        import loaders
+
+        rows = int(os.environ.get("PUBLISH_STRESS_ROWS", "1000000"))
+        invoices = max(rows // 10, 1)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        params = {"startDate": self.STRESS_DATE, "endDate": self.STRESS_DATE}
+        db = loaders.get_db()
+
+        def summary():
+            response = requests.get(f"{BASE_URL}/api/analytics/summary", params=params, headers=headers)
+            assert response.status_code == 200
+            return response.json()["total_sales"]
+
+        try:
+            # Old state: one line of 10 per invoice; the new file restates every invoice with ten lines of 2,
+            # so old (10 x invoices), new (20 x invoices) and any mix or double count all differ
+            old_path, new_path = str(tmp_path / "old.csv"), str(tmp_path / "new.csv")
+            self.write_report(old_path, invoices, 1, 10)
+            self.write_report(new_path, invoices, 10, 2)
+            loaders.load_invoices(old_path, db)
+            old, new = invoices * 10, invoices * 20
+            assert summary() == old
+
+            observed, done = [], threading.Event()
+
+            def hammer():
+                while not done.is_set():
+                    observed.append(summary())
+
+            readers = [threading.Thread(target=hammer) for _ in range(4)]
+            for reader in readers:
+                reader.start()
+            try:
+                loaders.load_invoices(new_path, db)
+            finally:
+                done.set()
+                for reader in readers:
+                    reader.join()
+
+            assert observed and all(total in (old, new) for total in observed), sorted(set(observed))
+            assert summary() == new
+        finally:
+            db.sales_transactions.delete_many({"invoice_date": self.STRESS_DATE})
+            batch_publish.purge_retired(db, grace_ms=0)
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,88 @@
+"""
+Leaderboard tests: bounded summaries, range splitting and exact top-N results
+"""
+import random
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("pyroaring")
+mongomock = pytest.importorskip("mongomock")
+
+import leaderboard  # noqa: E402
+
+
+def line(date, product, value, qty=1, location="Jacadi MOA", category="Dresses", trx="IV"):
+    return {
+        "invoice_date": date, "location_name": location, "transaction_type": trx, "mh1_description": "Sales",
+        "product_code": product, "product_name": f"Item {product}", "category_name": category,
+        "total_sales_qty": qty, "nett_invoice_value": value,
+    }
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def exact(lines, kind, metric, start, end, worst=False):
+    key_field = leaderboard.KINDS[kind][0]
+    totals = {}
+    for row in lines:
+        if start <= row["invoice_date"] <= end and row["transaction_type"] in ("IV", "IR"):
+            key = row[key_field]
+            totals[key] = totals.get(key, 0) + (row["nett_invoice_value"] if metric == "value" else row["total_sales_qty"])
+    order = sorted(totals.items(), key=lambda kv: (kv[1], kv[0]) if worst else (-kv[1], kv[0]))
+    return [k for k, _ in order]
+
+
+def test_summarize_keeps_top_items_and_floor():
+    totals = {"A": {"qty": 5, "value": 50}, "B": {"qty": 1, "value": 90}, "C": {"qty": 3, "value": 10}}
+    summary = leaderboard.summarize(totals, size=2)
+    assert summary["top"]["value"] == [["B", 90], ["A", 50]]
+    assert summary["top"]["qty"] == [["A", 5], ["C", 3]]
+    assert summary["floor"] == {"value": 50, "qty": 3}
+    assert leaderboard.summarize(totals, size=5)["floor"] == {"value": 0, "qty": 0}
+
+
+def test_split_range():
+    months, edges = leaderboard.split_range("2026-01-30", "2026-04-02")
+    assert months == ["2026-02", "2026-03"]
+    assert edges == ["2026-01-30", "2026-01-31", "2026-04-01", "2026-04-02"]
+    assert leaderboard.contiguous(edges) == [("2026-01-30", "2026-01-31"), ("2026-04-01", "2026-04-02")]
+
+
+def test_returns_are_not_counted(db):
+    db.sales_transactions.insert_many([
+        line("2026-01-05", "P1", 1000),
+        line("2026-01-05", "P2", 900),
+        line("2026-01-05", "P2", -900, trx="SR"),
+    ])
+    leaderboard.build_leaderboard(db, "2026-01-01", "2026-01-31")
+    rows = leaderboard.top_n(db, "2026-01-01", "2026-01-31", n=5)
+    assert [(r["key"], r["value"]) for r in rows] == [("P1", 1000), ("P2", 900)]
+
+
+@pytest.mark.parametrize("summary_size", [3, 200])
+def test_top_n_matches_exact_ranking(db, monkeypatch, summary_size):
+    monkeypatch.setattr(leaderboard, "SUMMARY_SIZE", summary_size)
+
+    rng = random.Random(7)
+    lines = [
+        line(f"2026-0{m}-{d:02d}", f"P{rng.randint(1, 30)}", rng.randint(100, 5000), qty=rng.randint(1, 4),
+             location=rng.choice(["Jacadi MOA", "Jacadi Palladium"]), category=rng.choice(["Dresses", "Shoes", "Tops"]))
+        for m in (1, 2, 3) for d in range(1, 29) for _ in range(4)
+    ]
+    db.sales_transactions.insert_many([dict(row) for row in lines])
+    leaderboard.refresh(db)
+    assert db.product_summary.count_documents({}) > 0
+
+    for start, end in [("2026-01-01", "2026-03-28"), ("2026-01-15", "2026-03-10"), ("2026-02-01", "2026-02-28")]:
+        for kind in ("sku", "category"):
+            for metric in ("value", "qty"):
+                n = 5 if kind == "sku" else 2
+                got = [r["key"] for r in leaderboard.top_n(db, start, end, kind, metric, n)]
+                assert got == exact(lines, kind, metric, start, end)[:n]
+
+    got = [r["key"] for r in leaderboard.top_n(db, "2026-01-10", "2026-02-28", worst=True, n=4)]
+    assert got == exact(lines, "sku", "value", "2026-01-10", "2026-02-28", worst=True)[:4]
@@ -0,0 +1,71 @@
+"""
+Load-test harness tests: percentiles, per-endpoint summaries and the baseline gate
+"""
+import random
+
+from load_test import Recorder, compare_to_baseline, filter_variants, percentile
+
+
+class TestPercentile:
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+
+    def test_small_samples(self):
+        assert percentile([], 95) == 0.0
+        assert percentile([7.0], 99) == 7.0
+        assert percentile([3, 1, 2], 50) == 2
+
+
+class TestRecorder:
+    def test_summary(self):
+        recorder = Recorder()
+        for ms in (10, 20, 30, 40):
+            recorder.record("default/summary", ms / 1000, ok=True)
+        recorder.record("default/summary", 1.0, ok=False)
+
+        s = recorder.summary(wall_seconds=2.0)["default/summary"]
+        assert s["requests"] == 5
+        assert s["error_rate"] == 0.2
+        assert s["p50_ms"] == 30.0
+        assert s["p99_ms"] == 1000.0
+        assert s["rps"] == 2.5
+
+
+class TestBaseline:
+    BASELINE = {"endpoints": {
+        "default/summary": {"p95_ms": 100.0, "error_rate": 0.0},
+        "default/retail-performance": {"p95_ms": 200.0, "error_rate": 0.0},
+    }}
+
+    def run(self, summary_p95, perf_p95=200.0, summary_errors=0.0):
+        return {"endpoints": {
+            "default/summary": {"p95_ms": summary_p95, "error_rate": summary_errors},
+            "default/retail-performance": {"p95_ms": perf_p95, "error_rate": 0.0},
+        }}
+
+    def test_within_tolerance(self):
+        assert compare_to_baseline(self.run(124.0), self.BASELINE, tolerance=0.25) == []
+
+    def test_latency_regression(self):
+        failures = compare_to_baseline(self.run(130.0), self.BASELINE, tolerance=0.25)
+        assert len(failures) == 1 and failures[0].startswith("default/summary: p95")
+
+    def test_error_regression(self):
+        failures = compare_to_baseline(self.run(90.0, summary_errors=0.05), self.BASELINE, tolerance=0.25)
+        assert any("error rate" in f for f in failures)
+
+    def test_missing_endpoint(self):
+        current = {"endpoints": {"default/summary": {"p95_ms": 90.0, "error_rate": 0.0}}}
+        assert compare_to_baseline(current, self.BASELINE, 0.25) == ["default/retail-performance: missing from this run"]
+
+
+def test_filter_variants_are_seeded():
+    meta = {"locations": ["Jacadi MOA", "Jacadi Palladium"], "brands": ["Jacadi"]}
+    first = [filter_variants(meta, random.Random(7)) for _ in range(3)]
+    again = [filter_variants(meta, random.Random(7)) for _ in range(3)]
+    assert first == again
+    assert all(set(p) <= {"location", "brand"} for p in first)
@@ -0,0 +1,43 @@
+"""
+mongo_store tests: duplicate keys in bulk_insert are only tolerated on a retry or when asked for
+"""
+import pytest
+
+pytest.importorskip("pymongo")
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo.errors import AutoReconnect, BulkWriteError  # noqa: E402
+
+import mongo_store  # noqa: E402
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.sales_facts
+    collection.insert_one({"_id": 1})
+    return collection
+
+
+def test_duplicates_are_raised_unless_the_caller_opts_in(collection, caplog):
+    with pytest.raises(BulkWriteError):
+        mongo_store.bulk_insert(collection, [{"_id": 1}, {"_id": 2}])
+
+    assert mongo_store.bulk_insert(collection, [{"_id": 1}, {"_id": 3}], skip_duplicates=True) == 1
+    assert "skipped 1 duplicate-key" in caplog.text
+
+
+def test_a_retried_batch_skips_the_rows_that_already_landed(collection, monkeypatch):
+    insert_many = collection.insert_many
+    calls = []
+
+    def flaky(docs, ordered=True):
+        calls.append(len(docs))
+        if len(calls) == 1:
+            insert_many(docs[:1], ordered=ordered)  # lands partially, then the connection drops
+            raise AutoReconnect("connection reset")
+        return insert_many(docs, ordered=ordered)
+
+    monkeypatch.setattr(collection, "insert_many", flaky)
+    monkeypatch.setattr(mongo_store.time, "sleep", lambda _: None)
+    assert mongo_store.bulk_insert(collection, [{"_id": 2}, {"_id": 3}]) == 2
+    assert sorted(d["_id"] for d in collection.find()) == [1, 2, 3]
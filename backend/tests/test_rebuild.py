@@ -0,0 +1,173 @@
+"""
+Archive rebuild tests: report ordering, manifest, last-file-wins replay and promotion
+"""
+import csv
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("zstandard")
+mongomock = pytest.importorskip("mongomock")
+
+import batch_publish  # noqa: E402
+import loaders  # noqa: E402
+import mongo_store  # noqa: E402
+import rebuild  # noqa: E402
+
+HEADER = ["Invoice No", "Invoice Date", "Invoice Time", "Sales Transaction Type (IV/SR/IR)",
+          "Order Associate Name", "Nett Invoice Value", "Total Sales Qty", "MH1 Description"]
+
+
+def write_report(directory, name, rows):
+    path = os.path.join(directory, name)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for invoice_no, date, value in rows:
+            writer.writerow([invoice_no, date, "11:30", "IV", "Jacadi Palladium", value, 1, "Sales"])
+    return path
+
+
+@pytest.fixture
+def mongomock_store(monkeypatch):
+    mongo_store.close_client()
+    monkeypatch.setattr(mongo_store, "MONGO_URL", "mongomock://localhost")
+    yield mongo_store.get_client()
+    mongo_store.close_client()
+
+
+def test_report_timestamp():
+    assert rebuild.report_timestamp("JPHO@JPinvoicedetailreport01022026045247.csv", 0) == "2026-02-01T04:52:47"
+    assert rebuild.report_timestamp("footfall_hourly_31012026_20260201_062843.csv", 0) == "2026-02-01T06:28:43"
+    assert rebuild.report_timestamp("footfall_backfill_11012026_30012026_20260201_063327.csv", 0) == \
+        "2026-02-01T06:33:27"
+    assert rebuild.report_timestamp("manual_2026-02-01T04-56-53-854Z_test.csv", 0) == "2026-02-01T04:56:53"
+    assert rebuild.report_timestamp("export.csv", 86400) == "1970-01-02T00:00:00"
+
+
+def test_rebuild_matches_sequential_ingest(tmp_path, mongomock_store):
+    archive, pack_dir = str(tmp_path / "archive"), str(tmp_path / "packed")
+    os.makedirs(archive)
+    reports = [
+        # Later files restate invoices; the copy of the first file must not win over the second
+        ("JPHO@JPinvoicedetailreport01022026040000.csv", [("A1", "31/01/2026", 100), ("A2", "31/01/2026", 200)]),
+        ("JPHO@JPinvoicedetailreport01022026050000.csv", [("A2", "31/01/2026", 250), ("A3", "01/02/2026", 300)]),
+        ("JPHO@JPinvoicedetailreport01022026060000.csv", [("A1", "31/01/2026", 100), ("A2", "31/01/2026", 200)]),
+        ("JPHO@JPinvoicedetailreport02022026060000.csv", [("A3", "01/02/2026", 330), ("A3", "01/02/2026", 20)]),
+    ]
+    for name, rows in reports:
+        write_report(archive, name, rows)
+
+    # Reference: one by one in report order, skipping content already ingested (as the watcher does)
+    sequential = mongomock.MongoClient().db
+    seen = set()
+    for name, _ in reports:
+        path = os.path.join(archive, name)
+        if loaders.file_sha256(path) not in seen:
+            seen.add(loaders.file_sha256(path))
+            loaders.load_invoices(path, sequential)
+
+    manifest = rebuild.pack(archive, pack_dir, workers=1)
+    assert [e["kind"] for e in manifest["files"]] == ["invoice"] * 4
+    assert manifest["files"][1]["first_date"] == "2026-01-31" and manifest["files"][1]["last_date"] == "2026-02-01"
+    assert all(os.path.exists(os.path.join(pack_dir, e["packed"])) for e in manifest["files"])
+
+    summary = rebuild.rebuild("jacadi_dsr_rebuild", pack_dir, workers=1, derived=False)
+    assert summary["files"] == 3
+
+    def lines(db):
+        return sorted((d["invoice_no"], d["nett_invoice_value"])
+                      for d in db.sales_transactions.find(batch_publish.visible(db),
+                                                          {"invoice_no": 1, "nett_invoice_value": 1}))
+
+    rebuilt = mongo_store.get_db("jacadi_dsr_rebuild")
+    assert lines(rebuilt) == lines(sequential) == [("A1", 100), ("A2", 250), ("A3", 20), ("A3", 330)]
+
+    # Packing again only picks up new files
+    write_report(archive, "JPHO@JPinvoicedetailreport03022026060000.csv", [("A4", "02/02/2026", 50)])
+    assert len(rebuild.pack(archive, pack_dir, workers=1)["files"]) == 5
+
+
+def test_corrupt_pack_is_rejected(tmp_path, mongomock_store):
+    archive, pack_dir = str(tmp_path / "archive"), str(tmp_path / "packed")
+    os.makedirs(archive)
+    write_report(archive, "JPHO@JPinvoicedetailreport01022026040000.csv", [("A1", "31/01/2026", 100)])
+    manifest = rebuild.pack(archive, pack_dir, workers=1)
+    manifest["files"][0]["sha256"] = "0" * 64
+    rebuild.write_manifest(pack_dir, manifest)
+
+    with pytest.raises(ValueError, match="manifest hash"):
+        rebuild.rebuild("jacadi_dsr_rebuild", pack_dir, workers=1, derived=False)
+    with pytest.raises(ValueError, match="live database"):
+        rebuild.rebuild(mongo_store.DB_NAME, pack_dir, workers=1)
+
+
+def test_promote_invalidates_live_rollups_and_stamps_ingestion():
+    db = mongomock.MongoClient().db
+    db.rollup_days.insert_one({"_id": "2026-01-31", "date": "2026-01-31", "kinds": ["daily"]})
+
+    rebuild.mark_promoted(db, "jacadi_dsr_rebuild", ["daily_rollup", "rollup_days", "sales_transactions"])
+    assert db.rollup_days.count_documents({}) == 1
+
+    # --skip-derived: only the base collections were replaced
+    rebuild.mark_promoted(db, "jacadi_dsr_rebuild", ["footfall", "sales_transactions"])
+    assert db.rollup_days.count_documents({}) == 0
+    stamps = list(db.ingestion_logs.find({"status": "success", "source": "rebuild"}))
+    assert len(stamps) == 2 and stamps[-1]["collections"] == ["footfall", "sales_transactions"]
+
+
+def test_promote_refuses_reports_ingested_after_packing(mongomock_store):
+    live = mongo_store.get_db()
+    manifest = {"packed_at": "2026-02-01T06:00:00+00:00", "files": [{"sha256": "packed"}]}
+    live.ingestion_logs.insert_many([
+        {"filename": "old.csv", "status": "success", "content_hash": "x", "created_at": datetime(2026, 2, 1, 5)},
+        {"filename": "packed.csv", "status": "success", "content_hash": "packed", "created_at": datetime(2026, 2, 1, 7)},
+        {"filename": "eff.csv", "status": "success", "file_type": "efficiency", "created_at": datetime(2026, 2, 1, 7)},
+        {"filename": "rebuild:x", "status": "success", "source": "rebuild", "created_at": datetime(2026, 2, 1, 7)},
+    ])
+    assert rebuild.unpacked_ingestions(live, manifest) == []
+
+    live.ingestion_logs.insert_one({"filename": "new.csv", "status": "success", "file_type": "invoice",
+                                    "content_hash": "y", "created_at": datetime(2026, 2, 1, 7)})
+    assert rebuild.unpacked_ingestions(live, manifest) == ["new.csv"]
+    with pytest.raises(ValueError, match="new.csv"):
+        rebuild.promote("jacadi_dsr_rebuild", manifest)
+    # The lease is released and nothing was published
+    publication = live.publications.find_one({"_id": batch_publish.PUBLICATION_ID})
+    assert publication["writer"] is None and publication["seq"] == 0
+
+
+def test_rebuild_keeps_live_registry_keys(mongomock_store):
+    live, rebuilt = mongo_store.get_db(), mongo_store.get_db("jacadi_dsr_rebuild")
+    live.counters.insert_many([{"_id": "invoice_prefix", "seq": 2}, {"_id": "dim_brand", "seq": 1}])
+    live.invoice_prefixes.insert_many([{"_id": "A", "key": 1}, {"_id": "B", "key": 2}])
+    live.dim_brand.insert_one({"_id": "Jacadi", "key": 1, "brand_name": "Jacadi"})
+
+    rebuild.seed_registries(live, rebuilt)
+    assert rebuilt.invoice_prefixes.find_one({"_id": "B"})["key"] == 2
+    rebuilt.counters.update_one({"_id": "invoice_prefix"}, {"$set": {"seq": 3}})
+    rebuilt.invoice_prefixes.insert_one({"_id": "C", "key": 3})
+
+    assert rebuild.merge_registries(live, rebuilt) == 1
+    assert live.invoice_prefixes.find_one({"_id": "C"})["key"] == 3
+    assert live.counters.find_one({"_id": "invoice_prefix"})["seq"] == 3
+    assert rebuild.merge_registries(live, rebuilt) == 0
+
+    # A key the live side handed to another value since the seed cannot be merged
+    live.invoice_prefixes.insert_one({"_id": "D", "key": 4})
+    rebuilt.invoice_prefixes.insert_one({"_id": "E", "key": 4})
+    with pytest.raises(ValueError, match="registered differently"):
+        rebuild.merge_registries(live, rebuilt)
+
+
+def test_rebuilt_markers_are_current_at_the_promoted_sequence():
+    db = mongomock.MongoClient().db
+    db.rollup_days.insert_one({"_id": "2026-01-31", "date": "2026-01-31", "kinds": ["daily_rollup", "sales_cube"],
+                               "built_seq": {"daily_rollup": 0, "sales_cube": 0}, "pending_seq": 9})
+    rebuild.stamp_rebuilt_markers(db, 8)
+    marker = db.rollup_days.find_one({"_id": "2026-01-31"})
+    assert batch_publish.marker_current(marker, "sales_cube", 8)
+    # A reader still on the previous sequence falls back to the sales it can see
+    assert not batch_publish.marker_current(marker, "daily_rollup", 7)
@@ -0,0 +1,79 @@
+"""
+Hourly sales cube tests
+"""
+import pytest
+
+from loaders import parse_invoice_hour
+
+
+@pytest.fixture(scope="module")
+def sales_cube():
+    pytest.importorskip("pymongo")
+    pytest.importorskip("pyroaring")
+    import sales_cube
+
+    return sales_cube
+
+
+def line(invoice_no, time, value, qty=1, date="2026-01-31", location="Jacadi MOA", trx="IV", mh1="Sales"):
+    return {
+        "invoice_no": invoice_no, "invoice_date": date, "invoice_time": time, "location_name": location,
+        "transaction_type": trx, "mh1_description": mh1, "nett_invoice_value": value, "total_sales_qty": qty,
+    }
+
+
+class TestInvoiceHour:
+    def test_parse(self):
+        assert parse_invoice_hour("21:07") == 21
+        assert parse_invoice_hour("09:15:44") == 9
+        assert parse_invoice_hour("00:00") == 0
+
+    def test_missing_or_malformed(self):
+        assert parse_invoice_hour("") is None
+        assert parse_invoice_hour(None) is None
+        assert parse_invoice_hour("25:00") is None
+        assert parse_invoice_hour("ab:cd") is None
+
+
+class TestCube:
+    def test_accumulate_hours(self, sales_cube):
+        cells = sales_cube.accumulate([
+            line("J02GIV000001", "11:05", 1000, qty=2),
+            line("J02GIV000001", "11:05", 500),
+            line("J02GIV000002", "11:40", 700),
+            line("J02GIV000003", "18:00", 300),
+        ])
+        cell = cells[("2026-01-31", "Jacadi MOA")]
+        assert cell["bills"][11] == 2
+        assert cell["sales"][11] == 2200
+        assert cell["qty"][11] == 4
+        assert cell["bills"][18] == 1
+        assert len(cell["sales"]) == 24 and sum(cell["bills"]) == 3
+
+    def test_non_sales_lines_only_count_towards_day_sales(self, sales_cube):
+        cells = sales_cube.accumulate([
+            line("J02GIV000001", "11:05", 1000),
+            line("J02GSR000001", "12:00", -400, trx="SR"),
+            line("J02GIV000002", "", 250),
+        ])
+        cell = cells[("2026-01-31", "Jacadi MOA")]
+        assert cell["day_sales"] == 850
+        assert sum(cell["sales"]) == 1000
+        assert sum(cell["bills"]) == 1
+
+    def test_stored_hour_wins_over_time_string(self, sales_cube):
+        row = line("J02GIV000001", "", 100)
+        row["invoice_hour"] = 15
+        cells = sales_cube.accumulate([row])
+        assert cells[("2026-01-31", "Jacadi MOA")]["bills"][15] == 1
+
+    def test_sum_hours_matches_live_shape(self, sales_cube):
+        cells = sales_cube.accumulate([
+            line("J02GIV000001", "11:05", 1000, date="2026-01-30"),
+            line("J02GIV000002", "11:30", 500, date="2026-01-31"),
+            line("J01FIV000001", "19:10", 800, location="Jacadi Palladium"),
+        ])
+        assert sales_cube.sum_hours(cells.values()) == [
+            {"hour": "11", "trx_count": 2, "total_sales": 1500},
+            {"hour": "19", "trx_count": 1, "total_sales": 800},
+        ]
@@ -0,0 +1,56 @@
+"""
+Star schema tests: dimension key registration and fact encoding
+"""
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("pyroaring")
+mongomock = pytest.importorskip("mongomock")
+
+import star_schema  # noqa: E402
+
+
+LINE = {
+    "invoice_no": "J02GIV001568", "invoice_date": "2026-01-31", "invoice_time": "18:42",
+    "transaction_type": "IV", "mh1_description": "Sales", "location_name": "Jacadi MOA",
+    "location_code": "JPBLRMOA", "city": "Bengaluru", "state": "Karnataka", "store_type": "",
+    "product_code": "P100", "product_name": "Cardigan", "category_name": "Knitwear",
+    "brand_name": "Jacadi", "sales_person_code": "SP1", "sales_person_name": "Asha",
+    "order_channel_name": "Brick and Mortar", "invoice_channel_code": "COCO",
+    "invoice_channel_name": "Company Owned", "sub_channel_code": "COCO",
+    "sub_channel_name": "Company Owned Company Operated",
+    "total_sales_qty": 2, "nett_invoice_value": 4200.0, "invoice_mrp_value": 5000.0,
+    "invoice_discount_value": 800.0, "invoice_basic_value": 3750.0, "total_tax_amt": 450.0,
+}
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def test_date_key_preserves_order():
+    assert star_schema.date_key("2026-01-31") == 20260131
+    assert star_schema.date_key("2025-12-31") < star_schema.date_key("2026-01-01")
+
+
+def test_dimension_keys_are_stable(db):
+    brands = star_schema.Dimension(db, "brand")
+    first = brands.key_for(LINE)
+    assert brands.key_for(dict(LINE)) == first
+    assert brands.key_for({**LINE, "brand_name": "Other"}) == first + 1
+
+    # A fresh process sees the same keys
+    assert star_schema.Dimension(db, "brand").key_for(LINE) == first
+    assert db.dim_brand.find_one({"_id": "Jacadi"})["key"] == first
+
+
+def test_fact_is_narrow(db):
+    dimensions = {name: star_schema.Dimension(db, name) for name in star_schema.DIMENSIONS}
+    fact = star_schema.to_fact(LINE, dimensions, {}, db)
+
+    assert fact["d"] == 20260131 and fact["h"] == 18 and fact["sb"] == 1
+    assert fact["nett"] == 4200.0 and fact["qty"] == 2
+    assert not any(isinstance(v, str) and len(v) > 2 for v in fact.values())
+    assert db.dim_channel.find_one({"key": fact["ch"]})["sub_channel_name"] == "Company Owned Company Operated"
+    assert db.invoice_prefixes.count_documents({}) == 1
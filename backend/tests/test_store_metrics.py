@@ -0,0 +1,67 @@
+"""
+Per-store fan-out tests: pool and single process agree, the reducer is order independent
+"""
+import random
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("pyroaring")
+mongomock = pytest.importorskip("mongomock")
+
+import bench_store_fanout  # noqa: E402
+import store_metrics  # noqa: E402
+
+
+def test_pool_windows_and_single_process_agree():
+    names, columns = bench_store_fanout.synthetic_columns(stores=6, lines_per_store=3000)
+    serial = store_metrics.compute(names, columns, workers=1)
+
+    assert store_metrics.compute(names, columns, workers=3) == serial
+    assert store_metrics.compute(names, columns, workers=3, window_days=7) == serial
+    assert [row["location_name"] for row in serial["stores"]] == names
+    assert serial["total"]["line_count"] == 6 * 3000
+
+
+def test_plan_tasks_cover_every_line_once():
+    _, columns = bench_store_fanout.synthetic_columns(stores=3, lines_per_store=100, days=10)
+    tasks = store_metrics.plan_tasks(columns["store"], columns["day"], window_days=4)
+    assert [(t[0], t[1]) for t in tasks] == [(s, w) for s in range(3) for w in range(3)]
+    assert [t[2] for t in tasks[1:]] == [t[3] for t in tasks[:-1]] and tasks[-1][3] == 300
+
+
+def test_reduce_is_independent_of_arrival_order():
+    names, columns = bench_store_fanout.synthetic_columns(stores=4, lines_per_store=500)
+    shared = store_metrics.SharedColumns.create(columns)
+    store_metrics._attach(shared.spec)
+    try:
+        partials = [store_metrics.slice_metrics(task)
+                    for task in store_metrics.plan_tasks(columns["store"], columns["day"], window_days=5)]
+    finally:
+        store_metrics._columns.close()
+        shared.close(unlink=True)
+
+    expected = store_metrics.reduce_partials(names, partials)
+    for seed in range(5):
+        random.Random(seed).shuffle(partials)
+        assert store_metrics.reduce_partials(names, partials) == expected
+
+
+def test_store_metrics_match_dashboard_definitions():
+    db = mongomock.MongoClient().db
+
+    def line(invoice_no, location, value, qty, transaction_type="IV"):
+        return {"invoice_no": invoice_no, "invoice_date": "2026-01-31", "location_name": location,
+                "transaction_type": transaction_type, "mh1_description": "Sales",
+                "nett_invoice_value": value, "total_sales_qty": qty}
+
+    db.sales_transactions.insert_many([
+        line("PAL/001", "Jacadi Palladium", 1000, 2), line("PAL/001", "Jacadi Palladium", 500, 1),
+        line("PAL/002", "Jacadi Palladium", 300, 1), line("PAL/R01", "Jacadi Palladium", -200, 1, "SR"),
+        line("MOA/001", "Jacadi MOA", 900, 3),
+    ])
+    result = store_metrics.store_metrics(db, "2026-01-01", "2026-01-31", workers=1)
+
+    palladium = next(r for r in result["stores"] if r["location_name"] == "Jacadi Palladium")
+    assert palladium == {**palladium, "nett_sales": 1600, "sales_qty": 4, "trx": 2, "atv": 800, "upt": 2}
+    assert result["total"] == {**result["total"], "nett_sales": 2500, "sales_qty": 7, "trx": 3, "line_count": 5}